@@ -0,0 +1,63 @@
+"""Add print job leases
+
+Revision ID: 3f6c2e8d1a47
+Revises: b9731a9266f1
+Create Date: 2026-10-18 14:26:51.118204
+
+"""
+
+
+# revision identifiers, used by Alembic.
+revision = '3f6c2e8d1a47'
+down_revision = 'b9731a9266f1'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+import residue
+
+
+try:
+    is_sqlite = op.get_context().dialect.name == 'sqlite'
+except Exception:
+    is_sqlite = False
+
+if is_sqlite:
+    op.get_context().connection.execute('PRAGMA foreign_keys=ON;')
+    utcnow_server_default = "(datetime('now', 'utc'))"
+else:
+    utcnow_server_default = "timezone('utc', current_timestamp)"
+
+def sqlite_column_reflect_listener(inspector, table, column_info):
+    """Adds parenthesis around SQLite datetime defaults for utcnow."""
+    if column_info['default'] == "datetime('now', 'utc')":
+        column_info['default'] = utcnow_server_default
+
+sqlite_reflect_kwargs = {
+    'listeners': [('column_reflect', sqlite_column_reflect_listener)]
+}
+
+# ===========================================================================
+# HOWTO: Handle alter statements in SQLite
+#
+# def upgrade():
+#     if is_sqlite:
+#         with op.batch_alter_table('table_name', reflect_kwargs=sqlite_reflect_kwargs) as batch_op:
+#             batch_op.alter_column('column_name', type_=sa.Unicode(), server_default='', nullable=False)
+#     else:
+#         op.alter_column('table_name', 'column_name', type_=sa.Unicode(), server_default='', nullable=False)
+#
+# ===========================================================================
+
+
+def upgrade():
+    op.add_column('print_job', sa.Column('claimed_by', sa.Unicode(), server_default='', nullable=False))
+    op.add_column('print_job', sa.Column('lease_expires', residue.UTCDateTime(), nullable=True))
+    op.create_index('ix_print_job_printer_id_printed', 'print_job', ['printer_id', 'printed'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_print_job_printer_id_printed', table_name='print_job')
+    op.drop_column('print_job', 'lease_expires')
+    op.drop_column('print_job', 'claimed_by')
@@ -0,0 +1,89 @@
+"""Add trigram search indexes for attendee search
+
+Revision ID: 4a2a4bd6a827
+Revises: 1ad8716bfc74
+Create Date: 2024-02-05 03:12:44.513076
+
+"""
+
+
+# revision identifiers, used by Alembic.
+revision = '4a2a4bd6a827'
+down_revision = '1ad8716bfc74'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+import residue
+
+
+try:
+    is_sqlite = op.get_context().dialect.name == 'sqlite'
+except Exception:
+    is_sqlite = False
+
+if is_sqlite:
+    op.get_context().connection.execute('PRAGMA foreign_keys=ON;')
+    utcnow_server_default = "(datetime('now', 'utc'))"
+else:
+    utcnow_server_default = "timezone('utc', current_timestamp)"
+
+def sqlite_column_reflect_listener(inspector, table, column_info):
+    """Adds parenthesis around SQLite datetime defaults for utcnow."""
+    if column_info['default'] == "datetime('now', 'utc')":
+        column_info['default'] = utcnow_server_default
+
+sqlite_reflect_kwargs = {
+    'listeners': [('column_reflect', sqlite_column_reflect_listener)]
+}
+
+# ===========================================================================
+# HOWTO: Handle alter statements in SQLite
+#
+# def upgrade():
+#     if is_sqlite:
+#         with op.batch_alter_table('table_name', reflect_kwargs=sqlite_reflect_kwargs) as batch_op:
+#             batch_op.alter_column('column_name', type_=sa.Unicode(), server_default='', nullable=False)
+#     else:
+#         op.alter_column('table_name', 'column_name', type_=sa.Unicode(), server_default='', nullable=False)
+#
+# ===========================================================================
+
+
+trigram_indexes = [
+    ('attendee', 'search_text'),
+    ('attendee', 'first_name'),
+    ('attendee', 'last_name'),
+    ('attendee', 'legal_name'),
+    ('group', 'name'),
+    ('promo_code_group', 'name'),
+    ('attendee_account', 'email'),
+]
+
+
+def upgrade():
+    op.add_column('attendee', sa.Column('search_text', sa.Unicode(), server_default='', nullable=False))
+
+    if not is_sqlite:
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+        # Backfill search_text from the same fields, in the same order, as Attendee._update_search_text,
+        # so that an attendee's search_text doesn't change the next time they're saved.
+        from uber.models import Attendee
+        existing_columns = {col['name'] for col in sa.inspect(op.get_bind()).get_columns('attendee')}
+        text_columns = [name for name in Attendee.searchable_fields if name in existing_columns]
+        op.execute("UPDATE attendee SET search_text = lower({})".format(
+            " || E'\\n' || ".join('coalesce("{}", \'\')'.format(name) for name in text_columns)))
+
+        for table, column in trigram_indexes:
+            op.create_index('ix_{}_{}_trgm'.format(table, column), table, [column],
+                            postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'})
+
+
+def downgrade():
+    if not is_sqlite:
+        for table, column in trigram_indexes:
+            op.drop_index('ix_{}_{}_trgm'.format(table, column), table_name=table)
+
+    op.drop_column('attendee', 'search_text')
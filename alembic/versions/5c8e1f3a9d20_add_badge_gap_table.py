@@ -0,0 +1,67 @@
+"""Add badge_gap table
+
+Revision ID: 5c8e1f3a9d20
+Revises: 7b1d4e9c2a58
+Create Date: 2026-10-18 23:41:12.204317
+
+"""
+
+
+# revision identifiers, used by Alembic.
+revision = '5c8e1f3a9d20'
+down_revision = '7b1d4e9c2a58'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+import residue
+
+
+try:
+    is_sqlite = op.get_context().dialect.name == 'sqlite'
+except Exception:
+    is_sqlite = False
+
+if is_sqlite:
+    op.get_context().connection.execute('PRAGMA foreign_keys=ON;')
+    utcnow_server_default = "(datetime('now', 'utc'))"
+else:
+    utcnow_server_default = "timezone('utc', current_timestamp)"
+
+def sqlite_column_reflect_listener(inspector, table, column_info):
+    """Adds parenthesis around SQLite datetime defaults for utcnow."""
+    if column_info['default'] == "datetime('now', 'utc')":
+        column_info['default'] = utcnow_server_default
+
+sqlite_reflect_kwargs = {
+    'listeners': [('column_reflect', sqlite_column_reflect_listener)]
+}
+
+# ===========================================================================
+# HOWTO: Handle alter statements in SQLite
+#
+# def upgrade():
+#     if is_sqlite:
+#         with op.batch_alter_table('table_name', reflect_kwargs=sqlite_reflect_kwargs) as batch_op:
+#             batch_op.alter_column('column_name', type_=sa.Unicode(), server_default='', nullable=False)
+#     else:
+#         op.alter_column('table_name', 'column_name', type_=sa.Unicode(), server_default='', nullable=False)
+#
+# ===========================================================================
+
+
+def upgrade():
+    # The rows are built from the attendee table the first time Session.auto_badge_num needs them
+    op.create_table('badge_gap',
+    sa.Column('id', residue.UUID(), nullable=False),
+    sa.Column('start_num', sa.Integer(), nullable=False),
+    sa.Column('end_num', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_badge_gap'))
+    )
+    op.create_index('ix_badge_gap_end_num', 'badge_gap', ['end_num'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_badge_gap_end_num', table_name='badge_gap')
+    op.drop_table('badge_gap')
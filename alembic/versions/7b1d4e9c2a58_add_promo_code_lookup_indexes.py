@@ -0,0 +1,65 @@
+"""Add promo code lookup indexes
+
+Revision ID: 7b1d4e9c2a58
+Revises: 3f6c2e8d1a47
+Create Date: 2026-10-18 16:02:37.540913
+
+"""
+
+
+# revision identifiers, used by Alembic.
+revision = '7b1d4e9c2a58'
+down_revision = '3f6c2e8d1a47'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.sql.expression import text
+
+
+try:
+    is_sqlite = op.get_context().dialect.name == 'sqlite'
+except Exception:
+    is_sqlite = False
+
+if is_sqlite:
+    op.get_context().connection.execute('PRAGMA foreign_keys=ON;')
+    utcnow_server_default = "(datetime('now', 'utc'))"
+else:
+    utcnow_server_default = "timezone('utc', current_timestamp)"
+
+def sqlite_column_reflect_listener(inspector, table, column_info):
+    """Adds parenthesis around SQLite datetime defaults for utcnow."""
+    if column_info['default'] == "datetime('now', 'utc')":
+        column_info['default'] = utcnow_server_default
+
+sqlite_reflect_kwargs = {
+    'listeners': [('column_reflect', sqlite_column_reflect_listener)]
+}
+
+# ===========================================================================
+# HOWTO: Handle alter statements in SQLite
+#
+# def upgrade():
+#     if is_sqlite:
+#         with op.batch_alter_table('table_name', reflect_kwargs=sqlite_reflect_kwargs) as batch_op:
+#             batch_op.alter_column('column_name', type_=sa.Unicode(), server_default='', nullable=False)
+#     else:
+#         op.alter_column('table_name', 'column_name', type_=sa.Unicode(), server_default='', nullable=False)
+#
+# ===========================================================================
+
+
+def upgrade():
+    op.create_index(
+        'ix_promo_code_group_normalized_code',
+        'promo_code_group',
+        [text("replace(replace(lower(code), '-', ''), ' ', '')")],
+        unique=False)
+    op.create_index('ix_promo_code_group_id', 'promo_code', ['group_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_promo_code_group_id', table_name='promo_code')
+    op.drop_index('ix_promo_code_group_normalized_code', table_name='promo_code_group')
@@ -0,0 +1,87 @@
+"""Add check_in table
+
+Revision ID: b9731a9266f1
+Revises: 780cee7feb67
+Create Date: 2026-10-18 11:02:17.503826
+
+"""
+
+
+# revision identifiers, used by Alembic.
+revision = 'b9731a9266f1'
+down_revision = '780cee7feb67'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+import residue
+from uber.config import c
+
+try:
+    is_sqlite = op.get_context().dialect.name == 'sqlite'
+except Exception:
+    is_sqlite = False
+
+if is_sqlite:
+    op.get_context().connection.execute('PRAGMA foreign_keys=ON;')
+    utcnow_server_default = "(datetime('now', 'utc'))"
+else:
+    utcnow_server_default = "timezone('utc', current_timestamp)"
+
+def sqlite_column_reflect_listener(inspector, table, column_info):
+    """Adds parenthesis around SQLite datetime defaults for utcnow."""
+    if column_info['default'] == "datetime('now', 'utc')":
+        column_info['default'] = utcnow_server_default
+
+sqlite_reflect_kwargs = {
+    'listeners': [('column_reflect', sqlite_column_reflect_listener)]
+}
+
+# ===========================================================================
+# HOWTO: Handle alter statements in SQLite
+#
+# def upgrade():
+#     if is_sqlite:
+#         with op.batch_alter_table('table_name', reflect_kwargs=sqlite_reflect_kwargs) as batch_op:
+#             batch_op.alter_column('column_name', type_=sa.Unicode(), server_default='', nullable=False)
+#     else:
+#         op.alter_column('table_name', 'column_name', type_=sa.Unicode(), server_default='', nullable=False)
+#
+# ===========================================================================
+
+
+def upgrade():
+    op.create_table('check_in',
+    sa.Column('id', residue.UUID(), nullable=False),
+    sa.Column('attendee_id', residue.UUID(), nullable=False),
+    sa.Column('checked_in', residue.UTCDateTime(), nullable=False),
+    sa.Column('who', sa.Unicode(), server_default='', nullable=False),
+    sa.Column('reg_station_id', sa.Integer(), nullable=True),
+    sa.Column('badge_type', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_check_in'))
+    )
+    op.create_index('ix_check_in_attendee_id', 'check_in', ['attendee_id'], unique=False)
+    op.create_index('ix_check_in_checked_in_who', 'check_in', ['checked_in', 'who'], unique=False)
+
+    if not is_sqlite:
+        # Backfill from attendees who are already checked in, taking the admin
+        # from the Tracking entry which recorded the check-in, if there is one.
+        op.execute(sa.text("""
+            INSERT INTO check_in (id, attendee_id, checked_in, who, badge_type)
+            SELECT md5(random()::text || attendee.id::text)::uuid, attendee.id, attendee.checked_in,
+                   coalesce((SELECT tracking.who FROM tracking
+                             WHERE tracking.fk_id = attendee.id
+                               AND tracking.model = 'Attendee'
+                               AND tracking.action = :updated
+                               AND tracking.data LIKE '%checked_in=''None -> datetime%'
+                             ORDER BY tracking."when" DESC LIMIT 1), ''),
+                   attendee.badge_type
+            FROM attendee WHERE attendee.checked_in IS NOT NULL
+        """).bindparams(updated=c.UPDATED))
+
+
+def downgrade():
+    op.drop_index('ix_check_in_checked_in_who', table_name='check_in')
+    op.drop_index('ix_check_in_attendee_id', table_name='check_in')
+    op.drop_table('check_in')
@@ -0,0 +1,95 @@
+"""
+Compares the old automated email candidate selection, which loaded every
+instance and every sent Email and checked them in Python, with
+AutomatedEmail.filter_unsent, which leaves already-sent recipients and
+anything the fixture's SQL filters rule out in the database.
+
+Uses 50,000 attendees and 100 automated emails, each of which has already
+been sent to 5,000 of those attendees.  Half of the fixtures also carry a SQL
+filter.  Only candidate selection is timed; the Python fixture filters and
+the actual sending are the same for both code paths.
+"""
+from uuid import uuid4
+
+from pockets import groupify
+
+from uber.automated_emails import AutomatedEmailFixture
+from uber.config import c
+from uber.models import Attendee, AutomatedEmail, Email
+
+from tests.benchmarks.utils import report, scratch_session
+
+ATTENDEE_COUNT = 50000
+FIXTURE_COUNT = 100
+SENT_PER_FIXTURE = 5000
+
+
+def legacy_candidates(session):
+    automated_emails = session.query(AutomatedEmail).filter(AutomatedEmail.ident.like('benchmark_%')).all()
+    candidates = 0
+    for automated_email in automated_emails:
+        emails_by_fk_id = groupify(automated_email.emails, 'fk_id')
+        candidates += len([a for a in session.query(Attendee) if a.id not in emails_by_fk_id])
+    session.expire_all()
+    return candidates
+
+
+def new_candidates(session):
+    automated_emails = session.query(AutomatedEmail).filter(AutomatedEmail.ident.like('benchmark_%')).all()
+    candidates = 0
+    for automated_email in automated_emails:
+        candidates += len(automated_email.filter_unsent(session.query(Attendee)).all())
+    session.expire_all()
+    return candidates
+
+
+def fill_tables(session):
+    attendee_ids = [str(uuid4()) for _ in range(ATTENDEE_COUNT)]
+    session.execute(Attendee.__table__.insert(), [{
+        'id': attendee_id,
+        'first_name': 'Bench',
+        'last_name': str(i),
+        'email': 'bench{}@example.com'.format(i),
+        'paid': c.HAS_PAID if i % 2 else c.NOT_PAID,
+    } for i, attendee_id in enumerate(attendee_ids)])
+
+    for i in range(FIXTURE_COUNT):
+        ident = 'benchmark_{}'.format(i)
+        AutomatedEmailFixture(
+            Attendee,
+            'Benchmark {}'.format(i),
+            'benchmark.txt',
+            lambda a: True,
+            ident,
+            query=(Attendee.paid == c.HAS_PAID) if i % 2 else ())
+
+        automated_email_id = str(uuid4())
+        session.execute(AutomatedEmail.__table__.insert(), [{
+            'id': automated_email_id,
+            'ident': ident,
+            'model': 'Attendee',
+            'subject': 'Benchmark {}'.format(i),
+            'body': '',
+        }])
+
+        offset = (i * SENT_PER_FIXTURE) % ATTENDEE_COUNT
+        session.execute(Email.__table__.insert(), [{
+            'id': str(uuid4()),
+            'automated_email_id': automated_email_id,
+            'fk_id': attendee_id,
+            'ident': ident,
+            'model': 'Attendee',
+            'to': 'bench@example.com',
+            'subject': 'Benchmark {}'.format(i),
+            'body': '',
+        } for attendee_id in attendee_ids[offset:offset + SENT_PER_FIXTURE]])
+
+
+if __name__ == '__main__':
+    with scratch_session() as session:
+        fill_tables(session)
+        print('{} attendees, {} automated emails, {} already sent each:'.format(
+            ATTENDEE_COUNT, FIXTURE_COUNT, SENT_PER_FIXTURE))
+        old = report('  legacy Python candidate check', lambda: legacy_candidates(session), repeat=1)
+        new = report('  AutomatedEmail.filter_unsent', lambda: new_candidates(session), repeat=1)
+        print('  candidates loaded: legacy {}, filter_unsent {}'.format(old, new))
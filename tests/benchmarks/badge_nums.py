@@ -0,0 +1,66 @@
+"""
+Compares the old "materialize the whole badge range" gap search with
+Session.auto_badge_num, which looks the lowest free number up in the
+BadgeGap table, on a badge range holding 20,000 badges.  Building the
+BadgeGap rows from scratch, which only happens once, is timed separately.
+"""
+from uuid import uuid4
+
+from uber.config import c
+from uber.models import Attendee, BadgeGap
+
+from tests.benchmarks.utils import report, scratch_session
+
+BADGE_COUNT = 20000
+
+
+def legacy_auto_badge_num(session, badge_type):
+    lower_bound, upper_bound = c.BADGE_RANGES[badge_type]
+    in_range_list = [int(row[0]) for row in session.query(Attendee.badge_num).filter(
+        Attendee.badge_num >= lower_bound, Attendee.badge_num <= upper_bound).order_by(Attendee.badge_num)]
+
+    if not in_range_list:
+        return lower_bound
+
+    gap_nums = sorted(set(range(lower_bound, in_range_list[-1] + 1)).difference(in_range_list))
+    return gap_nums[0] if gap_nums else in_range_list[-1] + 1
+
+
+def fill_badge_range(session, badge_type, count):
+    lower_bound, upper_bound = c.BADGE_RANGES[badge_type]
+    assert upper_bound - lower_bound >= count, 'The configured badge range is too small for this benchmark'
+
+    session.execute(Attendee.__table__.insert(), [{
+        'id': str(uuid4()),
+        'first_name': 'Bench',
+        'last_name': str(badge_num),
+        'badge_type': badge_type,
+        'badge_num': badge_num,
+    } for badge_num in range(lower_bound, lower_bound + count)])
+
+
+if __name__ == '__main__':
+    badge_type = c.ATTENDEE_BADGE
+    lower_bound = c.BADGE_RANGES[badge_type][0]
+
+    with scratch_session() as session:
+        session.query(Attendee).filter(Attendee.badge_type == badge_type).update(
+            {Attendee.badge_num: None}, synchronize_session=False)
+
+        fill_badge_range(session, badge_type, BADGE_COUNT)
+        print('{} badges, no gaps:'.format(BADGE_COUNT))
+        report('  building the badge gaps', lambda: session.refresh_badge_gaps(
+            [(1, BadgeGap.MAX_BADGE_NUM)], build=True), repeat=1)
+        old = report('  legacy set difference', lambda: legacy_auto_badge_num(session, badge_type))
+        new = report('  Session.auto_badge_num', lambda: session.auto_badge_num(badge_type))
+        assert old == new == lower_bound + BADGE_COUNT
+
+        gap_at = lower_bound + BADGE_COUNT // 2
+        session.query(Attendee).filter(Attendee.badge_num == gap_at).update(
+            {Attendee.badge_num: None}, synchronize_session=False)
+        # Bulk updates skip our session listeners, so we tell the badge gaps about this ourselves
+        session.refresh_badge_gaps([(gap_at, gap_at)])
+        print('{} badges, one gap in the middle:'.format(BADGE_COUNT))
+        old = report('  legacy set difference', lambda: legacy_auto_badge_num(session, badge_type))
+        new = report('  Session.auto_badge_num', lambda: session.auto_badge_num(badge_type))
+        assert old == new == gap_at
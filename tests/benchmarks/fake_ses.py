@@ -0,0 +1,118 @@
+"""
+A tiny fake of the Amazon SES query API, good enough for AmazonSES to talk to,
+so email throughput can be benchmarked without an AWS account.
+
+It understands SendEmail, SendBulkTemplatedEmail, CreateTemplate, and
+UpdateTemplate, and waits `latency` seconds before answering each request to
+stand in for the round trip to AWS.  Any recipient whose address starts with
+"reject" is refused, so per-recipient bulk statuses can be checked.
+
+Run it on its own and point AWS_SES_ENDPOINT_URL at it:
+```
+python -m tests.benchmarks.fake_ses --port 9324 --latency 0.05
+```
+"""
+import argparse
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+from uuid import uuid4
+
+RESPONSE = '''<{action}Response xmlns="http://ses.amazonaws.com/doc/2010-12-01/">
+  <{action}Result>{result}</{action}Result>
+  <ResponseMetadata><RequestId>{request_id}</RequestId></ResponseMetadata>
+</{action}Response>'''
+
+ERROR = '''<ErrorResponse xmlns="http://ses.amazonaws.com/doc/2010-12-01/">
+  <Error><Type>Sender</Type><Code>{code}</Code><Message>{message}</Message></Error>
+  <RequestId>{request_id}</RequestId>
+</ErrorResponse>'''
+
+BULK_DESTINATION = re.compile(r'^Destinations\.member\.(\d+)\.Destination\.ToAddresses\.member\.1$')
+
+
+class FakeSESHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0
+    sent = 0
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        params = {k: v[0] for k, v in parse_qs(self.rfile.read(length).decode('utf-8')).items()}
+        time.sleep(self.latency)
+
+        action = params.get('Action')
+        if action == 'SendEmail':
+            if params.get('Destination.ToAddresses.member.1', '').startswith('reject'):
+                return self._respond(400, ERROR.format(
+                    code='MessageRejected', message='Address rejected', request_id=uuid4()))
+            self._count(1)
+            result = '<MessageId>{}</MessageId>'.format(uuid4())
+        elif action == 'SendBulkTemplatedEmail':
+            addresses = sorted(
+                (int(m.group(1)), value) for m, value in
+                ((BULK_DESTINATION.match(key), value) for key, value in params.items()) if m)
+            statuses = []
+            for _, address in addresses:
+                if address.startswith('reject'):
+                    statuses.append('<member><Status>MessageRejected</Status>'
+                                    '<Error>Address rejected</Error></member>')
+                else:
+                    statuses.append('<member><Status>Success</Status><MessageId>{}</MessageId></member>'.format(
+                        uuid4()))
+            self._count(len(statuses) - sum('Rejected' in s for s in statuses))
+            result = '<Status>{}</Status>'.format(''.join(statuses))
+        elif action in ('CreateTemplate', 'UpdateTemplate'):
+            result = ''
+        else:
+            return self._respond(400, ERROR.format(
+                code='InvalidAction', message='Unsupported action {}'.format(action), request_id=uuid4()))
+
+        self._respond(200, RESPONSE.format(action=action, result=result, request_id=uuid4()))
+
+    def _count(self, sent):
+        with _count_lock:
+            FakeSESHandler.sent += sent
+
+    def _respond(self, status, body):
+        body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/xml')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_count_lock = threading.Lock()
+
+
+def start_fake_ses(port=0, latency=0.0):
+    """
+    Starts the fake SES server on a background thread. Returns the server and
+    the endpoint URL to hand to AmazonSES; call server.shutdown() when done.
+    """
+    handler = type('FakeSESHandler', (FakeSESHandler,), {'latency': latency})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, 'http://127.0.0.1:{}'.format(server.server_address[1])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a fake Amazon SES endpoint.')
+    parser.add_argument('--port', type=int, default=9324)
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds to wait before each response')
+    args = parser.parse_args()
+
+    server, url = start_fake_ses(args.port, args.latency)
+    print('Fake SES listening on {}'.format(url))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
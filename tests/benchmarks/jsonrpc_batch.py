@@ -0,0 +1,60 @@
+"""
+Compares making JSON-RPC calls one HTTP request at a time with sending them as
+JSON-RPC 2.0 batches, against a running server.
+
+Unlike the other benchmarks this is a client: point it at a server and give it
+an API token with read access.  It looks up attendees by badge number with
+attendee.lookup, so run it against a scratch server with some badged attendees:
+```
+python -m tests.benchmarks.jsonrpc_batch --url http://localhost:8282/uber/jsonrpc/ \\
+    --token XXXXXXXX-XXXX-XXXX-XXXX-XXXXXXXXXXXX --first-badge 3000 --last-badge 3500
+```
+"""
+import argparse
+
+import requests
+
+from tests.benchmarks.utils import report
+
+CALL_COUNT = 500
+BATCH_SIZES = [10, 50, 100]
+
+
+def calls_for(badge_nums):
+    return [{'jsonrpc': '2.0', 'id': i, 'method': 'attendee.lookup', 'params': [badge_nums[i % len(badge_nums)]]}
+            for i in range(CALL_COUNT)]
+
+
+def one_at_a_time(http, url, calls):
+    results = [http.post(url, json=call).json() for call in calls]
+    return sum(1 for result in results if 'error' in result)
+
+
+def batched(http, url, calls, batch_size):
+    results = []
+    for start in range(0, len(calls), batch_size):
+        results.extend(http.post(url, json=calls[start:start + batch_size]).json())
+    assert [result['id'] for result in results] == [call['id'] for call in calls]
+    return sum(1 for result in results if 'error' in result)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', required=True, help='the jsonrpc endpoint, e.g. http://localhost:8282/uber/jsonrpc/')
+    parser.add_argument('--token', required=True, help='an API token with read access')
+    parser.add_argument('--first-badge', type=int, required=True)
+    parser.add_argument('--last-badge', type=int, required=True)
+    args = parser.parse_args()
+
+    calls = calls_for(list(range(args.first_badge, args.last_badge + 1)))
+
+    http = requests.Session()
+    http.headers['X-Auth-Token'] = args.token
+
+    print('{} attendee.lookup calls:'.format(CALL_COUNT))
+    errors = report('  one call per request', lambda: one_at_a_time(http, args.url, calls), repeat=1)
+    for batch_size in BATCH_SIZES:
+        batch_errors = report('  batches of {}'.format(batch_size),
+                              lambda: batched(http, args.url, calls, batch_size), repeat=3)
+        assert batch_errors == errors, 'batches returned {} errors, single calls returned {}'.format(
+            batch_errors, errors)
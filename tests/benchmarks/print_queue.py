@@ -0,0 +1,125 @@
+"""
+Compares badge printer stations taking print jobs one at a time with a
+blocking SELECT ... FOR UPDATE, as Session.get_next_badge_to_print used to,
+with Session.claim_print_jobs, which claims a batch of jobs with a single
+UPDATE over a FOR UPDATE SKIP LOCKED subquery.
+
+Simulates 20 stations polling the same printers at once, each on its own
+thread and session, until 2,000 print jobs are drained, and checks that every
+job was handed out exactly once.  The stations need their own connections, so
+set sqlalchemy_pool_size + sqlalchemy_max_overflow to at least 20.
+
+Other sessions can't see uncommitted rows, so unlike the other benchmarks
+this commits its print jobs, and deletes them (and their tracking entries)
+again when it's done.
+"""
+import threading
+from collections import Counter
+from datetime import datetime
+from uuid import uuid4
+
+from pytz import UTC
+
+from uber.models import Attendee, initialize_db, PrintJob, Session, Tracking
+
+from tests.benchmarks.utils import report
+
+STATION_COUNT = 20
+PRINTER_IDS = ['bench-printer-{}'.format(i) for i in range(4)]
+JOB_COUNT = 2000
+CLAIM_SIZE = 10
+
+
+def pending_jobs(session):
+    return session.query(PrintJob).filter(
+        PrintJob.printer_id.in_(PRINTER_IDS), PrintJob.printed == None, PrintJob.errors == '')
+
+
+def legacy_station(name, printed):
+    with Session() as session:
+        while True:
+            job = pending_jobs(session).filter(PrintJob.queued == None) \
+                .order_by(PrintJob.id).with_for_update().first()
+            if job:
+                job.queued = job.printed = datetime.now(UTC)
+                printed.append(job.id)
+                session.commit()
+            elif not pending_jobs(session).count():
+                return
+            else:
+                # Another station printed the row we waited on, so Postgres gave us nothing; try again.
+                session.commit()
+
+
+def claiming_station(name, printed):
+    with Session() as session:
+        while True:
+            jobs = session.claim_print_jobs(PRINTER_IDS, count=CLAIM_SIZE, station=name, lease_seconds=60)
+            if not jobs:
+                return
+            for job in jobs:
+                job.printed = datetime.now(UTC)
+                printed.append(job.id)
+            session.commit()
+
+
+def run_stations(station):
+    printed = []
+    threads = [threading.Thread(target=station, args=('station{}'.format(i), printed)) for i in range(STATION_COUNT)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    counts = Counter(printed)
+    assert len(counts) == JOB_COUNT, 'only {} of {} jobs were printed'.format(len(counts), JOB_COUNT)
+    assert max(counts.values()) == 1, 'some jobs were printed more than once'
+    return len(printed)
+
+
+def reset_jobs():
+    with Session() as session:
+        session.query(PrintJob).filter(PrintJob.printer_id.in_(PRINTER_IDS)).update({
+            PrintJob.queued: None,
+            PrintJob.printed: None,
+            PrintJob.claimed_by: '',
+            PrintJob.lease_expires: None,
+        }, synchronize_session=False)
+
+
+def fill_queue(session):
+    attendee_ids = [str(uuid4()) for _ in range(JOB_COUNT)]
+    session.execute(Attendee.__table__.insert(), [{
+        'id': attendee_id,
+        'first_name': 'Bench',
+        'last_name': str(i),
+    } for i, attendee_id in enumerate(attendee_ids)])
+    session.execute(PrintJob.__table__.insert(), [{
+        'id': str(uuid4()),
+        'attendee_id': attendee_id,
+        'printer_id': PRINTER_IDS[i % len(PRINTER_IDS)],
+        'admin_name': 'Bench',
+        'errors': '',
+        'json_data': {},
+    } for i, attendee_id in enumerate(attendee_ids)])
+    return attendee_ids
+
+
+if __name__ == '__main__':
+    initialize_db()
+    with Session() as session:
+        attendee_ids = fill_queue(session)
+
+    try:
+        print('{} stations draining {} print jobs from {} printers:'.format(
+            STATION_COUNT, JOB_COUNT, len(PRINTER_IDS)))
+        report('  one job at a time, FOR UPDATE', lambda: run_stations(legacy_station), repeat=1)
+        reset_jobs()
+        report('  claim_print_jobs({}), SKIP LOCKED'.format(CLAIM_SIZE),
+               lambda: run_stations(claiming_station), repeat=1)
+    finally:
+        with Session() as session:
+            job_ids = [job_id for job_id, in session.query(PrintJob.id).filter(PrintJob.printer_id.in_(PRINTER_IDS))]
+            session.query(Tracking).filter(Tracking.fk_id.in_(job_ids)).delete(synchronize_session=False)
+            session.query(PrintJob).filter(PrintJob.id.in_(job_ids)).delete(synchronize_session=False)
+            session.query(Attendee).filter(Attendee.id.in_(attendee_ids)).delete(synchronize_session=False)
@@ -0,0 +1,53 @@
+"""
+Compares generating 10,000 promo codes the old way, by loading every existing
+code to check for collisions and then adding a PromoCode at a time, with
+Session.insert_promo_codes, which inserts them in batches and lets the unique
+index on normalized codes reject the collisions, on a promo_code table which
+already holds 100,000 codes.
+"""
+from uuid import uuid4
+
+from uber.models import PromoCode
+
+from tests.benchmarks.utils import report, scratch_session
+
+EXISTING_COUNT = 100000
+NEW_COUNT = 10000
+
+
+def legacy_add_codes(session, count):
+    old_codes = set(s for (s,) in session.query(PromoCode.code).all())
+    generator = PromoCode.random_code_generator()
+    codes = set()
+    while len(codes) < count:
+        code = generator()
+        if code not in old_codes:
+            codes.add(code)
+
+    for code in codes:
+        session.add(PromoCode(code=code, discount=0, discount_type=PromoCode._FIXED_PRICE, uses_allowed=1))
+    session.flush()
+    return len(codes)
+
+
+def fill_promo_codes(session, count):
+    generator = PromoCode.random_code_generator()
+    codes = PromoCode._distinct_codes(generator, count)
+    session.execute(PromoCode.__table__.insert(), [{
+        'id': str(uuid4()),
+        'code': code,
+        'discount': 0,
+        'discount_type': PromoCode._FIXED_PRICE,
+        'uses_allowed': 1,
+    } for code in codes.values()])
+
+
+if __name__ == '__main__':
+    with scratch_session() as session:
+        fill_promo_codes(session, EXISTING_COUNT)
+
+        print('{} new promo codes, {} existing:'.format(NEW_COUNT, EXISTING_COUNT))
+        old = report('  load all codes, add one at a time', lambda: legacy_add_codes(session, NEW_COUNT), repeat=3)
+        new = report('  Session.insert_promo_codes', lambda: len(session.insert_promo_codes(
+            NEW_COUNT, discount=0, discount_type=PromoCode._FIXED_PRICE, uses_allowed=1)), repeat=3)
+        assert old == new == NEW_COUNT
@@ -0,0 +1,69 @@
+"""
+Compares per-message SES SendEmail calls (sequential with the old 0.1s sleep,
+then spread over a thread pool) with SendBulkTemplatedEmail, against the fake
+SES server in tests/benchmarks/fake_ses.py with 20ms of simulated latency.
+
+This doesn't touch the database, and it doesn't need AWS credentials.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from uber.amazon_ses import AmazonSES
+from uber.config import c
+
+from tests.benchmarks.fake_ses import FakeSESHandler, start_fake_ses
+from tests.benchmarks.utils import report
+
+MESSAGE_COUNT = 500
+LATENCY = 0.02
+THREADS = 8
+
+MESSAGES = [{
+    'to': ['bench{}@example.com'.format(i)],
+    'subject': 'Benchmark {}'.format(i),
+    'body': '<html><body>Hello, attendee {}!</body></html>'.format(i),
+} for i in range(MESSAGE_COUNT)]
+
+
+def send_one(sender, message):
+    return sender.sendEmail(
+        source='bench@example.com',
+        toAddresses=message['to'],
+        message={'bodyHtml': message['body'], 'subject': message['subject'], 'charset': 'UTF-8'})
+
+
+def legacy_sequential(sender):
+    for message in MESSAGES:
+        send_one(sender, message)
+        time.sleep(0.1)
+
+
+def threaded(sender):
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        list(pool.map(lambda message: send_one(sender, message), MESSAGES))
+
+
+def bulk(sender):
+    limit = AmazonSES.BULK_DESTINATION_LIMIT
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        results = pool.map(
+            lambda start: sender.sendBulkEmail('bench@example.com', 'html', MESSAGES[start:start + limit]),
+            range(0, MESSAGE_COUNT, limit))
+        return [error for errors in results for error in errors]
+
+
+if __name__ == '__main__':
+    c.AWS_ACCESS_KEY = c.AWS_ACCESS_KEY or 'fake'
+    c.AWS_SECRET_KEY = c.AWS_SECRET_KEY or 'fake'
+    server, url = start_fake_ses(latency=LATENCY)
+    sender = AmazonSES(c.AWS_REGION_EMAIL, endpoint_url=url)
+
+    try:
+        print('{} messages, {:.0f}ms simulated SES latency:'.format(MESSAGE_COUNT, LATENCY * 1000))
+        report('  sequential SendEmail + sleep(0.1)', lambda: legacy_sequential(sender), repeat=1)
+        report('  SendEmail on {} threads'.format(THREADS), lambda: threaded(sender), repeat=3)
+        errors = report('  SendBulkTemplatedEmail on {} threads'.format(THREADS), lambda: bulk(sender), repeat=3)
+        assert errors == [None] * MESSAGE_COUNT
+        print('  fake SES accepted {} messages in total'.format(FakeSESHandler.sent))
+    finally:
+        server.shutdown()
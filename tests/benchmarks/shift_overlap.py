@@ -0,0 +1,106 @@
+"""
+Compares the old per-minute shift checks, which built a set with one datetime
+per minute worked, with the sorted intervals in Attendee.shift_intervals.
+
+Uses 3,000 volunteers who each have 8 shifts spread over three days, and runs
+what the staffing pages run: Job.available_volunteers checks every volunteer
+against a job, and Attendee.possible checks every job against a volunteer.
+This doesn't touch the database; the models are built in memory.
+"""
+import random
+from datetime import timedelta
+
+from uber.config import c
+from uber.models import Attendee, Department, Job, Shift
+
+from tests.benchmarks.utils import report
+
+VOLUNTEER_COUNT = 3000
+SHIFTS_PER_VOLUNTEER = 8
+JOB_COUNT = 40
+
+
+def legacy_working_limit_ok(job, attendee):
+    attendee_minute_map = attendee.shift_minute_map
+    minutes_worked = job.duration
+    working_minutes_limit = job.max_consecutive_minutes or 60000
+
+    current_shift_minute = job.start_time - timedelta(minutes=1)
+    while current_shift_minute in attendee_minute_map:
+        minutes_worked += 1
+        this_job_minute_limit = attendee_minute_map[current_shift_minute].max_consecutive_minutes
+        if this_job_minute_limit > 0:
+            working_minutes_limit = min(working_minutes_limit, this_job_minute_limit)
+        current_shift_minute = current_shift_minute - timedelta(minutes=1)
+
+    current_shift_minute = job.start_time + timedelta(minutes=job.duration)
+    while current_shift_minute in attendee_minute_map:
+        minutes_worked += 1
+        this_job_minute_limit = attendee_minute_map[current_shift_minute].max_consecutive_minutes
+        if this_job_minute_limit > 0:
+            working_minutes_limit = min(working_minutes_limit, this_job_minute_limit)
+        current_shift_minute = current_shift_minute + timedelta(minutes=1)
+
+    return minutes_worked <= working_minutes_limit
+
+
+def legacy_no_overlap(job, attendee):
+    before = job.start_time - timedelta(minutes=1)
+    after = job.start_time + timedelta(minutes=job.duration)
+    return not job.minutes.intersection(attendee.shift_minutes) and (
+        before not in attendee.shift_minute_map
+        or not attendee.shift_minute_map[before].extra15
+        or job.department_id == attendee.shift_minute_map[before].department_id
+    ) and (
+        after not in attendee.shift_minute_map
+        or not job.extra15
+        or job.department_id == attendee.shift_minute_map[after].department_id
+    )
+
+
+def legacy_available(jobs, volunteers):
+    for volunteer in volunteers:
+        volunteer.__dict__.pop('shift_minute_map', None)
+    return [
+        [v for v in volunteers if legacy_no_overlap(job, v) and legacy_working_limit_ok(job, v)]
+        for job in jobs]
+
+
+def new_available(jobs, volunteers):
+    return [[v for v in volunteers if job.no_overlap(v) and job.working_limit_ok(v)] for job in jobs]
+
+
+def random_job(departments):
+    department = random.choice(departments)
+    return Job(
+        name='Benchmark',
+        start_time=c.EPOCH + timedelta(hours=random.randrange(72)),
+        duration=random.choice([60, 120, 180]),
+        extra15=random.random() < 0.25,
+        department_id=department.id,
+        department=department)
+
+
+def build_volunteers():
+    random.seed(0)
+    departments = [Department(name=str(i), max_consecutive_minutes=random.choice([0, 240, 360])) for i in range(10)]
+    volunteers = [
+        Attendee(first_name='Bench', last_name=str(i), shifts=[
+            Shift(job=random_job(departments)) for _ in range(SHIFTS_PER_VOLUNTEER)])
+        for i in range(VOLUNTEER_COUNT)]
+    return volunteers, [random_job(departments) for _ in range(JOB_COUNT)]
+
+
+if __name__ == '__main__':
+    volunteers, jobs = build_volunteers()
+    print('{} volunteers with {} shifts each, checked against {} jobs:'.format(
+        VOLUNTEER_COUNT, SHIFTS_PER_VOLUNTEER, JOB_COUNT))
+    old = report('  Job.available_volunteers, minute sets', lambda: legacy_available(jobs, volunteers), repeat=1)
+    new = report('  Job.available_volunteers, intervals', lambda: new_available(jobs, volunteers), repeat=3)
+    assert old == new
+
+    volunteer = volunteers[0]
+    report('  Attendee.possible x 100, minute sets', lambda: [
+        legacy_available(jobs, [volunteer]) for _ in range(100)], repeat=1)
+    report('  Attendee.possible x 100, intervals', lambda: [
+        new_available(jobs, [volunteer]) for _ in range(100)], repeat=3)
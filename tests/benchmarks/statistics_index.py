@@ -0,0 +1,102 @@
+"""
+Compares the old statistics page counts, which loaded every Attendee (and
+their group) and counted them in a Python loop, with the grouped SQL
+aggregates in Session.attendee_stats.
+
+Uses 30,000 attendees with a spread of badge types, statuses, payment states,
+ribbons, interests, donations, and check-ins.  The shared Redis cache in front
+of c.ATTENDEE_STATS is bypassed, so both sides hit the database every time.
+"""
+import random
+from collections import defaultdict, OrderedDict
+from uuid import uuid4
+
+import six
+from sqlalchemy.orm import joinedload
+
+from uber.config import c
+from uber.models import Attendee
+from uber.utils import localized_now
+
+from tests.benchmarks.utils import report, scratch_session
+
+ATTENDEE_COUNT = 30000
+
+
+def legacy_stats(session):
+    counts = defaultdict(OrderedDict)
+    counts['donation_tiers'] = OrderedDict([(k, 0) for k in sorted(c.DONATION_TIERS.keys()) if k > 0])
+    counts.update({
+        'groups': {'paid': 0, 'free': 0},
+        'noshows': {'paid': 0, 'free': 0},
+        'checked_in': {'yes': 0, 'no': 0}
+    })
+    count_labels = {
+        'badges': c.BADGE_OPTS,
+        'paid': c.PAYMENT_OPTS,
+        'ages': c.AGE_GROUP_OPTS,
+        'ribbons': c.RIBBON_OPTS,
+        'interests': c.INTEREST_OPTS,
+        'statuses': c.BADGE_STATUS_OPTS,
+        'checked_in_by_type': c.BADGE_OPTS,
+    }
+    for label, opts in count_labels.items():
+        for val, desc in opts:
+            counts[label][desc] = 0
+
+    for a in session.query(Attendee).options(joinedload(Attendee.group)):
+        counts['statuses'][a.badge_status_label] += 1
+        if a.badge_status not in [c.INVALID_GROUP_STATUS, c.INVALID_STATUS, c.IMPORTED_STATUS, c.REFUNDED_STATUS]:
+            counts['paid'][a.paid_label] += 1
+            counts['ages'][a.age_group_label] += 1
+            for val in a.ribbon_ints:
+                counts['ribbons'][c.RIBBONS[val]] += 1
+            counts['badges'][a.badge_type_label] += 1
+            counts['checked_in']['yes' if a.checked_in else 'no'] += 1
+            if a.checked_in:
+                counts['checked_in_by_type'][a.badge_type_label] += 1
+            for val in a.interests_ints:
+                counts['interests'][c.INTERESTS[val]] += 1
+            if a.paid == c.PAID_BY_GROUP and a.group:
+                counts['groups']['paid' if a.group.amount_paid else 'free'] += 1
+
+            donation_amounts = list(counts['donation_tiers'].keys())
+            for index, amount in enumerate(donation_amounts):
+                next_amount = donation_amounts[index + 1] if index + 1 < len(donation_amounts) else six.MAXSIZE
+                if a.amount_extra >= amount and a.amount_extra < next_amount:
+                    counts['donation_tiers'][amount] = counts['donation_tiers'][amount] + 1
+            if not a.checked_in:
+                is_paid = a.paid == c.HAS_PAID or a.paid == c.PAID_BY_GROUP and a.group and a.group.amount_paid
+                counts['noshows']['paid' if is_paid else 'free'] += 1
+
+    session.expire_all()
+    return counts
+
+
+def fill_tables(session):
+    random.seed(0)
+    now = localized_now()
+    ribbons = [val for val, desc in c.RIBBON_OPTS]
+    interests = [val for val, desc in c.INTEREST_OPTS]
+    session.execute(Attendee.__table__.insert(), [{
+        'id': str(uuid4()),
+        'first_name': 'Bench',
+        'last_name': str(i),
+        'badge_type': random.choice([c.ATTENDEE_BADGE, c.ATTENDEE_BADGE, c.STAFF_BADGE, c.CHILD_BADGE]),
+        'badge_status': random.choice([c.NEW_STATUS, c.COMPLETED_STATUS, c.COMPLETED_STATUS, c.INVALID_STATUS]),
+        'paid': random.choice([c.HAS_PAID, c.HAS_PAID, c.NEED_NOT_PAY, c.NOT_PAID]),
+        'age_group': random.choice([val for val, desc in c.AGE_GROUP_OPTS]),
+        'ribbon': ','.join(str(r) for r in random.sample(ribbons, random.randint(0, min(2, len(ribbons))))),
+        'interests': ','.join(str(r) for r in random.sample(interests, random.randint(0, min(3, len(interests))))),
+        'amount_extra': random.choice([0, 0, 0] + sorted(c.DONATION_TIERS.keys())),
+        'checked_in': now if random.random() < 0.6 else None,
+    } for i in range(ATTENDEE_COUNT)])
+
+
+if __name__ == '__main__':
+    with scratch_session() as session:
+        fill_tables(session)
+        print('{} attendees:'.format(ATTENDEE_COUNT))
+        old = report('  legacy Python loop', lambda: legacy_stats(session), repeat=1)
+        new = report('  Session.attendee_stats', lambda: session.attendee_stats(), repeat=3)
+        assert old == new, 'counts differ'
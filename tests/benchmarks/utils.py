@@ -0,0 +1,34 @@
+import time
+from contextlib import contextmanager
+
+from uber.models import initialize_db, Session
+
+
+@contextmanager
+def scratch_session():
+    """
+    Yields a session whose changes are always rolled back, so benchmarks can
+    fill tables with fake data without leaving anything behind.
+    """
+    initialize_db()
+    session = Session().session
+    try:
+        yield session
+    finally:
+        session.rollback()
+        session.close()
+
+
+def report(label, func, repeat=5):
+    """
+    Calls func `repeat` times and prints the average and best wall-clock time.
+    Returns the result of the last call so callers can sanity-check it.
+    """
+    timings, result = [], None
+    for _ in range(repeat):
+        before = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - before)
+
+    print('{:<50} avg {:>9.4f}s   best {:>9.4f}s'.format(label, sum(timings) / len(timings), min(timings)))
+    return result
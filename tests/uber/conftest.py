@@ -8,6 +8,7 @@ import pytest
 from sideboard.lib import threadlocal
 from sideboard.tests import patch_session
 
+import uber.watchlist
 from uber.config import c
 from uber.models import Attendee, Department, DeptMembership, DeptRole, Job, PromoCode, Session, WatchList, \
     initialize_db, register_session_listeners
@@ -74,6 +75,21 @@ def clear_price_bumps(request, monkeypatch):
     monkeypatch.setattr(c, 'PRICE_BUMPS', {})
 
 
+@pytest.fixture(autouse=True)
+def uncached_redis_values(monkeypatch):
+    """
+    Badge counters, the shared config cache, queued tracking entries, and the
+    watchlist index version live in Redis, which isn't rolled back between
+    tests, so always compute them from the database and write tracking
+    synchronously instead.
+    """
+    monkeypatch.setattr(type(c), 'get_badge_counter', lambda self, field: self.count_badge_counter(field))
+    monkeypatch.setattr(type(c), 'increment_badge_counters', lambda self, deltas: None)
+    monkeypatch.setattr(c, 'SHARED_CONFIG_CACHE', False)
+    monkeypatch.setattr(c, 'ASYNC_TRACKING', False)
+    monkeypatch.setattr(uber.watchlist, 'watchlist_index', uber.watchlist.WatchlistIndex.load)
+
+
 @pytest.fixture(autouse=True)
 def patch_send_email_delay(request, monkeypatch):
     from uber.tasks import email as email_tasks
@@ -201,6 +201,17 @@ class TestAutomatedEmail(object):
             email.fixture.filter = lambda x: True
             assert email.would_send_if_approved(attendee)
 
+    def test_filter_unsent(self, send_emails_for_automated_email_fixture):
+        with Session() as session:
+            email = session.query(AutomatedEmail).one()
+            session.add(Attendee(first_name='5', last_name='5', email='5@example.com'))
+            session.add(Attendee(first_name='6', last_name='6', email='6@example.com'))
+            session.flush()
+            assert sorted(a.first_name for a in email.filter_unsent(session.query(Attendee))) == ['5', '6']
+
+            email.fixture.query = [Attendee.first_name == '6']
+            assert [a.first_name for a in email.filter_unsent(session.query(Attendee))] == ['6']
+
 
 class TestEmail(object):
 
@@ -2,11 +2,14 @@
 Tests for uber.tasks.email scheduled tasks.
 """
 
+from unittest.mock import Mock
+
 import pytest
 
+from uber.amazon_ses import AmazonSES
 from uber.config import c, Config
 from uber.models import AutomatedEmail, Session
-from uber.tasks.email import notify_admins_of_pending_emails, send_automated_emails
+from uber.tasks.email import _deliver_bulk, notify_admins_of_pending_emails, send_automated_emails
 
 from tests.uber.email_tests.email_fixtures import *  # noqa: F401,F403
 
@@ -137,3 +140,22 @@ class TestSendAutomatedEmails(object):
                             ('Attendee', '00000000-0000-0000-0000-000000000004')]
                     else:
                         assert len(automated_email.emails) == 0
+
+
+class TestDeliverBulk(object):
+    def test_per_recipient_status(self, monkeypatch):
+        monkeypatch.setattr(AmazonSES, 'sendBulkEmail', Mock(return_value=[None, 'Address rejected', None]))
+        batch = [{
+            'sender': 'test@example.com',
+            'to': '{}@example.com'.format(i),
+            'subject': 'Subject {}'.format(i),
+            'body': 'Body {}'.format(i),
+            'model': {'id': '00000000-0000-0000-0000-00000000000{}'.format(i), '_model': 'Attendee'},
+            'ident': 'test_ident',
+        } for i in range(3)]
+
+        emails = _deliver_bulk('test@example.com', 'text', batch)
+        assert AmazonSES.sendBulkEmail.call_count == 1
+        assert [e.to for e in emails] == ['0@example.com', '2@example.com']
+        assert [e.fk_id for e in emails] == [
+            '00000000-0000-0000-0000-000000000000', '00000000-0000-0000-0000-000000000002']
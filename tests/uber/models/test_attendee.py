@@ -212,6 +212,15 @@ def test_legal_name_diff_from_full_name():
     assert 'diff name' == diff_legal_name.legal_name
 
 
+def test_search_text():
+    attendee = Attendee(first_name='Searchy', last_name='McSearch', email='Searchy@example.com')
+    attendee._update_search_text()
+    assert 'searchy' in attendee.search_text
+    assert 'mcsearch' in attendee.search_text
+    assert 'searchy@example.com' in attendee.search_text
+    assert 'search_text' not in Attendee.searchable_fields
+
+
 def test_badge():
     assert Attendee().badge == 'Unpaid Attendee'
     assert Attendee(paid=c.HAS_PAID).badge == 'Attendee'
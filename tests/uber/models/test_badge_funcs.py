@@ -1,15 +1,27 @@
 from datetime import datetime, timedelta
 
 import pytest
+import sqlalchemy
 from pytz import UTC
 
 from uber.badge_funcs import needs_badge_num, reset_badge_if_unchanged
 from uber.config import c
-from uber.models import Attendee, Session
+from uber.models import Attendee, BadgeGap, Session, Tracking
 from uber.decorators import presave_adjustment
 from uber.utils import check
 
 
+def badge_gaps(session):
+    gaps = BadgeGap.__table__
+    return session.execute(sqlalchemy.select([gaps.c.start_num, gaps.c.end_num]).order_by(gaps.c.end_num)).fetchall()
+
+
+def assert_badge_gaps_current(session):
+    kept = badge_gaps(session)
+    session.refresh_badge_gaps([(1, BadgeGap.MAX_BADGE_NUM)])
+    assert kept == badge_gaps(session)
+
+
 @pytest.fixture
 def session(request):
     session = Session().session
@@ -263,6 +275,43 @@ class TestAutoBadgeNum:
         session.commit()
         assert 3001 == session.auto_badge_num(c.ATTENDEE_BADGE)
 
+    def test_gap_after_dense_run(self, session):
+        for badge_num in range(3001, 3021):
+            if badge_num != 3017:
+                session.add(Attendee(
+                    badge_type=c.ATTENDEE_BADGE,
+                    checked_in=datetime.now(UTC),
+                    first_name=str(badge_num),
+                    paid=c.HAS_PAID,
+                    badge_num=badge_num))
+        session.commit()
+        assert 3017 == session.auto_badge_num(c.ATTENDEE_BADGE)
+
+    def test_range_start_free(self, session):
+        session.regular_attendee.badge_num = 3002
+        session.commit()
+        assert 3000 == session.auto_badge_num(c.ATTENDEE_BADGE)
+
+    def test_gaps_follow_badge_changes(self, session):
+        assert 6 == session.auto_badge_num(c.STAFF_BADGE)
+        session.supporter_five.badge_type, session.supporter_five.badge_num = c.STAFF_BADGE, 12
+        session.supporter_four.badge_type, session.supporter_four.badge_num = c.STAFF_BADGE, 6
+        session.commit()
+        assert 7 == session.auto_badge_num(c.STAFF_BADGE)
+        assert_badge_gaps_current(session)
+
+        session.delete(session.supporter_four)
+        session.commit()
+        assert 6 == session.auto_badge_num(c.STAFF_BADGE)
+        assert_badge_gaps_current(session)
+
+    def test_out_of_date_gaps(self, session):
+        assert 6 == session.auto_badge_num(c.STAFF_BADGE)
+        session.execute(Attendee.__table__.update().where(Attendee.id == session.supporter_five.id).values(
+            badge_type=c.STAFF_BADGE, badge_num=6))
+        assert 7 == session.auto_badge_num(c.STAFF_BADGE)
+        assert_badge_gaps_current(session)
+
 
 class TestShiftBadges:
     @pytest.fixture(autouse=True)
@@ -312,6 +361,56 @@ class TestShiftBadges:
         session.shift_badges(c.STAFF_BADGE, 5, up=True)
         assert [1, 2, 3, 4, 6] == self.staff_badges(session)
 
+    def test_shift_updates_badge_gaps(self, session):
+        session.auto_badge_num(c.STAFF_BADGE)
+        session.shift_badges(c.STAFF_BADGE, 2, until=3, up=True)
+        assert 2 == session.auto_badge_num(c.STAFF_BADGE)
+        assert_badge_gaps_current(session)
+
+
+class TestRenumberBadges:
+    @pytest.fixture(autouse=True)
+    def before_print_badges_deadline(self, before_printed_badge_deadline):
+        pass
+
+    def staff_badges(self, session):
+        return [a.first_name for a in session.query(Attendee).filter(
+            Attendee.badge_type == c.STAFF_BADGE).order_by(Attendee.badge_num).all()]
+
+    def test_move_up(self, session):
+        session.renumber_badges([(session.staff_five, 2)])
+        session.commit()
+        assert ['One', 'Five', 'Two', 'Three', 'Four'] == self.staff_badges(session)
+
+    def test_updates_badge_gaps(self, session):
+        session.auto_badge_num(c.STAFF_BADGE)
+        session.renumber_badges([(session.staff_five, 9), (session.contractor_one, 3, c.STAFF_BADGE)])
+        session.commit()
+        assert_badge_gaps_current(session)
+
+    def test_move_down(self, session):
+        session.renumber_badges([(session.staff_one, 4)])
+        session.commit()
+        assert ['Two', 'Three', 'Four', 'One', 'Five'] == self.staff_badges(session)
+
+    def test_several_moves(self, session):
+        session.renumber_badges([(session.staff_five, 1), (session.staff_four, 2)])
+        session.commit()
+        assert ['Five', 'Four', 'One', 'Two', 'Three'] == self.staff_badges(session)
+
+    def test_change_type(self, session):
+        changes = session.renumber_badges([(session.contractor_one, 3, c.STAFF_BADGE)])
+        session.commit()
+        assert session.contractor_one.badge_type == c.STAFF_BADGE
+        assert ['One', 'Two', 'One', 'Three', 'Four', 'Five'] == self.staff_badges(session)
+        assert changes[session.contractor_two.id] == c.BADGE_RANGES[c.CONTRACTOR_BADGE][0]
+
+    def test_one_tracking_entry(self, session):
+        before = session.query(Tracking).filter_by(action=c.AUTO_BADGE_SHIFT).count()
+        session.renumber_badges([(session.staff_five, 1), (session.staff_four, 2)])
+        session.commit()
+        assert before + 1 == session.query(Tracking).filter_by(action=c.AUTO_BADGE_SHIFT).count()
+
 
 class TestBadgeTypeChange:
     def test_end_to_next(self, session):
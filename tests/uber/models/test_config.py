@@ -1,10 +1,12 @@
 from datetime import datetime, timedelta
+from unittest.mock import Mock
 
 import pytest
+import redis
 from pytz import UTC
 
 import uber
-from uber.config import c
+from uber.config import c, invalidate_shared_cache, shared_cache
 from uber.models import Attendee, Group, Session
 from uber.utils import localized_now, request_cached_context
 
@@ -281,6 +283,93 @@ class TestDealerConfig:
         assert c.DEALER_APPS == 0
 
 
+class TestBadgeCounters:
+    def flushed_deltas(self, session):
+        session.flush()
+        return {field: delta for field, delta in session.info.get('badge_count_deltas', {}).items() if delta}
+
+    def test_new_paid_attendee(self):
+        session = Session().session
+        session.add(Attendee(paid=c.HAS_PAID, badge_status=c.COMPLETED_STATUS, badge_type=c.ATTENDEE_BADGE))
+        assert self.flushed_deltas(session) == {
+            'badge_type:{}'.format(c.ATTENDEE_BADGE): 1,
+            'individual_badges_sold': 1}
+
+    def test_unpaid_attendee(self):
+        session = Session().session
+        session.add(Attendee(paid=c.NOT_PAID, badge_type=c.ATTENDEE_BADGE))
+        assert self.flushed_deltas(session) == {}
+
+    def test_badge_type_change(self):
+        session = Session().session
+        attendee = Attendee(paid=c.NEED_NOT_PAY, badge_status=c.COMPLETED_STATUS, badge_type=c.ATTENDEE_BADGE)
+        session.add(attendee)
+        session.flush()
+        session.info.pop('badge_count_deltas')
+
+        attendee.badge_type = c.STAFF_BADGE
+        assert self.flushed_deltas(session) == {
+            'badge_type:{}'.format(c.ATTENDEE_BADGE): -1,
+            'badge_type:{}'.format(c.STAFF_BADGE): 1}
+
+    def test_deleted_attendee(self):
+        session = Session().session
+        attendee = Attendee(paid=c.HAS_PAID, badge_status=c.COMPLETED_STATUS, badge_type=c.ATTENDEE_BADGE)
+        session.add(attendee)
+        session.flush()
+        session.info.pop('badge_count_deltas')
+
+        session.delete(attendee)
+        assert self.flushed_deltas(session) == {
+            'badge_type:{}'.format(c.ATTENDEE_BADGE): -1,
+            'individual_badges_sold': -1}
+
+    def test_dealer_app(self):
+        session = Session().session
+        session.add(Group(tables=1, cost=10, auto_recalc=False, status=c.UNAPPROVED))
+        assert self.flushed_deltas(session) == {'dealer_apps': 1}
+
+
+class TestSharedCache:
+    @pytest.fixture
+    def redis_store(self, monkeypatch):
+        store = Mock()
+        monkeypatch.setattr(c, 'SHARED_CONFIG_CACHE', True)
+        monkeypatch.setattr(c, 'REDIS_STORE', store)
+        return store
+
+    @pytest.fixture
+    def cached_value(self, monkeypatch):
+        compute = Mock(return_value=[('id', 'name')])
+
+        @shared_cache(invalidated_by=['TestModel'])
+        def TEST_CACHED_VALUE(self):
+            return compute()
+
+        monkeypatch.setattr(uber.config.Config, 'TEST_CACHED_VALUE', TEST_CACHED_VALUE, raising=False)
+        return compute
+
+    def test_miss_is_computed_and_stored(self, redis_store, cached_value):
+        redis_store.pipeline.return_value.get.return_value.hincrby.return_value.execute.return_value = [None, 1]
+        assert c.TEST_CACHED_VALUE() == [('id', 'name')]
+        assert cached_value.call_count == 1
+        assert redis_store.pipeline.return_value.setex.called
+
+    def test_redis_unavailable(self, redis_store, cached_value):
+        redis_store.pipeline.side_effect = redis.exceptions.ConnectionError
+        assert c.TEST_CACHED_VALUE() == [('id', 'name')]
+        assert cached_value.call_count == 1
+
+    def test_invalidate(self, redis_store, cached_value):
+        redis_store.smembers.return_value = {'cached_key'}
+        invalidate_shared_cache(['TestModel'])
+        redis_store.delete.assert_called_once_with(c.REDIS_PREFIX + 'config_cache_keys:TEST_CACHED_VALUE', 'cached_key')
+
+    def test_invalidate_unrelated_model(self, redis_store, cached_value):
+        invalidate_shared_cache(['Attendee'])
+        assert not redis_store.delete.called
+
+
 class TestMiscConfig:
     @pytest.mark.parametrize('cutoff,start,expected', [
         ('', '', False),
@@ -3,7 +3,7 @@ from datetime import timedelta
 import pytest
 
 from uber.config import c
-from uber.models import Attendee, DeptMembership, Job, Session
+from uber.models import Attendee, Department, DeptMembership, Job, Session, Shift, ShiftIntervals
 
 
 def test_hours():
@@ -29,6 +29,73 @@ def test_total_hours(monkeypatch):
     assert Job(slots=2).total_hours == 6
 
 
+def _job(hour, duration=60, department=None, extra15=False):
+    return Job(
+        start_time=c.EPOCH + timedelta(hours=hour),
+        duration=duration,
+        extra15=extra15,
+        department=department or Department(max_consecutive_minutes=0))
+
+
+def _volunteer(*jobs):
+    return Attendee(shifts=[Shift(job=job) for job in jobs])
+
+
+class TestShiftIntervals:
+    def test_matches_minute_map(self):
+        first, second, overlapping = _job(0), _job(1, 120), _job(2, 30)
+        attendee = _volunteer(first, second, overlapping)
+        intervals = attendee.shift_intervals
+        assert intervals.total_minutes == len(attendee.shift_minutes) == 180
+        for minute, job in attendee.shift_minute_map.items():
+            assert intervals.job_at(minute) is job
+        assert intervals.job_at(c.EPOCH - timedelta(minutes=1)) is None
+        assert intervals.job_at(c.EPOCH + timedelta(hours=3)) is None
+
+    def test_overlaps(self):
+        intervals = ShiftIntervals([_job(1), _job(3)])
+        assert not intervals.overlaps(c.EPOCH, c.EPOCH + timedelta(hours=1))
+        assert not intervals.overlaps(c.EPOCH + timedelta(hours=2), c.EPOCH + timedelta(hours=3))
+        assert intervals.overlaps(c.EPOCH + timedelta(minutes=119), c.EPOCH + timedelta(hours=3))
+        assert not intervals.overlaps(c.EPOCH + timedelta(hours=1), c.EPOCH + timedelta(hours=1))
+
+    def test_minutes_between(self):
+        intervals = ShiftIntervals([_job(0), _job(2)])
+        assert intervals.minutes_between(c.EPOCH, c.EPOCH + timedelta(hours=3)) == 119
+        assert intervals.minutes_between(c.EPOCH - timedelta(minutes=1), c.EPOCH + timedelta(hours=2)) == 60
+        assert intervals.minutes_between(c.EPOCH + timedelta(hours=3), c.EPOCH + timedelta(hours=4)) == 0
+
+
+class TestNoOverlap:
+    def test_overlapping_shift(self):
+        assert not _job(1).no_overlap(_volunteer(_job(0, 90)))
+        assert _job(1).no_overlap(_volunteer(_job(0)))
+
+    def test_extra15_before(self):
+        arcade, console = Department(), Department()
+        assert not _job(1, department=console).no_overlap(_volunteer(_job(0, department=arcade, extra15=True)))
+        assert _job(1, department=arcade).no_overlap(_volunteer(_job(0, department=arcade, extra15=True)))
+
+    def test_extra15_after(self):
+        arcade, console = Department(), Department()
+        assert not _job(0, department=console, extra15=True).no_overlap(_volunteer(_job(1, department=arcade)))
+        assert _job(0, department=console).no_overlap(_volunteer(_job(1, department=arcade)))
+
+
+class TestWorkingLimit:
+    def test_consecutive_minutes(self):
+        dept = Department(max_consecutive_minutes=180)
+        assert _job(1, department=dept).working_limit_ok(_volunteer(_job(0, department=dept), _job(2, department=dept)))
+        assert _job(2, department=dept).working_limit_ok(_volunteer(_job(0, department=dept), _job(1, department=dept)))
+        assert not _job(2, 61, department=dept).working_limit_ok(
+            _volunteer(_job(0, department=dept), _job(1, department=dept)))
+
+    def test_smallest_limit_wins(self):
+        strict, lenient = Department(max_consecutive_minutes=119), Department(max_consecutive_minutes=0)
+        assert _job(1, department=lenient).working_limit_ok(_volunteer(_job(0, department=lenient)))
+        assert not _job(1, department=lenient).working_limit_ok(_volunteer(_job(0, department=strict)))
+
+
 @pytest.fixture
 def session(request):
     session = Session().session
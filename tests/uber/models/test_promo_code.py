@@ -4,7 +4,7 @@ import pytest
 import pytz
 from mock import Mock
 
-from uber.models import Attendee, Group, PromoCode, Session
+from uber.models import Attendee, Group, PromoCode, PromoCodeGroup, Session
 from uber.config import c
 from uber.utils import Charge, check
 
@@ -85,6 +85,38 @@ class TestPromoCodeUse:
             attendee.promo_code = None
 
 
+class TestPromoCodeGeneration:
+
+    def test_generate_code_skips_taken_codes(self):
+        generator = iter(['TEN DOLLARS OFF', 'abc', 'ten-dollars-off', 'def']).__next__
+        assert PromoCode._generate_code(generator, count=2) == {'abc', 'def'}
+
+    def test_generate_code_gives_up(self):
+        assert PromoCode._generate_code(lambda: 'free badge') is None
+
+    def test_insert_promo_codes(self):
+        generator = iter(['free badge', 'AAA-AAA', 'BBB-BBB', 'aaa aaa', 'CCC-CCC']).__next__
+        with Session() as session:
+            promo_code_ids = session.insert_promo_codes(3, generator, discount=5, uses_allowed='')
+            promo_codes = session.query(PromoCode).filter(PromoCode.id.in_(promo_code_ids)).all()
+            assert len(promo_code_ids) == 3
+            assert sorted(pc.code for pc in promo_codes) == ['AAA-AAA', 'BBB-BBB', 'CCC-CCC']
+            assert all(pc.discount == 5 and pc.uses_allowed is None for pc in promo_codes)
+            assert all(pc.expiration_date == PromoCode.normalize_expiration_date(c.ESCHATON) for pc in promo_codes)
+            session.rollback()
+
+    def test_add_codes_to_pc_group(self):
+        with Session() as session:
+            group = PromoCodeGroup(name='Bulk Group')
+            session.add_codes_to_pc_group(group, 3, cost=20)
+            assert len(group.promo_codes) == 3
+            assert len({pc.code for pc in group.promo_codes}) == 3
+            assert all(pc.cost == 20 and pc.uses_allowed == 1 for pc in group.promo_codes)
+            assert all(pc.created for pc in group.promo_codes)
+            assert session.info['badge_count_deltas']['paid_promo_codes'] == 3
+            session.rollback()
+
+
 class TestPromoCodeModelChecks:
 
     @pytest.mark.parametrize('discount,message', [
@@ -334,3 +366,25 @@ class TestPromoCodeSessionMixin:
             assert message == session.add_promo_code_to_attendee(a, code)
             assert a.promo_code_id == promo_code_id
             assert a.promo_code_code == promo_code_code
+
+    def test_resolve_promo_or_group_code(self, disambiguated_promo_code):
+        with Session() as session:
+            assert session.resolve_promo_or_group_code('olzsgb') == (disambiguated_promo_code, None)
+            assert session.resolve_promo_or_group_code('NONEXISTENT') == (None, None)
+            assert session.resolve_promo_or_group_code('') == (None, None)
+
+            group = PromoCodeGroup(name='Resolved Group', code='GRP-XYZ')
+            session.add_codes_to_pc_group(group, 2, cost=20)
+            assert session.resolve_promo_or_group_code('grp xyz') == (None, group)
+            session.rollback()
+
+    def test_lookup_promo_code_picks_unused_group_code(self):
+        with Session() as session:
+            group = PromoCodeGroup(name='Picked Group', code='GRP-PQR')
+            session.add_codes_to_pc_group(group, 2, cost=20)
+            first, second = sorted(pc.code for pc in group.promo_codes)
+
+            assert session.lookup_promo_code('grppqr').code == first
+            assert session.lookup_promo_code('grppqr', used_codes=[first]).code == second
+            assert session.lookup_promo_code('grppqr', used_codes=[first, second]) is None
+            session.rollback()
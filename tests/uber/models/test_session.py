@@ -3,7 +3,7 @@ from datetime import date, datetime, timedelta
 import pytest
 import pytz
 
-from uber.models import Attendee, Department, Group, Session
+from uber.models import Attendee, Department, Group, PrintJob, Session
 from uber.config import c
 from uber.utils import localized_now
 
@@ -91,3 +91,121 @@ def test_match_to_group(match_to_group_preconditions):
         assert [6, 7, 8, 9] == sorted([a.badge_num for a in group.attendees])
         session.match_to_group(late_comer, group)
         assert [6, 7, 8, 99] == sorted([a.badge_num for a in group.attendees])
+
+
+class TestPropertySearch:
+    def test_sql_condition(self):
+        with Session() as session:
+            results, message = session.property_search('last_name:Volunteer')
+            assert ['Regular Volunteer'] == [a.full_name for a in results]
+
+    def test_python_condition(self):
+        with Session() as session:
+            results, message = session.property_search('weighted_hours:0 AND last_name:Attendee')
+            assert ['Regular Attendee'] == [a.full_name for a in results]
+
+    def test_or_condition(self):
+        with Session() as session:
+            results, message = session.property_search('last_name:Volunteer OR weighted_hours:0 AND last_name:Attendee')
+            assert {'Regular Volunteer', 'Regular Attendee'} == {a.full_name for a in results}
+
+    def test_not_equal_matches_null(self):
+        with Session() as session:
+            results, message = session.property_search('badge_num:!=-1')
+            assert {a.id for a in session.valid_attendees()} == {a.id for a in results}
+
+    def test_invalid_attribute(self):
+        with Session() as session:
+            results, message = session.property_search('not_an_attribute:1')
+            assert results is None
+            assert 'not_an_attribute is not a valid attribute' in message
+
+    def test_eager_loads(self):
+        with Session() as session:
+            assert len(session._eager_loads(Attendee, ['weighted_hours', 'group', 'full_name'])) == 2
+            # Every declared path has to name real relationships
+            assert session._eager_loads(Attendee, Attendee.PROPERTY_RELATIONSHIPS)
+
+    def test_property_relationships_are_properties(self):
+        assert all(hasattr(Attendee, name) for name in Attendee.PROPERTY_RELATIONSHIPS)
+
+
+def test_attendee_stats():
+    with Session() as session:
+        before = session.attendee_stats()
+        session.add(Attendee(
+            first_name='Stats', last_name='One', paid=c.HAS_PAID, badge_type=c.ATTENDEE_BADGE,
+            ribbon='{},{}'.format(c.VOLUNTEER_RIBBON, c.DEALER_RIBBON)))
+        session.add(Attendee(
+            first_name='Stats', last_name='Two', paid=c.HAS_PAID, badge_type=c.ATTENDEE_BADGE,
+            ribbon=str(c.VOLUNTEER_RIBBON), checked_in=localized_now()))
+        session.flush()
+        after = session.attendee_stats()
+
+        volunteer, dealer = c.RIBBONS[c.VOLUNTEER_RIBBON], c.RIBBONS[c.DEALER_RIBBON]
+        assert after['ribbons'][volunteer] == before['ribbons'][volunteer] + 2
+        assert after['ribbons'][dealer] == before['ribbons'][dealer] + 1
+        assert after['checked_in']['yes'] == before['checked_in']['yes'] + 1
+        assert after['checked_in_by_type'][c.BADGES[c.ATTENDEE_BADGE]] == \
+            before['checked_in_by_type'][c.BADGES[c.ATTENDEE_BADGE]] + 1
+        assert after['noshows']['paid'] == before['noshows']['paid'] + 1
+        assert sum(after['statuses'].values()) == sum(before['statuses'].values()) + 2
+        session.rollback()
+
+
+def test_duplicate_registrations():
+    with Session() as session:
+        def registration(first_name, email, paid=c.HAS_PAID, badge_status=c.COMPLETED_STATUS, **params):
+            attendee = Attendee(first_name=first_name, last_name='Duplicate', email=email, paid=paid,
+                                badge_status=badge_status, **params)
+            session.add(attendee)
+            return attendee
+
+        first = registration('Dana', 'dana@example.com', registered=localized_now() - timedelta(days=1))
+        second = registration(' dana', 'DANA@example.com', paid=c.NOT_PAID)
+        registration('Dana', 'other@example.com')
+        registration('Robin', 'robin@example.com')
+        registration('Robin', 'robin@example.com', badge_status=c.NEW_STATUS)
+        session.commit()
+
+        dupes = list(session.duplicate_registrations())
+        assert dupes == [(('Dana Duplicate', 'dana@example.com'), [first, second])]
+
+
+def test_possible_match_list():
+    with Session() as session:
+        attendee = Attendee(first_name='Possible', last_name='Match', email='Possible@example.com',
+                            badge_status=c.COMPLETED_STATUS)
+        session.add(attendee)
+        session.commit()
+
+        possibles = session.possible_match_list([Attendee(first_name='Other', last_name='Match', email='')])
+        assert possibles['Possible', 'Match'] == [attendee]
+        assert possibles['possible@example.com'] == [attendee]
+        assert not session.possible_match_list([Attendee(first_name='No', last_name='One', email='none@example.com')])
+
+
+def test_claim_print_jobs():
+    with Session() as session:
+        attendee = Attendee(first_name='Print', last_name='Queue')
+        session.add(attendee)
+        jobs = [PrintJob(attendee_id=attendee.id, printer_id='printer{}'.format(i % 2), errors='', json_data={})
+                for i in range(5)]
+        session.add_all(jobs)
+        session.commit()
+
+        first = session.claim_print_jobs(['printer0'], count=2, station='station1', lease_seconds=60)
+        assert len(first) == 2
+        assert all(job.printer_id == 'printer0' and job.claimed_by == 'station1' and job.queued for job in first)
+
+        second = session.claim_print_jobs(['printer0'], count=2, station='station2', lease_seconds=60)
+        assert [job.id for job in second] == [job.id for job in jobs if job.printer_id == 'printer0'
+                                               and job not in first]
+        assert not session.claim_print_jobs(['printer0'], station='station3')
+
+        expired = first[0]
+        expired.lease_expires = datetime.now(pytz.UTC) - timedelta(seconds=1)
+        first[1].printed = datetime.now(pytz.UTC)
+        session.commit()
+        assert session.claim_print_jobs(['printer0'], station='station3') == [expired]
+        assert len(session.claim_print_jobs()) == 2
@@ -0,0 +1,85 @@
+from uber.config import c
+from uber.models import Attendee, CheckIn, Session, Tracking
+from uber.utils import localized_now
+
+
+def _tracking(session, attendee, action):
+    return session.query(Tracking).filter_by(fk_id=attendee.id, action=action) \
+        .order_by(Tracking.when.desc()).first()
+
+
+def test_created_and_updated():
+    with Session() as session:
+        attendee = Attendee(first_name='Tracked', last_name='Attendee')
+        session.add(attendee)
+        session.commit()
+
+        created = _tracking(session, attendee, c.CREATED)
+        assert "first_name='Tracked'" in created.data
+        assert created.delta['first_name'] == 'Tracked'
+        assert not created.snapshot
+
+        attendee.first_name = 'Changed'
+        session.commit()
+
+        updated = _tracking(session, attendee, c.UPDATED)
+        assert "'Tracked' -> 'Changed'" in updated.data
+        assert updated.delta['first_name'] == 'Changed'
+        assert 'last_name' not in updated.delta
+
+
+def test_queued_until_commit(monkeypatch):
+    queued = []
+    monkeypatch.setattr(c, 'ASYNC_TRACKING', True)
+    monkeypatch.setattr(Tracking, 'enqueue', classmethod(lambda cls, entries: queued.extend(entries)))
+    with Session() as session:
+        attendee = Attendee(first_name='Queued', last_name='Attendee')
+        session.add(attendee)
+        session.flush()
+        assert not queued
+        session.rollback()
+        assert not queued
+
+        session.add(Attendee(first_name='Queued', last_name='Attendee'))
+        session.commit()
+        assert [entry['action'] for entry in queued] == [c.CREATED]
+        assert session.query(Tracking).filter_by(which=queued[0]['which']).count() == 0
+
+        session.bulk_insert([Tracking.from_entry(queued[0])])
+        assert session.query(Tracking).get(queued[0]['id']).delta['first_name'] == 'Queued'
+
+
+def test_deleted_delta_can_be_undeleted():
+    with Session() as session:
+        attendee = Attendee(first_name='Deleted', last_name='Attendee')
+        session.add(attendee)
+        session.commit()
+        session.delete(attendee)
+        session.commit()
+
+        deleted = _tracking(session, attendee, c.DELETED)
+        assert deleted.data == 'id={}'.format(attendee.id)
+        assert deleted.delta['id'] == attendee.id
+        assert deleted.delta['first_name'] == 'Deleted'
+
+
+def test_check_ins_recorded():
+    with Session() as session:
+        attendee = Attendee(first_name='Checked', last_name='In', badge_type=c.STAFF_BADGE)
+        session.add(attendee)
+        session.commit()
+        assert session.query(CheckIn).filter_by(attendee_id=attendee.id).count() == 0
+
+        attendee.checked_in = localized_now()
+        session.commit()
+        check_in = session.query(CheckIn).filter_by(attendee_id=attendee.id).one()
+        assert check_in.badge_type == c.STAFF_BADGE
+        assert check_in.checked_in == attendee.checked_in
+
+        attendee.first_name = 'Still'
+        session.commit()
+        assert session.query(CheckIn).filter_by(attendee_id=attendee.id).count() == 1
+
+        attendee.checked_in = None
+        session.commit()
+        assert session.query(CheckIn).filter_by(attendee_id=attendee.id).count() == 0
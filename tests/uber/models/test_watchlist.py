@@ -1,9 +1,10 @@
-from datetime import date
+from datetime import date, datetime
 
 import pytest
 from dateutil import parser as dateparser
 
 from uber.models import Attendee, Session, WatchList
+from uber.watchlist import WatchlistIndex
 
 
 @pytest.fixture()
@@ -135,3 +136,50 @@ class TestGuessWatchListEntry:
         attendee = Attendee(**attendee_attrs)
         entries = watchlist_session.guess_attendee_watchentry(attendee)
         assert len(entries) == 0
+
+
+class TestWatchlistIndex:
+    @pytest.fixture
+    def index(self):
+        return WatchlistIndex([
+            WatchList(id='mcfly', first_names='Martin, Marty', last_name='McFly', email='88mph@example.com',
+                      birthdate=date(1968, 6, 12), active=True),
+            WatchList(id='tannen', first_names='Biff', last_name='Tannen', email='', birthdate=None, active=True),
+            WatchList(id='brown', first_names='Emmett', last_name='Brown', email='doc@example.com',
+                      birthdate=None, active=False),
+        ])
+
+    @pytest.mark.parametrize('first_name,last_name,email,birthdate,expected', [
+        ('Marty', 'Smith', '88MPH@example.com ', None, ['mcfly']),
+        ('Anonymous', 'mcfly', '', '1968-06-12', ['mcfly']),
+        ('Anonymous', 'McFly', '', datetime(1968, 6, 12, 10), ['mcfly']),
+        ('Anonymous', 'McFly', '', 'INVALID_DATE', []),
+        ('Mart', 'Smith', '88mph@example.com', None, []),
+        ('Biff', 'Tannen', '', None, []),
+        ('Emmett', 'Brown', 'doc@example.com', None, []),
+    ])
+    def test_match(self, index, first_name, last_name, email, birthdate, expected):
+        assert index.match(first_name, last_name, email, birthdate) == expected
+
+    def test_match_inactive(self, index):
+        assert index.match('Emmett', 'Brown', 'doc@example.com', None, active=False) == ['brown']
+        assert index.match('Marty', 'McFly', '88mph@example.com', None, active=False) == []
+
+    def test_match_all(self, index):
+        assert index.match_all([
+            ('a1', 'Marty', 'McFly', '88mph@example.com', None),
+            ('a2', 'Martin', 'Jones', '', date(1968, 6, 12)),
+            ('a3', 'Biff', 'Tannen', 'biff@example.com', None),
+        ]) == {'mcfly': ['a1', 'a2']}
+
+
+def test_guess_watchlist_attendees(watchlist_session):
+    entry = watchlist_session.query(WatchList).filter_by(last_name='McFly').one()
+    matched = Attendee(first_name='Marty', last_name='Smith', email='88mph@example.com')
+    confirmed = Attendee(first_name='Marty', last_name='McFly', email='88mph@example.com', watchlist_id=entry.id)
+    unmatched = Attendee(first_name='Marty', last_name='McFly', email='outatime@example.com')
+    watchlist_session.add_all([matched, confirmed, unmatched])
+    watchlist_session.commit()
+
+    assert watchlist_session.guess_watchlist_attendees() == {entry.id: [matched]}
+    assert watchlist_session.guess_watchentry_attendees(entry) == [matched]
@@ -0,0 +1,56 @@
+import json
+
+import cherrypy
+import pytest
+
+from uber.config import c, Config
+from uber.server import AngularJavascript
+
+
+def _parse(script):
+    return json.loads(script[script.index('{}, ') + len('{}, '):script.rindex(');')])
+
+
+@pytest.fixture
+def angular(monkeypatch):
+    monkeypatch.setattr(AngularJavascript, '_constants', None)
+    monkeypatch.setattr(cherrypy, 'session', {'csrf_token': 'fake-token'})
+    monkeypatch.setattr(cherrypy.request, 'headers', {})
+    monkeypatch.setattr(cherrypy.response, 'headers', {})
+    return AngularJavascript()
+
+
+def test_constants_are_built_once(angular):
+    js, content_hash = angular.constants()
+    assert angular.constants() == (js, content_hash)
+
+    consts = _parse(js[:js.index('\nangular.module')])
+    assert consts['ATTENDEE_BADGE'] == c.ATTENDEE_BADGE
+    assert 'CSRF_TOKEN' not in consts
+    assert not any(hasattr(getattr(Config, name, None), 'fget') for name in consts)
+    assert 'fake-token' not in js
+
+
+def test_constants_cache_headers(angular):
+    js, content_hash = angular.constants()
+    assert angular.constants_js(v=content_hash) == js
+    assert cherrypy.response.headers['ETag'] == '"{}"'.format(content_hash)
+    assert 'immutable' in cherrypy.response.headers['Cache-Control']
+
+    angular.constants_js(v='outdated')
+    assert cherrypy.response.headers['Cache-Control'] == 'no-cache'
+
+
+def test_dynamic_properties(angular):
+    consts = _parse(angular.properties_js(dynamic=True))
+    static_consts = _parse(angular.properties_js(dynamic=False))
+    assert not set(AngularJavascript.PER_REQUEST_PROPERTIES) & (set(consts) | set(static_consts))
+    assert 'fake-token' not in angular.properties_js(dynamic=True)
+    assert 'ATTENDEE_BADGE' not in consts
+    assert set(static_consts) <= set(consts)
+
+
+def test_magfest_js_sets_csrf_token(angular):
+    js = angular.magfest_js()
+    assert js.startswith('window.MAGFEST_CSRF_TOKEN = "fake-token";')
+    assert angular.constants()[0] in js
@@ -4,8 +4,10 @@ import cherrypy
 import pytest
 import pytz
 from cherrypy import HTTPError
+from mock import Mock
 
 from tests.uber.conftest import csrf_token
+from uber import api, server
 from uber.api import auth_by_token, auth_by_session, api_auth, all_api_auth
 from uber.config import c
 from uber.models import AdminAccount, Attendee, ApiToken, Session
@@ -409,3 +411,67 @@ class TestAllApiAuth(object):
             assert error.value._message.startswith(self.AUTH_BY_TOKEN_ERR)
         else:
             assert 'SUCCESS2' == service.func_2()
+
+
+class TestJsonRpcBatch(object):
+    class Service(object):
+        def __init__(self):
+            self.sessions = []
+
+        def echo(self, value):
+            return value
+
+        def fail(self):
+            raise ValueError('failed on purpose')
+
+        @api_auth('api_read')
+        def read(self):
+            with Session() as session:
+                self.sessions.append(session)
+            return 'read'
+
+    @pytest.fixture
+    def service(self, monkeypatch):
+        monkeypatch.setattr(server, '_record_jsonrpc_stats', Mock())
+        monkeypatch.setattr(api, '_check_api_auth', Mock(return_value=None))
+        return self.Service()
+
+    def call(self, monkeypatch, service, body):
+        monkeypatch.setattr(cherrypy.request, 'json', body, raising=False)
+        return server._make_jsonrpc_handler({'test': service})()
+
+    def test_errors_are_isolated(self, monkeypatch, service):
+        responses = self.call(monkeypatch, service, [
+            {'id': 1, 'method': 'test.echo', 'params': ['first']},
+            {'id': 2, 'method': 'test.fail'},
+            {'id': 3, 'method': 'test.missing'},
+            {'id': 4, 'method': 'test.echo', 'params': {'value': 'last'}}])
+
+        assert [r['id'] for r in responses] == [1, 2, 3, 4]
+        assert responses[0]['result'] == 'first'
+        assert 'failed on purpose' in responses[1]['error']['message']
+        assert responses[2]['error']['message'] == 'No function test.missing'
+        assert responses[3]['result'] == 'last'
+        assert cherrypy.response.status == 200
+
+        recorded = server._record_jsonrpc_stats.call_args[0][0]
+        assert [(method, failed) for method, seconds, failed in recorded] == [
+            ('test.echo', False), ('test.fail', True), ('test.echo', False)]
+
+    def test_read_only_calls_share_session_and_auth(self, monkeypatch, service):
+        responses = self.call(monkeypatch, service, [{'id': i, 'method': 'test.read'} for i in range(3)])
+        assert [r['result'] for r in responses] == ['read'] * 3
+        assert api._check_api_auth.call_count == 1
+        assert len(set(id(s) for s in service.sessions)) == 1
+        assert not hasattr(cherrypy.request, 'api_auth_checked')
+
+    def test_single_calls_are_separate(self, monkeypatch, service):
+        self.call(monkeypatch, service, {'id': 1, 'method': 'test.read'})
+        self.call(monkeypatch, service, {'id': 2, 'method': 'test.read'})
+        assert api._check_api_auth.call_count == 2
+        assert service.sessions[0] is not service.sessions[1]
+
+    def test_empty_batch(self, monkeypatch, service):
+        response = self.call(monkeypatch, service, [])
+        assert 'error' in response
+        assert cherrypy.response.status == 400
@@ -1,8 +1,14 @@
+import os
+import time
 import uuid
+from unittest.mock import MagicMock, Mock
 
 import pytest
+from sideboard.lib import config as sideboard_config
 
-from uber.decorators import id_required
+from uber import decorators
+from uber.config import c
+from uber.decorators import cached, cached_page, csv_file, id_required, invalidate_cached_pages, xlsx_file
 from uber.errors import HTTPRedirect
 from uber.models import Attendee, Group, Session
 
@@ -50,3 +56,100 @@ class TestIdRequired:
             assert _requires_model_id(**{
                 'session': session,
                 'id': model_id.hex})  # 'id' as a str instance
+
+
+class TestCsvFile:
+
+    @csv_file
+    def buffered(self, out, session):
+        for i in range(100):
+            out.writerow([i, 'Row {}'.format(i)])
+
+    @csv_file(stream=True)
+    def streamed(self, session):
+        for i in range(100):
+            yield [i, 'Row {}'.format(i)]
+
+    def test_streamed_output_matches(self):
+        assert self.streamed(None, set_headers=False) == self.buffered(None, set_headers=False)
+
+    def test_streamed_in_chunks(self, monkeypatch):
+        monkeypatch.setattr(decorators, 'CSV_STREAM_CHUNK_SIZE', 100)
+        chunks = list(decorators._stream_csv(TestCsvFile.streamed.__wrapped__, self, {}))
+        assert len(chunks) > 1
+        assert b''.join(chunks) == self.buffered(None, set_headers=False)
+
+    def test_site_mappable(self):
+        assert TestCsvFile.buffered.__wrapped__.site_mappable
+        assert TestCsvFile.streamed.__wrapped__.site_mappable
+
+
+def test_xlsx_rows_from_generator():
+    @xlsx_file
+    def report(self, out, session):
+        out.writerows(['Number', 'Name'], ([i, 'Row {}'.format(i)] for i in range(1000)))
+
+    output = report(None, None, set_headers=False)
+    assert output.startswith(b'PK')
+
+
+class TestCachedPage:
+    @pytest.fixture
+    def redis_store(self, monkeypatch):
+        store = MagicMock()
+        store.pipeline.return_value.get.return_value.hincrby.return_value.execute.return_value = [None, 1]
+        monkeypatch.setattr(c, 'REDIS_STORE', store)
+        return store
+
+    @pytest.fixture
+    def page(self, monkeypatch, tmpdir):
+        tmpdir.mkdir('data')
+        monkeypatch.setitem(sideboard_config, 'root', str(tmpdir))
+        render = Mock(return_value=b'rendered')
+
+        @cached(ttl=60, invalidated_by=['TestModel'])
+        def test_cached_page():
+            return render()
+
+        return render, cached_page(test_cached_page), str(tmpdir.join('data', __name__ + '.test_cached_page'))
+
+    def write_stale_copy(self, fpath):
+        with open(fpath, 'wb') as f:
+            f.write(b'stale')
+        os.utime(fpath, (time.time() - 120, time.time() - 120))
+
+    def test_miss_then_hit(self, redis_store, page):
+        render, page, fpath = page
+        assert page() == b'rendered'
+        assert page() == b'rendered'
+        assert render.call_count == 1
+
+    def test_stale_copy_served_while_locked(self, redis_store, page):
+        render, page, fpath = page
+        self.write_stale_copy(fpath)
+        redis_store.set.return_value = False
+        assert page() == b'stale'
+        assert not render.called
+
+    def test_stale_copy_regenerated(self, redis_store, page):
+        render, page, fpath = page
+        self.write_stale_copy(fpath)
+        redis_store.set.return_value = True
+        assert page() == b'rendered'
+        assert render.call_count == 1
+
+    def test_invalidated_copy_regenerated(self, redis_store, page):
+        render, page, fpath = page
+        assert page() == b'rendered'
+        redis_store.pipeline.return_value.get.return_value.hincrby.return_value.execute.return_value = [
+            str(time.time() + 1), 1]
+        assert page() == b'rendered'
+        assert render.call_count == 2
+
+    def test_invalidate(self, redis_store, page):
+        invalidate_cached_pages(['TestModel'])
+        assert redis_store.pipeline.return_value.setex.called
+
+    def test_invalidate_unrelated_model(self, redis_store, page):
+        invalidate_cached_pages(['Attendee'])
+        assert not redis_store.pipeline.return_value.setex.called
@@ -0,0 +1,54 @@
+from unittest.mock import MagicMock
+
+import pytest
+import redis
+
+from uber import push
+from uber.config import c
+
+
+@pytest.fixture
+def redis_store(monkeypatch):
+    store = MagicMock()
+    monkeypatch.setattr(c, 'REDIS_STORE', store)
+    monkeypatch.setattr(c, 'REDIS_PREFIX', 'test:')
+    monkeypatch.setattr(push, 'FALLBACK_POLL_SECONDS', 0.01)
+    return store
+
+
+def test_print_jobs_queued(redis_store):
+    push.print_jobs_queued(['printer1', 'printer1', 'printer2'])
+    assert sorted(call[0] for call in redis_store.publish.call_args_list) == [
+        ('test:push:print_jobs:printer1', ''), ('test:push:print_jobs:printer2', '')]
+
+
+def test_subscribes_before_checking(redis_store):
+    pubsub = redis_store.pubsub.return_value
+
+    def check():
+        pubsub.subscribe.assert_called_once_with('test:push:terminal:T1')
+        pubsub.psubscribe.assert_called_once_with('test:push:print_jobs:*')
+        return 'ready'
+
+    assert push.wait_for([push.terminal_channel('T1'), push.print_jobs_channel()], 5, check) == 'ready'
+    pubsub.get_message.assert_not_called()
+    pubsub.close.assert_called_once_with()
+
+
+def test_wakes_on_message(redis_store):
+    pubsub = redis_store.pubsub.return_value
+    pubsub.get_message.side_effect = [None, {'type': 'message'}]
+    results = iter([None, None, ['job']])
+    assert push.wait_for(['terminal:T1'], 5, lambda: next(results)) == ['job']
+    assert pubsub.get_message.call_count == 2
+
+
+def test_times_out(redis_store):
+    redis_store.pubsub.return_value.get_message.return_value = None
+    assert push.wait_for(['terminal:T1'], 0.05, lambda: []) == []
+
+
+def test_polls_without_redis(redis_store):
+    redis_store.pubsub.return_value.subscribe.side_effect = redis.exceptions.ConnectionError
+    results = iter([None, None, 'ready'])
+    assert push.wait_for(['terminal:T1'], 5, lambda: next(results)) == 'ready'
@@ -1,4 +1,5 @@
 from datetime import date, timedelta
+from uuid import uuid4
 
 import jinja2
 import pytest
@@ -6,9 +7,10 @@ import stripe
 from mock import Mock
 
 from uber.config import c
-from uber.models import Attendee, Group
+from uber.models import ApiJob, Attendee, AttendeeAccount, Group, Session
+from uber import utils
 from uber.utils import add_opt, convert_to_absolute_url, get_age_from_birthday, localized_now, \
-    remove_opt, normalize_newlines
+    remove_opt, normalize_newlines, TaskUtils, TokenBucket
 from uber.payments import Charge
 
 
@@ -214,3 +216,113 @@ class TestAgeCalculations:
     def test_default_today(self, birthdate_delta, expected):
         birthdate = localized_now() - birthdate_delta
         assert expected == get_age_from_birthday(birthdate)
+
+
+class TestTokenBucket:
+    @pytest.fixture
+    def clock(self, monkeypatch):
+        clock = Mock(now=100.0)
+        monkeypatch.setattr(utils.time, 'monotonic', lambda: clock.now)
+
+        def _sleep(seconds):
+            clock.now += seconds
+        monkeypatch.setattr(utils.time, 'sleep', Mock(side_effect=_sleep))
+        return clock
+
+    def test_burst_up_to_capacity(self, clock):
+        bucket = TokenBucket(rate=5)
+        for _ in range(5):
+            bucket.acquire()
+        assert not utils.time.sleep.called
+
+    def test_waits_for_refill(self, clock):
+        bucket = TokenBucket(rate=5)
+        for _ in range(6):
+            bucket.acquire()
+        utils.time.sleep.assert_called_once_with(pytest.approx(0.2))
+        assert clock.now == pytest.approx(100.2)
+
+
+class TestAttendeeImportBatch:
+    @pytest.fixture
+    def service(self, monkeypatch):
+        service = Mock()
+        service.attendee.export.return_value = {'attendees': [{
+            'id': 'remote-{}'.format(i),
+            'first_name': 'Imported',
+            'last_name': str(i),
+            'email': 'imported{}@example.com'.format(i),
+            'admin_notes': '',
+            'all_years': '',
+            'shirt': c.NO_SHIRT,
+            'badge_num': i,
+            'attendee_account_ids': ['remote-account'],
+        } for i in range(2)]}
+        service.attendee_account.export.return_value = {'accounts': [
+            {'id': 'remote-account', 'email': 'shared.account@example.com', 'hashed': ''}]}
+        monkeypatch.setattr(utils, 'get_api_service_from_server', Mock(return_value=(service, '', 'https://remote')))
+        return service
+
+    def test_one_export_call_per_batch(self, service):
+        jobs = [ApiJob(job_name='attendee_import', target_server='remote', api_token='token', errors='',
+                       query='remote-{}'.format(i), json_data={'badge_type': c.ATTENDEE_BADGE}) for i in range(3)]
+        assert TaskUtils.attendee_import_batch(jobs) == 2
+
+        service.attendee.export.assert_called_once_with('remote-0,remote-1,remote-2', True)
+        service.attendee_account.export.assert_called_once_with('remote-account', False)
+        assert all(job.completed for job in jobs[:2])
+        assert not jobs[2].completed and 'expected one attendee' in jobs[2].errors
+
+        with Session() as session:
+            imported = session.query(Attendee).filter_by(first_name='Imported').all()
+            assert len(imported) == 2
+            assert session.query(AttendeeAccount).filter_by(email='shared.account@example.com').count() == 1
+            assert all(len(attendee.managers) == 1 for attendee in imported)
+
+
+class TestGroupImportBatch:
+    @pytest.fixture
+    def service(self, monkeypatch):
+        group_ids = [str(uuid4()) for _ in range(2)]
+        service = Mock()
+        service.group.export.return_value = {'groups': [{
+            'id': id,
+            'name': 'Imported Group {}'.format(i),
+            'badges': 3,
+            'categories': '',
+        } for i, id in enumerate(group_ids)]}
+        service.group.export_attendees.side_effect = lambda id, full: {
+            'attendees': [{
+                'id': 'leader-' + id,
+                'first_name': 'Imported',
+                'last_name': 'Leader',
+                'email': 'leader.{}@example.com'.format(id),
+                'all_years': '',
+                'paid': c.PAID_BY_GROUP,
+                'attendee_account_ids': ['remote-account'],
+            }],
+            'group_leader_id': 'leader-' + id,
+            'unassigned_badge_type': c.ATTENDEE_BADGE,
+            'unassigned_ribbon': None,
+        }
+        service.attendee_account.export.return_value = {'accounts': [
+            {'id': 'remote-account', 'email': 'group.account@example.com', 'hashed': ''}]}
+        monkeypatch.setattr(utils, 'get_api_service_from_server', Mock(return_value=(service, '', 'https://remote')))
+        service.group_ids = group_ids
+        return service
+
+    def test_one_export_call_per_batch(self, service):
+        jobs = [ApiJob(job_name='group_import', target_server='remote', api_token='token', errors='',
+                       query=id, json_data={'all': True}) for id in service.group_ids + [str(uuid4())]]
+        assert TaskUtils.group_import_batch(jobs) == 2
+
+        service.group.export.assert_called_once_with(','.join(job.query for job in jobs), True)
+        service.attendee_account.export.assert_called_once_with('remote-account', False)
+        assert all(job.completed for job in jobs[:2])
+        assert not jobs[2].completed and 'expected one group' in jobs[2].errors
+
+        with Session() as session:
+            groups = session.query(Group).filter(Group.id.in_(service.group_ids)).all()
+            assert len(groups) == 2
+            assert all(group.badges == 3 and group.leader.last_name == 'Leader' for group in groups)
+            assert session.query(AttendeeAccount).filter_by(email='group.account@example.com').count() == 1
@@ -0,0 +1,41 @@
+import pytest
+
+from uber.zipcodes import ZipcodeIndex
+
+
+@pytest.fixture
+def index():
+    return ZipcodeIndex([
+        ('20745', 38.82, -76.99, 'Oxon Hill', 'MD'),
+        ('20001', 38.91, -77.02, 'Washington', 'DC'),
+        ('21201', 39.29, -76.62, 'Baltimore', 'MD'),
+        ('10001', 40.75, -73.99, 'New York', 'NY'),
+        ('00000', None, None, '', ''),
+    ])
+
+
+def test_get(index):
+    assert len(index) == 4
+    assert index.get('21201').city == 'Baltimore'
+    assert index.get('21201-1234').state == 'MD'
+    assert index.get(' 20001 ').city == 'Washington'
+    assert index.get('00000') is None
+    assert index.get('') is None
+    assert index.get(None) is None
+
+
+def test_states_by_zipcode(index):
+    assert index.states_by_zipcode() == {'20745': 'MD', '20001': 'DC', '21201': 'MD', '10001': 'NY'}
+
+
+@pytest.mark.parametrize('radius,expected', [
+    (1, ['20745']),
+    (10, ['20745', '20001']),
+    (50, ['20745', '20001', '21201']),
+    (500, ['20745', '20001', '21201', '10001']),
+])
+def test_within(index, radius, expected):
+    results = index.within(38.82, -76.99, radius)
+    assert [found.zipcode for found, miles in results] == expected
+    assert all(miles <= radius for found, miles in results)
+    assert [miles for found, miles in results] == sorted(miles for found, miles in results)
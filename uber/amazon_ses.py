@@ -5,8 +5,10 @@ import hmac
 import logging
 import base64
 import boto3
-import os
+import json
+import threading
 
+from botocore.config import Config
 from botocore.exceptions import ClientError
 from datetime import datetime
 from pockets.autolog import log
@@ -16,11 +18,86 @@ from uber.config import c
 
 
 class AmazonSES:
-    def __init__(self, region="us-east-1"):
-        os.environ["AWS_ACCESS_KEY_ID"] = c.AWS_ACCESS_KEY
-        os.environ["AWS_SECRET_ACCESS_KEY"] = c.AWS_SECRET_KEY
+    # SES accepts at most this many destinations per SendBulkTemplatedEmail call.
+    BULK_DESTINATION_LIMIT = 50
 
-        self._client = boto3.client('ses', region_name=region)
+    # Templates which pass a pre-rendered subject and body straight through, so
+    # that we can keep rendering our own Jinja templates and still send them in bulk.
+    PASSTHROUGH_TEMPLATES = {
+        'html': {'TemplateName': 'uber-passthrough-html', 'SubjectPart': '{{{subject}}}', 'HtmlPart': '{{{body}}}'},
+        'text': {'TemplateName': 'uber-passthrough-text', 'SubjectPart': '{{{subject}}}', 'TextPart': '{{{body}}}'},
+    }
+
+    def __init__(self, region="us-east-1", endpoint_url=None):
+        # Credentials are passed to this client only, rather than written into
+        # os.environ where every other boto3 client in the process would pick them up.
+        # The connection pool is sized so every email sending thread can keep its
+        # own connection open instead of reconnecting for each message.
+        self._client = boto3.client(
+            'ses',
+            region_name=region,
+            endpoint_url=endpoint_url or None,
+            aws_access_key_id=c.AWS_ACCESS_KEY or None,
+            aws_secret_access_key=c.AWS_SECRET_KEY or None,
+            config=Config(max_pool_connections=max(10, c.EMAIL_SEND_THREADS)))
+        self._templates_ready = set()
+        self._templates_lock = threading.Lock()
+
+    def _ensure_template(self, format):
+        with self._templates_lock:
+            if format in self._templates_ready:
+                return
+            template = self.PASSTHROUGH_TEMPLATES[format]
+            try:
+                self._client.create_template(Template=template)
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'AlreadyExists':
+                    raise
+                self._client.update_template(Template=template)
+            self._templates_ready.add(format)
+
+    def sendBulkEmail(self, source, format, destinations, returnPath=None):
+        """
+        Sends pre-rendered emails from one sender with a single SendBulkTemplatedEmail call.
+
+        Each destination is a dict with 'to', 'subject', and 'body' keys and optional
+        'cc' and 'bcc' address lists. Returns a list with one entry per destination, in
+        the same order: None if SES accepted that message, otherwise an error message.
+        """
+        assert len(destinations) <= self.BULK_DESTINATION_LIMIT, \
+            'SES accepts at most {} destinations per call'.format(self.BULK_DESTINATION_LIMIT)
+        format = 'text' if format == 'text' else 'html'
+
+        bulk_destinations = []
+        for destination in destinations:
+            addresses = {'ToAddresses': list(destination['to'])}
+            if destination.get('cc'):
+                addresses['CcAddresses'] = list(destination['cc'])
+            if destination.get('bcc'):
+                addresses['BccAddresses'] = list(destination['bcc'])
+            bulk_destinations.append({
+                'Destination': addresses,
+                'ReplacementTemplateData': json.dumps({
+                    'subject': destination['subject'], 'body': destination['body']}),
+            })
+
+        try:
+            self._ensure_template(format)
+            response = self._client.send_bulk_templated_email(
+                Source=source,
+                ReturnPath=returnPath or source,
+                Template=self.PASSTHROUGH_TEMPLATES[format]['TemplateName'],
+                DefaultTemplateData=json.dumps({'subject': '', 'body': ''}),
+                Destinations=bulk_destinations,
+            )
+            log.info("Sent {} bulk emails. Response: {}", len(destinations), response)
+        except ClientError as e:
+            return [e.response['Error']['Message']] * len(destinations)
+        except Exception as e:
+            return [e] * len(destinations)
+
+        return [None if status['Status'] == 'Success' else (status.get('Error') or status['Status'])
+                for status in response['Status']]
 
     def sendEmail(self, source, toAddresses, message, replyToAddresses=None, returnPath=None, ccAddresses=None, bccAddresses=None):
         params = { 'Source': source }
@@ -58,4 +135,4 @@ class AmazonSES:
         except Exception as e:
             return e
 
-email_sender = AmazonSES(c.AWS_REGION_EMAIL)
+email_sender = AmazonSES(c.AWS_REGION_EMAIL, endpoint_url=c.AWS_SES_ENDPOINT_URL)
@@ -25,6 +25,7 @@ from uber.errors import CSRFException
 from uber.models import AdminAccount, ApiToken, Attendee, AttendeeAccount, Department, DeptMembership, DeptMembershipRequest, \
     Event, IndieStudio, Job, Session, Shift, Group, GuestGroup, Room, HotelRequests, RoomAssignment
 from uber.models.badge_printing import PrintJob
+from uber.push import print_jobs_channel, wait_for
 from uber.server import register_jsonrpc
 from uber.utils import check, check_csrf, normalize_email, normalize_newlines
 
@@ -252,6 +253,16 @@ def auth_by_session(required_access):
     return None
 
 
+def _check_api_auth(required_access):
+    error = None
+    for auth in [auth_by_token, auth_by_session]:
+        result = auth(required_access)
+        error = error or result
+        if not result:
+            return None
+    return error
+
+
 def api_auth(*required_access):
     required_access = set(required_access)
 
@@ -264,13 +275,19 @@ def api_auth(*required_access):
 
         @wraps(fn)
         def _with_api_auth(*args, **kwargs):
-            error = None
-            for auth in [auth_by_token, auth_by_session]:
-                result = auth(required_access)
-                error = error or result
-                if not result:
-                    return fn(*args, **kwargs)
-            raise HTTPError(*error)
+            # JSON-RPC batches set this, so each access level is only checked once per batch
+            checked = getattr(cherrypy.request, 'api_auth_checked', None)
+            key = frozenset(required_access)
+            if checked is not None and key in checked:
+                error = checked[key]
+            else:
+                error = _check_api_auth(required_access)
+                if checked is not None:
+                    checked[key] = error
+
+            if error:
+                raise HTTPError(*error)
+            return fn(*args, **kwargs)
         return _with_api_auth
     return _decorator
 
@@ -1432,6 +1449,10 @@ class PrintJobLookup:
             if printer_ids:
                 printer_ids = [id.strip() for id in printer_ids.split(',')]
                 filters += [PrintJob.printer_id.in_(printer_ids)]
+
+            if not restart and not dry_run:
+                return {job.id: self._build_job_json_data(job) for job in session.claim_print_jobs(printer_ids)}
+
             if not restart:
                 filters += [PrintJob.queued == None]
             print_jobs = session.query(PrintJob).filter(*filters).all()
@@ -1449,10 +1470,55 @@ class PrintJobLookup:
                     if not dry_run:
                         job.queued = datetime.utcnow()
                         session.add(job)
-                        session.commit()
+            session.commit()
 
         return results
 
+    @api_auth('api_update')
+    def claim(self, printer_ids='', count=10, station='', lease_seconds=None, wait=0):
+        """
+        Claims pending print jobs for a badge printer station and returns their `json_data`.
+
+        Takes either a single printer ID or a comma-separated list of printer IDs as the first parameter.
+        If this is set, only print jobs whose printer_id match one of those in the list are claimed.
+
+        Takes the maximum number of jobs to claim as the second parameter, defaulting to 10.
+
+        Takes a name for the station claiming the jobs as the third parameter, which is recorded on the jobs.
+
+        Takes the number of seconds to lease the jobs for as the fourth parameter, defaulting to the
+        print_job_lease_seconds config option.  Jobs which haven't been marked as printed or given an error
+        by the end of their lease go back into the queue, so a station which crashes doesn't lose its jobs.
+
+        Takes the number of seconds to wait for a job as the fifth parameter, up to the long_poll_seconds
+        config option.  If there are no pending jobs, the call waits until a job is queued for one of the
+        printers or until the time runs out, so stations can call this in a loop instead of polling.
+
+        Several stations may claim jobs at the same time; each job is only claimed by one of them.
+
+        Returns a dictionary of claimed jobs' `json_data` plus job metadata, keyed by job ID.
+        """
+        try:
+            count = int(count)
+            lease_seconds = int(lease_seconds or c.PRINT_JOB_LEASE_SECONDS)
+            wait = min(int(wait or 0), c.LONG_POLL_SECONDS)
+        except ValueError:
+            raise HTTPError(400, "Count, lease seconds, and wait must be integers.")
+        if count < 1 or lease_seconds < 1:
+            raise HTTPError(400, "Count and lease seconds must be positive.")
+
+        printer_ids = [id.strip() for id in printer_ids.split(',') if id.strip()]
+        with Session() as session:
+            def claim():
+                return session.claim_print_jobs(printer_ids, count, station, lease_seconds)
+
+            if wait > 0:
+                channels = [print_jobs_channel(printer_id) for printer_id in printer_ids] or [print_jobs_channel()]
+                jobs = wait_for(channels, wait, claim)
+            else:
+                jobs = claim()
+            return {job.id: self._build_job_json_data(job) for job in jobs}
+
     @api_auth('api_create')
     def create(self, attendee_id, printer_id, reg_station, print_fee=None):
         """
@@ -18,6 +18,7 @@ import pathlib
 
 from pockets import listify
 from pytz import UTC
+from sqlalchemy import and_, not_, or_
 from sqlalchemy.orm import joinedload, subqueryload
 
 from uber.config import c
@@ -151,7 +152,7 @@ AutomatedEmailFixture(
     'reg_workflow/attendee_confirmation.html',
     lambda a: (a.paid == c.HAS_PAID and not a.promo_code_groups) or 
               (a.paid == c.NEED_NOT_PAY and (a.confirmed or a.promo_code_id)),
-    # query=Attendee.paid == c.HAS_PAID,
+    query=Attendee.paid.in_([c.HAS_PAID, c.NEED_NOT_PAY]),
     needs_approval=False,
     allow_at_the_con=True,
     ident='attendee_badge_confirmed')
@@ -162,6 +163,10 @@ AutomatedEmailFixture(
     'placeholders/deferred.html',
     lambda a: a.placeholder and a.registered_local <= c.PREREG_OPEN and \
               a.badge_type == c.ATTENDEE_BADGE and a.paid == c.NEED_NOT_PAY and not a.admin_account,
+    query=and_(
+        Attendee.placeholder == True,  # noqa: E712
+        Attendee.badge_type == c.ATTENDEE_BADGE,
+        Attendee.paid == c.NEED_NOT_PAY),
     when=after(c.PREREG_OPEN),
     ident='claim_deferred_badge')
 
@@ -189,7 +194,7 @@ AutomatedEmailFixture(
     '{EVENT_NAME} group payment received',
     'reg_workflow/group_confirmation.html',
     lambda g: g.amount_paid == g.cost * 100 and g.cost != 0 and g.leader_id,
-    # query=and_(Group.amount_paid >= Group.cost, Group.cost > 0, Group.leader_id != None),
+    query=and_(Group.cost != 0, Group.leader_id != None),  # noqa: E711
     needs_approval=False,
     ident='group_payment_received')
 
@@ -198,10 +203,7 @@ AutomatedEmailFixture(
     '{EVENT_NAME} group registration confirmed',
     'reg_workflow/attendee_confirmation.html',
     lambda a: a.group and (a.id != a.group.leader_id or a.group.cost == 0) and not a.placeholder,
-    # query=and_(
-    #     Attendee.placeholder == False,
-    #     Attendee.group_id != None,
-    #     or_(Attendee.id != Group.leader_id, Group.cost == 0)),
+    query=and_(Attendee.placeholder == False, Attendee.group_id != None),  # noqa: E711,E712
     needs_approval=False,
     allow_at_the_con=True,
     ident='attendee_group_reg_confirmation')
@@ -211,10 +213,7 @@ AutomatedEmailFixture(
     '{EVENT_NAME} merch pre-order received',
     'reg_workflow/group_donation.txt',
     lambda a: a.paid == c.PAID_BY_GROUP and a.amount_extra and a.amount_paid >= (a.amount_extra * 100),
-    # query=and_(
-    #     Attendee.paid == c.PAID_BY_GROUP,
-    #     Attendee.amount_extra != 0,
-    #     Attendee.amount_paid >= Attendee.amount_extra),
+    query=and_(Attendee.paid == c.PAID_BY_GROUP, Attendee.amount_extra != 0),
     needs_approval=False,
     sender=c.MERCH_EMAIL,
     ident='group_extra_payment_received')
@@ -233,10 +232,7 @@ AutomatedEmailFixture(
         and days_after(30, g.registered)()
         and g.unregistered_badges
         and not g.is_dealer),
-    # query=and_(
-    #     Group.unregistered_badges == True,
-    #     Group.is_dealer == False,
-    #     Group.registered < (func.now() - timedelta(days=30))),
+    query=and_(Group.unregistered_badges, not_(Group.is_dealer)),
     when=before(c.GROUP_PREREG_TAKEDOWN),
     needs_approval=False,
     ident='group_preassign_badges_reminder',
@@ -250,9 +246,7 @@ AutomatedEmailFixture(
       c.AFTER_GROUP_PREREG_TAKEDOWN
       and g.unregistered_badges
       and (not g.is_dealer or g.status == c.APPROVED)),
-    # query=and_(
-    #     Group.unregistered_badges == True,
-    #     or_(Group.is_dealer == False, Group.status == c.APPROVED)),
+    query=and_(Group.unregistered_badges, or_(not_(Group.is_dealer), Group.status == c.APPROVED)),
     when=after(c.GROUP_PREREG_TAKEDOWN),
     needs_approval=False,
     allow_at_the_con=True,
@@ -395,7 +389,7 @@ if c.MARKETPLACE_REG_START:
 # dealer registration has been turned on.
 
 class MarketplaceEmailFixture(AutomatedEmailFixture):
-    def __init__(self, subject, template, filter, ident, **kwargs):
+    def __init__(self, subject, template, filter, ident, query=(), **kwargs):
         AutomatedEmailFixture.__init__(
             self,
             Group,
@@ -403,7 +397,7 @@ class MarketplaceEmailFixture(AutomatedEmailFixture):
             template,
             lambda g: g.is_dealer and filter(g),
             ident,
-            # query=[Group.is_dealer == False] + listify(query),
+            query=[Group.is_dealer] + listify(query),
             sender=c.MARKETPLACE_EMAIL,
             **kwargs)
 
@@ -414,7 +408,7 @@ if c.DEALER_REG_START:
         'Your {} {} has been approved'.format(c.EVENT_NAME, c.DEALER_APP_TERM.capitalize()),
         'dealers/approved.html',
         lambda g: g.status == c.APPROVED,
-        # query=Group.status == c.APPROVED,
+        query=Group.status == c.APPROVED,
         needs_approval=True,
         ident='dealer_reg_approved')
 
@@ -422,6 +416,7 @@ if c.DEALER_REG_START:
         'Please complete your {} {}!'.format(c.EVENT_NAME, c.DEALER_APP_TERM.capitalize()),
         'dealers/signnow_request.html',
         lambda g: g.status == c.APPROVED and c.SIGNNOW_DEALER_TEMPLATE_ID and not g.signnow_document_signed,
+        query=Group.status == c.APPROVED,
         needs_approval=True,
         ident='dealer_signnow_email')
 
@@ -429,10 +424,7 @@ if c.DEALER_REG_START:
         'Reminder to pay for your {} {}'.format(c.EVENT_NAME, c.DEALER_REG_TERM.capitalize()),
         'dealers/payment_reminder.txt',
         lambda g: g.status == c.APPROVED and days_after(30, g.approved)() and g.is_unpaid,
-        # query=and_(
-        #     Group.status == c.APPROVED,
-        #     Group.approved < (func.now() - timedelta(days=30)),
-        #     Group.is_unpaid == True),
+        query=Group.status == c.APPROVED,
         needs_approval=True,
         ident='dealer_reg_payment_reminder')
 
@@ -442,7 +434,7 @@ if c.DEALER_REG_START:
                                                     c.DEALER_REG_TERM.capitalize()),
         'dealers/payment_reminder.txt',
         lambda g: g.status == c.APPROVED and g.is_unpaid,
-        # query=and_(Group.status == c.APPROVED, Group.is_unpaid == True),
+        query=Group.status == c.APPROVED,
         when=days_before(7, c.DEALER_PAYMENT_DUE, 2),
         needs_approval=True,
         ident='dealer_reg_payment_reminder_due_soon')
@@ -453,7 +445,7 @@ if c.DEALER_REG_START:
                                                         c.DEALER_REG_TERM.capitalize()),
         'dealers/payment_reminder.txt',
         lambda g: g.status == c.APPROVED and g.is_unpaid,
-        # query=and_(Group.status == c.APPROVED, Group.is_unpaid == True),
+        query=Group.status == c.APPROVED,
         when=days_before(2, c.DEALER_PAYMENT_DUE),
         needs_approval=True,
         ident='dealer_reg_payment_reminder_last_chance')
@@ -472,7 +464,7 @@ if c.DEALER_REG_START:
 # creates a "placeholder" registration.
 
 class StopsEmailFixture(AutomatedEmailFixture):
-    def __init__(self, subject, template, filter, ident, **kwargs):
+    def __init__(self, subject, template, filter, ident, query=(), **kwargs):
         AutomatedEmailFixture.__init__(
             self,
             Attendee,
@@ -480,7 +472,7 @@ class StopsEmailFixture(AutomatedEmailFixture):
             template,
             lambda a: a.staffing and filter(a),
             ident,
-            # query=[Attendee.staffing == True] + listify(query),
+            query=[Attendee.staffing == True] + listify(query),  # noqa: E712
             sender=c.STAFF_EMAIL,
             **kwargs)
 
@@ -490,7 +482,7 @@ AutomatedEmailFixture(
     '{EVENT_NAME} Panelist Badge Confirmation',
     'placeholders/panelist.txt',
     lambda a: a.placeholder and c.PANELIST_RIBBON in a.ribbon_ints,
-    # query=and_(Attendee.placeholder == True, Attendee.ribbon.like('%{}%'.format(c.PANELIST_RIBBON))),
+    query=and_(Attendee.placeholder == True, Attendee.ribbon.like('%{}%'.format(c.PANELIST_RIBBON))),  # noqa: E712
     sender=c.PANELS_EMAIL,
     ident='panelist_badge_confirmation')
 
@@ -500,7 +492,7 @@ AutomatedEmailFixture(
     'placeholders/guest.txt',
     lambda a: a.placeholder and a.badge_type == c.GUEST_BADGE and (
         not a.group or a.group.guest and a.group.guest.group_type == c.GUEST),
-    # query=and_(Attendee.placeholder == True, Attendee.badge_type == c.GUEST_BADGE),
+    query=and_(Attendee.placeholder == True, Attendee.badge_type == c.GUEST_BADGE),  # noqa: E712
     sender=c.GUEST_EMAIL,
     ident='guest_badge_confirmation')
 
@@ -509,12 +501,7 @@ AutomatedEmailFixture(
     '{} {} Information Required'.format(c.EVENT_NAME, c.DEALER_TERM.title()),
     'placeholders/dealer.txt',
     lambda a: a.placeholder and a.is_dealer and a.group.status == c.APPROVED,
-    # query=and_(
-    #     Attendee.placeholder == True,
-    #     Attendee.paid == c.PAID_BY_GROUP,
-    #     Group.id == Attendee.group_id,
-    #     Group.is_dealer == True,
-    #     Group.status == c.APPROVED))),
+    query=Attendee.placeholder == True,  # noqa: E712
     sender=c.MARKETPLACE_EMAIL,
     ident='dealer_info_required')
 
@@ -586,7 +573,7 @@ StopsEmailFixture(
         and a.badge_type != c.CONTRACTOR_BADGE
         and days_after(14, max(a.registered_local, c.SHIFTS_CREATED))()
         and a.takes_shifts
-        and not a.shift_minutes),
+        and not a.shift_intervals),
     when=before(c.PREREG_TAKEDOWN),
     ident='volunteer_shift_signup_reminder')
 
@@ -594,7 +581,7 @@ StopsEmailFixture(
     'Last chance to sign up for {EVENT_NAME} ({EVENT_DATE}) shifts',
     'shifts/reminder.txt',
     lambda a: c.AFTER_SHIFTS_CREATED and a.badge_type != c.CONTRACTOR_BADGE \
-        and (not c.PREREG_TAKEDOWN or c.BEFORE_PREREG_TAKEDOWN) and a.takes_shifts and not a.shift_minutes,
+        and (not c.PREREG_TAKEDOWN or c.BEFORE_PREREG_TAKEDOWN) and a.takes_shifts and not a.shift_intervals,
     when=days_before(10, c.EPOCH),
     ident='volunteer_shift_signup_reminder_last_chance')
 
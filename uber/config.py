@@ -1,8 +1,10 @@
 import ast
+import base64
 import hashlib
 import inspect
 import math
 import os
+import pickle
 import pytz
 import re
 import redis
@@ -10,6 +12,7 @@ import six
 import uuid
 from collections import defaultdict, OrderedDict
 from datetime import date, datetime, time, timedelta
+from functools import wraps
 from hashlib import sha512
 from markupsafe import Markup
 from itertools import chain
@@ -30,6 +33,116 @@ def dynamic(func):
     return func
 
 
+# Maps model names to the names of the shared_cache properties which are invalidated when those models change.
+_SHARED_CACHE_DEPENDENTS = defaultdict(set)
+_SHARED_CACHE_SETTINGS = {}
+
+
+def shared_cache(ttl=300, invalidated_by=(), per_admin=False):
+    """
+    Caches a Config property in Redis so that every worker process shares one
+    copy, rather than recomputing it for every request.  This goes underneath
+    @request_cached_property, which stays as the per-request cache and is the
+    only cache if Redis is unavailable:
+
+        @request_cached_property
+        @shared_cache(invalidated_by=['Department'])
+        @dynamic
+        def DEPARTMENT_OPTS(self):
+
+    Cached values expire after `ttl` seconds, and are deleted as soon as a
+    session which changed one of the models named in `invalidated_by` commits.
+    Set `per_admin` for values which depend on the logged-in admin account;
+    those are cached separately for each account and not at all outside of
+    an admin's request.  Values must be picklable.
+    """
+    def decorator(func):
+        name = func.__name__
+        for model_name in invalidated_by:
+            _SHARED_CACHE_DEPENDENTS[model_name].add(name)
+        _SHARED_CACHE_SETTINGS[name] = {'ttl': ttl, 'invalidated_by': list(invalidated_by), 'per_admin': per_admin}
+
+        @wraps(func)
+        def wrapper(self):
+            if not self.SHARED_CONFIG_CACHE:
+                return func(self)
+
+            variant = ''
+            if per_admin:
+                try:
+                    variant = cherrypy.session.get('account_id')
+                except AttributeError:
+                    variant = None
+                if not variant:
+                    return func(self)
+
+            key = '{}config_cache:{}:{}'.format(self.REDIS_PREFIX, name, variant)
+            stats_key = self.REDIS_PREFIX + 'config_cache_stats'
+            try:
+                cached, _ = self.REDIS_STORE.pipeline().get(key).hincrby(stats_key, name + ':lookups').execute()
+            except redis.exceptions.RedisError as e:
+                log.warning('Unable to read {} from the shared config cache: {}', name, e)
+                return func(self)
+
+            if cached is not None:
+                return pickle.loads(base64.b64decode(cached))
+
+            value = func(self)
+            try:
+                self.REDIS_STORE.pipeline() \
+                    .setex(key, ttl, base64.b64encode(pickle.dumps(value)).decode('ascii')) \
+                    .sadd('{}config_cache_keys:{}'.format(self.REDIS_PREFIX, name), key) \
+                    .hincrby(stats_key, name + ':misses') \
+                    .execute()
+            except redis.exceptions.RedisError as e:
+                log.warning('Unable to write {} to the shared config cache: {}', name, e)
+            return value
+        return wrapper
+    return decorator
+
+
+def invalidate_shared_cache(model_names=None):
+    """
+    Deletes every shared_cache value which depends on any of the given model
+    names, or every shared_cache value at all if no model names are given.
+    """
+    if model_names is None:
+        names = set(_SHARED_CACHE_SETTINGS)
+    else:
+        names = set(chain.from_iterable(_SHARED_CACHE_DEPENDENTS.get(m, ()) for m in model_names))
+    if not names:
+        return
+
+    try:
+        for name in names:
+            index_key = '{}config_cache_keys:{}'.format(c.REDIS_PREFIX, name)
+            keys = c.REDIS_STORE.smembers(index_key)
+            c.REDIS_STORE.delete(index_key, *keys)
+    except redis.exceptions.RedisError as e:
+        log.warning('Unable to invalidate the shared config cache for {}: {}', names, e)
+
+
+def shared_cache_stats():
+    """
+    Returns the settings and hit/miss counts of every shared_cache property,
+    sorted by name, for the devtools config cache page.
+    """
+    counts = c.REDIS_STORE.hgetall(c.REDIS_PREFIX + 'config_cache_stats')
+    stats = []
+    for name, settings in sorted(_SHARED_CACHE_SETTINGS.items()):
+        lookups = int(counts.get(name + ':lookups', 0))
+        misses = min(lookups, int(counts.get(name + ':misses', 0)))
+        stats.append(dict(
+            settings,
+            name=name,
+            lookups=lookups,
+            hits=lookups - misses,
+            misses=misses,
+            hit_rate=(lookups - misses) / lookups if lookups else None,
+            cached_keys=c.REDIS_STORE.scard('{}config_cache_keys:{}'.format(c.REDIS_PREFIX, name))))
+    return stats
+
+
 def create_namespace_uuid(s):
     return uuid.UUID(hashlib.sha1(s.encode('utf-8')).hexdigest()[:32])
 
@@ -216,14 +329,87 @@ class Config(_Overridable):
         attendees.  This counts uncompleted placeholder badges but NOT unpaid
         badges, since those have by definition not been promised to anyone.
         """
-        from uber.models import Session, Attendee
-        count = 0
+        return self.get_badge_counter('badge_type:{}'.format(badge_type))
+
+    # Lua script which only increments counters that already exist, so that a
+    # counter which hasn't been counted yet is never left holding a partial sum.
+    _INCR_EXISTING_COUNTERS = """
+        for i = 1, #ARGV, 2 do
+            if redis.call('HEXISTS', KEYS[1], ARGV[i]) == 1 then
+                redis.call('HINCRBY', KEYS[1], ARGV[i], ARGV[i + 1])
+            end
+        end
+    """
+
+    @property
+    def BADGE_COUNTERS_KEY(self):
+        return self.REDIS_PREFIX + 'badge_counts'
+
+    @property
+    def BADGE_COUNTER_FIELDS(self):
+        return ['badge_type:{}'.format(badge_type) for badge_type in self.BADGES] + [
+            'individual_badges_sold', 'group_badges_sold', 'paid_promo_codes', 'dealer_apps']
+
+    def get_badge_counter(self, field):
+        """
+        Returns one of the badge counters kept in Redis.  The session listeners in
+        uber.models keep these up to date as attendees, groups, and promo codes
+        change, and the reconcile_badge_counts task periodically recounts them to
+        correct any drift.  A counter is counted from the database the first time
+        it's read, and whenever Redis is unavailable.
+        """
+        try:
+            value = self.REDIS_STORE.hget(self.BADGE_COUNTERS_KEY, field)
+            if value is None:
+                value = self.count_badge_counter(field)
+                self.REDIS_STORE.hsetnx(self.BADGE_COUNTERS_KEY, field, value)
+            return int(value)
+        except redis.exceptions.RedisError as e:
+            log.warning('Unable to read badge counter {} from Redis: {}', field, e)
+            return self.count_badge_counter(field)
+
+    def increment_badge_counters(self, deltas):
+        """
+        Applies a dict of {field: delta} to the badge counters in Redis.  Counters
+        which haven't been counted yet are skipped.
+        """
+        if not deltas:
+            return
+        try:
+            args = [arg for field, delta in deltas.items() for arg in (field, delta)]
+            self.REDIS_STORE.eval(self._INCR_EXISTING_COUNTERS, 1, self.BADGE_COUNTERS_KEY, *args)
+        except redis.exceptions.RedisError as e:
+            log.warning('Unable to update badge counters in Redis: {}', e)
+
+    def count_badge_counter(self, field):
+        """
+        Counts one of the badge counters directly in the database.
+        """
+        from uber.models import Session, Attendee, Group, PromoCode, PromoCodeGroup
         with Session() as session:
-            count = session.query(Attendee).filter(
-                Attendee.paid != c.NOT_PAID,
-                Attendee.badge_type == badge_type,
-                Attendee.has_or_will_have_badge == True).count()
-        return count
+            if field.startswith('badge_type:'):
+                return session.query(Attendee).filter(
+                    Attendee.paid != c.NOT_PAID,
+                    Attendee.badge_type == int(field.split(':', 1)[1]),
+                    Attendee.has_or_will_have_badge == True).count()
+            elif field == 'individual_badges_sold':
+                return session.query(Attendee).filter(Attendee.has_badge == True, or_(
+                    Attendee.paid == self.HAS_PAID,
+                    Attendee.paid == self.REFUNDED)
+                ).filter(Attendee.badge_status == self.COMPLETED_STATUS).count()
+            elif field == 'group_badges_sold':
+                return session.query(Attendee).join(Attendee.group).filter(
+                    Attendee.has_badge == True,
+                    Attendee.paid == self.PAID_BY_GROUP,
+                    Group.amount_paid > 0).count()
+            elif field == 'paid_promo_codes':
+                return session.query(PromoCode).join(PromoCodeGroup).filter(PromoCode.cost > 0).count()
+            elif field == 'dealer_apps':
+                return session.query(Group).filter(
+                    Group.tables > 0,
+                    Group.cost > 0,
+                    Group.status == self.UNAPPROVED).count()
+        raise ValueError('Unknown badge counter {!r}'.format(field))
 
     def has_section_or_page_access(self, include_read_only=False, page_path=''):
         access = uber.models.AdminAccount.get_access_set(include_read_only=include_read_only)
@@ -275,12 +461,7 @@ class Config(_Overridable):
     @request_cached_property
     @dynamic
     def DEALER_APPS(self):
-        from uber.models import Session, Group
-        with Session() as session:
-            return session.query(Group).filter(
-                Group.tables > 0,
-                Group.cost > 0,
-                Group.status == self.UNAPPROVED).count()
+        return self.get_badge_counter('dealer_apps')
 
     @request_cached_property
     @dynamic
@@ -289,11 +470,7 @@ class Config(_Overridable):
         Adds paid promo codes to the badge count, since these are promised badges and this property is used for our
         badge sales cap. Free PC groups are excluded as they often have far more badges than will ever be claimed.
         """
-        from uber.models import Session, Attendee, Group, PromoCode, PromoCodeGroup
-        base_count = self.get_badge_count_by_type(c.ATTENDEE_BADGE)
-        with Session() as session:
-            pc_code_count = session.query(PromoCode).join(PromoCodeGroup).filter(PromoCode.cost > 0).count()
-        return base_count + pc_code_count
+        return self.get_badge_count_by_type(c.ATTENDEE_BADGE) + self.get_badge_counter('paid_promo_codes')
 
     @request_cached_property
     @dynamic
@@ -302,31 +479,29 @@ class Config(_Overridable):
         The number of badges that we've sold, including all badge types and promo code groups' badges.
         This is used for bucket-based pricing and to estimate year-over-year sales.
         """
-        from uber.models import Session, Attendee, Group, PromoCode, PromoCodeGroup
+        from uber.models import Session
         if self.BADGES_SOLD_ESTIMATE_ENABLED:
             with Session() as session:
                 attendee_count = int(session.execute(
                     "SELECT reltuples AS count FROM pg_class WHERE relname = 'attendee'").scalar())
 
-                # This will be efficient because we've indexed attendee(badge_type, badge_status)
                 staff_count = self.get_badge_count_by_type(c.STAFF_BADGE)
                 return max(0, attendee_count - staff_count)
         else:
-            with Session() as session:
-                attendees = session.query(Attendee)
-                individuals = attendees.filter(Attendee.has_badge == True, or_(
-                    Attendee.paid == self.HAS_PAID,
-                    Attendee.paid == self.REFUNDED)
-                ).filter(Attendee.badge_status == self.COMPLETED_STATUS).count()
-
-                group_badges = attendees.join(Attendee.group).filter(
-                    Attendee.has_badge == True,
-                    Attendee.paid == self.PAID_BY_GROUP,
-                    Group.amount_paid > 0).count()
-
-                promo_code_badges = session.query(PromoCode).join(PromoCodeGroup).filter(PromoCode.cost > 0).count()
+            return sum(map(self.get_badge_counter, ['individual_badges_sold', 'group_badges_sold', 'paid_promo_codes']))
 
-                return individuals + group_badges + promo_code_badges
+    @request_cached_property
+    @shared_cache(ttl=60)
+    @dynamic
+    def ATTENDEE_STATS(self):
+        """
+        The attendee counts for the statistics page; see Session.attendee_stats.
+        These change with every registration, so they're only cached for a
+        minute rather than invalidated on every Attendee save.
+        """
+        from uber.models import Session
+        with Session() as session:
+            return session.attendee_stats()
 
     @request_cached_property
     @dynamic
@@ -754,6 +929,7 @@ class Config(_Overridable):
         return dict(self.DEPARTMENT_OPTS)
 
     @request_cached_property
+    @shared_cache(invalidated_by=['Department'])
     @dynamic
     def DEPARTMENT_OPTS(self):
         from uber.models import Session, Department
@@ -762,6 +938,7 @@ class Config(_Overridable):
             return [(d.id, d.name) for d in query]
 
     @request_cached_property
+    @shared_cache(invalidated_by=['Department'])
     @dynamic
     def DEPARTMENT_OPTS_WITH_DESC(self):
         from uber.models import Session, Department
@@ -770,6 +947,7 @@ class Config(_Overridable):
             return [(d.id, d.name, d.description) for d in query]
 
     @request_cached_property
+    @shared_cache(invalidated_by=['Department'])
     @dynamic
     def PUBLIC_DEPARTMENT_OPTS_WITH_DESC(self):
         from uber.models import Session, Department
@@ -779,12 +957,22 @@ class Config(_Overridable):
             return [('All', 'Anywhere', 'I want to help anywhere I can!')] \
                 + [(d.id, d.name, d.description) for d in query]
 
+    @request_cached_property
+    @shared_cache(invalidated_by=['PromoCodeWord'])
+    @dynamic
+    def PROMO_CODE_WORDS(self):
+        from uber.models import Session, PromoCodeWord
+        with Session() as session:
+            return PromoCodeWord.group_by_parts_of_speech(
+                session.query(PromoCodeWord).order_by(PromoCodeWord.normalized_word).all())
+
     @request_cached_property
     @dynamic
     def ADMIN_DEPARTMENTS(self):
         return dict(self.ADMIN_DEPARTMENT_OPTS)
 
     @request_cached_property
+    @shared_cache(invalidated_by=['Department', 'DeptMembership', 'DeptRole', 'AdminAccount'], per_admin=True)
     @dynamic
     def ADMIN_DEPARTMENT_OPTS(self):
         from uber.models import Session, Department
@@ -871,6 +1059,7 @@ class Config(_Overridable):
         return dict(self.ACCESS_GROUP_OPTS)
 
     @request_cached_property
+    @shared_cache(invalidated_by=['AccessGroup'])
     @dynamic
     def ACCESS_GROUP_OPTS(self):
         from uber.models import Session, AccessGroup
@@ -900,6 +1089,7 @@ class Config(_Overridable):
         }
         
     @request_cached_property
+    @shared_cache(invalidated_by=['AdminAccount', 'AccessGroup'], per_admin=True)
     def SITE_MAP(self):
         public_site_sections, public_pages, pages = self.GETTABLE_SITE_PAGES
         
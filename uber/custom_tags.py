@@ -724,6 +724,24 @@ def csrf_token():
         '<input type="hidden" name="csrf_token" value="{}" />'.format(cherrypy.session.get("csrf_token")))
 
 
+@JinjaEnv.jinja_export
+def angular_constants(dynamic=True):
+    """
+    Loads the "magfest" Angular module with our constants, see AngularJavascript.
+    Pass dynamic=False to leave out the config properties which generate
+    database queries.
+    """
+    from uber.server import AngularJavascript
+    _, content_hash = AngularJavascript.constants()
+    scripts = [
+        '<script type="text/javascript">window.MAGFEST_CSRF_TOKEN = {};</script>'.format(json.dumps(c.CSRF_TOKEN)),
+        '<script type="text/javascript" src="../angular/constants.js?v={}"></script>'.format(content_hash),
+        '<script type="text/javascript" src="../angular/dynamic_constants.js{}"></script>'.format(
+            '' if dynamic else '?dynamic=false'),
+    ]
+    return safe_string('\n'.join(scripts))
+
+
 @JinjaEnv.jinja_export
 def stripe_form(action, model=None, text="Pay with Card", **params):
     new_params = {'params': {}, 'text': text}
@@ -5,7 +5,9 @@ import inspect
 import json
 import os
 import re
+import tempfile
 import threading
+import time
 import traceback
 import uuid
 import zipfile
@@ -13,10 +15,11 @@ from collections import defaultdict, OrderedDict
 from datetime import datetime
 from functools import wraps
 from io import StringIO, BytesIO
-from itertools import count
+from itertools import chain, count
 from threading import RLock
 
 import cherrypy
+import redis
 import six
 import xlsxwriter
 from pockets import argmod, unwrap
@@ -313,13 +316,11 @@ def xlsx_file(func):
 
     @wraps(func)
     def xlsx_out(self, session, set_headers=True, **kwargs):
-        rawoutput = BytesIO()
-
-        # Even though the final file will be in memory the module uses temp
-        # files during assembly for efficiency. To avoid this on servers that
-        # don't allow temp files, for example the Google APP Engine, set the
-        # 'in_memory' constructor option to True:
-        with xlsxwriter.Workbook(rawoutput, {'in_memory': False}) as workbook:
+        # The workbook is assembled in a temp file, and in constant_memory mode
+        # xlsxwriter flushes each row to disk as soon as we move on to the next
+        # one, so large reports never have the whole sheet in memory at once.
+        rawoutput = tempfile.TemporaryFile()
+        with xlsxwriter.Workbook(rawoutput, {'constant_memory': True}) as workbook:
             worksheet = workbook.add_worksheet()
 
             writer = ExcelWorksheetStreamWriter(workbook, worksheet)
@@ -328,21 +329,85 @@ def xlsx_file(func):
             # in the future, could pass in the workbook too
             func(self, writer, session, **kwargs)
 
-        output = rawoutput.getvalue()
+        rawoutput.seek(0)
+        if not set_headers:
+            with rawoutput:
+                return rawoutput.read()
 
         # set headers last in case there were errors, so end user still see error page
-        if set_headers:
-            cherrypy.response.headers['Content-Type'] = \
-                'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            _set_response_filename(func.__name__ + datetime.now().strftime('%Y%m%d') + '.xlsx')
-
-        return output
+        cherrypy.response.headers['Content-Type'] = \
+            'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        cherrypy.response.headers['Content-Length'] = os.fstat(rawoutput.fileno()).st_size
+        _set_response_filename(func.__name__ + datetime.now().strftime('%Y%m%d') + '.xlsx')
+        cherrypy.response.stream = True
+        return cherrypy.lib.file_generator(rawoutput)
     return xlsx_out
 
 
-def csv_file(func):
+CSV_STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def _stream_csv(func, self, kwargs):
+    """
+    Runs a streaming CSV report in its own database session, writing the rows
+    it yields and handing back the encoded output every CSV_STREAM_CHUNK_SIZE
+    characters or so.  The session stays open until the last row is written,
+    so reports can iterate over yield_per() queries.
+    """
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    with uber.models.Session() as session:
+        for row in func(self, session, **kwargs):
+            writer.writerow(row)
+            if buffer.tell() >= CSV_STREAM_CHUNK_SIZE:
+                yield buffer.getvalue().encode('utf-8')
+                buffer.seek(0)
+                buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def _primed(chunks):
+    """
+    Produces the first chunk right away, so anything which goes wrong while
+    the report is getting started (bad parameters, a broken query) still
+    happens during the request and shows the usual error page.
+    """
+    first = next(chunks, b'')
+
+    def stream():
+        yield first
+        yield from chunks
+    return stream()
+
+
+def csv_file(func=None, stream=False):
+    """
+    Outputs the rows a page handler writes to `out` as a CSV download::
+
+        @csv_file
+        def attendees(self, out, session):
+            for a in session.query(Attendee).all():
+                out.writerow([a.full_name, a.email])
+
+    Very large reports can instead stream their output to the browser as it's
+    generated.  These handlers are generators which take no `out` and yield
+    each row, and they're given their own session which stays open until the
+    download finishes::
+
+        @csv_file(stream=True)
+        def attendees(self, session):
+            for a in session.query(Attendee).yield_per(1000):
+                yield [a.full_name, a.email]
+
+    Either way, calling the page with set_headers=False returns the whole file
+    as bytes, e.g. to add it to a zip file.
+    """
+    if func is None:
+        return lambda func: csv_file(func, stream=stream)
+
     parameters = inspect.getargspec(func)
-    if len(parameters[0]) == 3:
+    if len(parameters[0]) == (2 if stream else 3):
         func.site_mappable = True
         func.site_map_download = True
 
@@ -350,14 +415,21 @@ def csv_file(func):
 
     @wraps(func)
     def csvout(self, session, set_headers=True, **kwargs):
-        writer = StringIO()
-        func(self, csv.writer(writer), session, **kwargs)
-        output = writer.getvalue().encode('utf-8')
+        if stream:
+            if not set_headers:
+                return b''.join(_stream_csv(func, self, kwargs))
+            output = _primed(_stream_csv(func, self, kwargs))
+        else:
+            writer = StringIO()
+            func(self, csv.writer(writer), session, **kwargs)
+            output = writer.getvalue().encode('utf-8')
 
         # set headers last in case there were errors, so end user still see error page
         if set_headers:
             cherrypy.response.headers['Content-Type'] = 'application/csv'
             _set_response_filename(func.__name__ + datetime.now().strftime('%Y%m%d') + '.csv')
+            if stream:
+                cherrypy.response.stream = True
 
         return output
     return csvout
@@ -414,36 +486,216 @@ def credit_card(func):
     return charge
 
 
-def cached(func):
-    func.cached = True
+# Maps model names to the names of the cached pages which are invalidated when those models change.
+_CACHED_PAGE_DEPENDENTS = defaultdict(set)
+_CACHED_PAGE_SETTINGS = {}
+
+# How long one worker may spend regenerating a cached page before another is allowed to try.
+CACHED_PAGE_LOCK_TIMEOUT = 120
+
+
+def cached(func=None, ttl=60 * 15, invalidated_by=()):
+    """
+    Marks a page handler to be cached on disk by cached_page, e.g.
+
+        @cached(ttl=300, invalidated_by=['Event'])
+        def index(self, session):
+
+    The page is regenerated once it's `ttl` seconds old, or as soon as a
+    session which changed one of the models named in `invalidated_by` commits.
+    It may also be used bare, as @cached, for the default 15 minute TTL.
+    """
+    if func is None:
+        return lambda func: cached(func, ttl=ttl, invalidated_by=invalidated_by)
+
+    func.cached = {'ttl': ttl, 'invalidated_by': list(invalidated_by)}
     return func
 
 
+def _cached_page_key(kind, name):
+    return '{}cached_page_{}:{}'.format(c.REDIS_PREFIX, kind, name)
+
+
+def _read_cached_page(fpath):
+    try:
+        with open(fpath, 'rb') as f:
+            return f.read(), os.fstat(f.fileno()).st_mtime
+    except FileNotFoundError:
+        return None, None
+
+
+def _write_cached_page(fpath, contents, generated_at):
+    # Try to write assuming content is a byte first, then try it as a string
+    if not isinstance(contents, bytes):
+        contents = bytes(contents, 'UTF-8')
+
+    # Write to a temp file and move it into place, so other workers never read half a page.  The
+    # mtime is when we started rendering, so a change committed while we rendered still invalidates it.
+    tmp_path = '{}.{}.tmp'.format(fpath, uuid.uuid4().hex)
+    with open(tmp_path, 'wb') as f:
+        f.write(contents)
+    os.utime(tmp_path, (generated_at, generated_at))
+    os.replace(tmp_path, fpath)
+    return contents
+
+
+def _cached_page_is_fresh(name, ttl, mtime):
+    """
+    Returns whether a page written at `mtime` (None if there's no copy) may
+    still be served, and counts the lookup towards that page's statistics.
+    """
+    current = mtime is not None and time.time() - mtime <= ttl
+    try:
+        invalidated_at, _ = c.REDIS_STORE.pipeline() \
+            .get(_cached_page_key('invalidated', name)) \
+            .hincrby(c.REDIS_PREFIX + 'cached_page_stats', name + ':lookups') \
+            .execute()
+    except redis.exceptions.RedisError as e:
+        log.warning('Unable to check whether cached page {} was invalidated: {}', name, e)
+        return current
+    return current and (not invalidated_at or float(invalidated_at) < mtime)
+
+
+def _count_cached_page(name, outcome):
+    try:
+        c.REDIS_STORE.hincrby(c.REDIS_PREFIX + 'cached_page_stats', '{}:{}'.format(name, outcome))
+    except redis.exceptions.RedisError:
+        pass
+
+
+class _CachedPageLock:
+    """
+    A lock shared by every worker process through Redis, so only one of them
+    regenerates a page at a time.  If Redis is unavailable this falls back to
+    a lock which is only shared by the threads of this process.
+    """
+    def __init__(self, name, local_lock):
+        self.key = _cached_page_key('lock', name)
+        self.token = uuid.uuid4().hex
+        self.local_lock = local_lock
+        self.held_locally = False
+
+    def acquire(self, blocking):
+        try:
+            return bool(c.REDIS_STORE.set(self.key, self.token, nx=True, ex=CACHED_PAGE_LOCK_TIMEOUT))
+        except redis.exceptions.RedisError as e:
+            log.warning('Unable to lock cached page {}, using a process-local lock: {}', self.key, e)
+            self.held_locally = self.local_lock.acquire(blocking, CACHED_PAGE_LOCK_TIMEOUT if blocking else -1)
+            return self.held_locally
+
+    def release(self):
+        if self.held_locally:
+            self.local_lock.release()
+            return
+        try:
+            # Only delete the lock if it's still ours, i.e. it didn't time out and get taken by someone else.
+            with c.REDIS_STORE.pipeline() as pipe:
+                pipe.watch(self.key)
+                if pipe.get(self.key) == self.token:
+                    pipe.multi()
+                    pipe.delete(self.key)
+                    pipe.execute()
+        except redis.exceptions.RedisError as e:
+            log.warning('Unable to release the lock on cached page {}: {}', self.key, e)
+
+
 def cached_page(func):
+    """
+    Caches pages marked with @cached in <root>/data, shared by every worker
+    process on the host.  When a page goes stale, one worker regenerates it
+    while every other request is served the stale copy, and requests only
+    wait for the page if there's no copy to serve at all.
+    """
     innermost = unwrap(func)
     if hasattr(innermost, 'cached'):
         from sideboard.lib import config as sideboard_config
         func.lock = RLock()
 
+        name = func.__module__ + '.' + func.__name__
+        settings = innermost.cached if isinstance(innermost.cached, dict) else {'ttl': 60 * 15, 'invalidated_by': []}
+        for model_name in settings['invalidated_by']:
+            _CACHED_PAGE_DEPENDENTS[model_name].add(name)
+        _CACHED_PAGE_SETTINGS[name] = settings
+        ttl = settings['ttl']
+
         @wraps(func)
         def with_caching(*args, **kwargs):
-            fpath = os.path.join(sideboard_config['root'], 'data', func.__module__ + '.' + func.__name__)
-            with func.lock:
-                if not os.path.exists(fpath) or datetime.now().timestamp() - os.stat(fpath).st_mtime > 60 * 15:
-                    contents = func(*args, **kwargs)
-                    with open(fpath, 'wb') as f:
-                        # Try to write assuming content is a byte first, then try it as a string
-                        try:
-                            f.write(contents)
-                        except Exception:
-                            f.write(bytes(contents, 'UTF-8'))
-                with open(fpath, 'rb') as f:
-                    return f.read()
+            fpath = os.path.join(sideboard_config['root'], 'data', name)
+            contents, mtime = _read_cached_page(fpath)
+            if _cached_page_is_fresh(name, ttl, mtime):
+                return contents
+
+            lock = _CachedPageLock(name, func.lock)
+            give_up_at = time.time() + CACHED_PAGE_LOCK_TIMEOUT
+            while not lock.acquire(blocking=contents is None):
+                if contents is not None:
+                    _count_cached_page(name, 'stale')
+                    return contents
+
+                # Someone else is generating this page for the first time, so wait for them to finish.
+                time.sleep(0.25)
+                contents, mtime = _read_cached_page(fpath)
+                if contents is not None:
+                    return contents
+                if time.time() > give_up_at:
+                    log.warning('Timed out waiting for cached page {}, generating it anyway', name)
+                    break
+
+            try:
+                generated_at = time.time()
+                _count_cached_page(name, 'misses')
+                return _write_cached_page(fpath, func(*args, **kwargs), generated_at)
+            finally:
+                lock.release()
         return with_caching
     else:
         return func
 
 
+def invalidate_cached_pages(model_names=None):
+    """
+    Marks every cached page which depends on any of the given model names as
+    stale, or every cached page at all if no model names are given.  Stale
+    pages are still served until one worker finishes regenerating them.
+    """
+    if model_names is None:
+        names = set(_CACHED_PAGE_SETTINGS)
+    else:
+        names = set(chain.from_iterable(_CACHED_PAGE_DEPENDENTS.get(m, ()) for m in model_names))
+    if not names:
+        return
+
+    try:
+        pipe = c.REDIS_STORE.pipeline()
+        for name in names:
+            pipe.setex(_cached_page_key('invalidated', name), _CACHED_PAGE_SETTINGS[name]['ttl'], time.time())
+        pipe.execute()
+    except redis.exceptions.RedisError as e:
+        log.warning('Unable to invalidate cached pages {}: {}', names, e)
+
+
+def cached_page_stats():
+    """
+    Returns the settings and hit/miss counts of every cached page, sorted by
+    name, for the devtools cache page.
+    """
+    counts = c.REDIS_STORE.hgetall(c.REDIS_PREFIX + 'cached_page_stats')
+    stats = []
+    for name, settings in sorted(_CACHED_PAGE_SETTINGS.items()):
+        lookups = int(counts.get(name + ':lookups', 0))
+        stale = int(counts.get(name + ':stale', 0))
+        misses = int(counts.get(name + ':misses', 0))
+        stats.append(dict(
+            settings,
+            name=name,
+            lookups=lookups,
+            hits=max(0, lookups - stale - misses),
+            stale=stale,
+            misses=misses,
+            hit_rate=max(0, lookups - misses) / lookups if lookups else None))
+    return stats
+
+
 def run_threaded(thread_name='', lock=None, blocking=True, timeout=-1):
     """
     Decorate a function to run in a new thread and return immediately.
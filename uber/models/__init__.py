@@ -2,11 +2,14 @@ import json
 import operator
 import os
 import re
+import threading
 import uuid
-from collections import defaultdict
-from datetime import date, datetime, timedelta
+from bisect import bisect_left, bisect_right
+from collections import defaultdict, OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 from functools import wraps
-from itertools import chain
+from itertools import chain, groupby
 from uuid import uuid4
 
 import bcrypt
@@ -20,16 +23,19 @@ from pytz import UTC
 from residue import check_constraint_naming_convention, declarative_base, JSON, SessionManager, UTCDateTime, UUID
 from sideboard.lib import on_startup, stopped
 from sqlalchemy import and_, func, or_, not_
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.dialects.postgresql.json import JSONB
 from sqlalchemy.event import listen
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm import Query, joinedload, subqueryload, aliased
+from sqlalchemy.orm import Query, joinedload, selectinload, subqueryload, aliased
 from sqlalchemy.orm.attributes import get_history, instance_state
-from sqlalchemy.schema import MetaData
+from sqlalchemy.schema import DDL, MetaData
 from sqlalchemy.types import Boolean, Integer, Float, Date, Numeric
 from sqlalchemy.util import immutabledict
 
 import uber
+import uber.push
+import uber.watchlist
 from uber.config import c, create_namespace_uuid
 from uber.errors import HTTPRedirect
 from uber.decorators import cost_property, department_id_adapter, presave_adjustment, suffix_property
@@ -79,6 +85,10 @@ if not c.SQLALCHEMY_URL.startswith('sqlite'):
 
 metadata = MetaData(naming_convention=immutabledict(naming_convention))
 
+if not c.SQLALCHEMY_URL.startswith('sqlite'):
+    # Our trigram indexes (used by Session.search) need this extension to exist first
+    listen(metadata, 'before_create', DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+
 
 @declarative_base(metadata=metadata)
 class MagModel:
@@ -569,7 +579,7 @@ from uber.models.art_show import *  # noqa: F401,E402,F403
 # Explicitly import models used by the Session class to quiet flake8
 from uber.models.admin import AccessGroup, AdminAccount, WatchList  # noqa: E402
 from uber.models.art_show import ArtShowApplication  # noqa: E402
-from uber.models.attendee import Attendee  # noqa: E402
+from uber.models.attendee import Attendee, BadgeGap  # noqa: E402
 from uber.models.department import Job, Shift, Department  # noqa: E402
 from uber.models.email import Email  # noqa: E402
 from uber.models.group import Group  # noqa: E402
@@ -594,6 +604,43 @@ class Session(SessionManager):
         ('pool_recycle', c.SQLALCHEMY_POOL_RECYCLE)] if v > -1)
     engine = sqlalchemy.create_engine(c.SQLALCHEMY_URL, **_engine_kwargs)
 
+    _shared_session = threading.local()
+
+    def __init__(self):
+        self.is_shared = getattr(Session._shared_session, 'session', None) is not None
+        if self.is_shared:
+            self.session = Session._shared_session.session
+        else:
+            super(Session, self).__init__()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if not self.is_shared:
+            return super(Session, self).__exit__(exc_type, exc_value, traceback)
+        if exc_type is not None:
+            self.session.rollback()
+
+    def __del__(self):
+        if not self.is_shared:
+            super(Session, self).__del__()
+
+    @classmethod
+    @contextmanager
+    def shared(cls):
+        """
+        Within this block, every `with Session() as session` on this thread
+        gets the same session, which is committed once at the end of the block
+        instead of by each of them.  If one of them raises an exception, the
+        shared session is rolled back so the next one starts from a clean
+        transaction.  JSON-RPC batches use this to run their read-only calls
+        together.
+        """
+        with cls() as session:
+            cls._shared_session.session = session
+            try:
+                yield session
+            finally:
+                cls._shared_session.session = None
+
     @classmethod
     def initialize_db(cls, modify_tables=False, drop=False, initialize=False):
         """
@@ -648,11 +695,25 @@ class Session(SessionManager):
 
             return self.column_descriptions[0]['type']
 
+        _search_rank = None
+
+        def ranked_by(self, rank):
+            """
+            Orders a search by `rank`, until .order() is called with the
+            columns the caller wants to sort by, after which `rank` only
+            breaks ties between rows which sort the same.
+            """
+            query = self.order_by(rank)
+            query._search_rank = rank
+            return query
+
         def order(self, attrs):
             order = []
             for attr in listify(attrs):
                 col = getattr(self.model, attr.lstrip('-'))
                 order.append(col.desc() if attr.startswith('-') else col)
+            if self._search_rank is not None:
+                return self.order_by(None).order_by(*order, self._search_rank)
             return self.order_by(*order)
 
         def icontains_condition(self, attr=None, val=None, **filters):
@@ -894,23 +955,116 @@ class Session(SessionManager):
                 'weighted_hours', 'restricted', 'extra15', 'taken',
                 'visibility', 'is_public', 'is_setup', 'is_teardown']
             jobs = self.logged_in_volunteer().possible_and_current
-            restricted_minutes = set()
+            restricted_times = set()
             for job in jobs:
                 if job.required_roles:
-                    restricted_minutes.add(frozenset(job.minutes))
+                    restricted_times.add((job.start_time, job.end_time))
             if all:
                 return [job.to_dict(fields) for job in jobs]
             return [
                 job.to_dict(fields)
-                for job in jobs if (job.required_roles or frozenset(job.minutes) not in restricted_minutes)]
+                for job in jobs if (job.required_roles or (job.start_time, job.end_time) not in restricted_times)]
+
+        def possible_match_list(self, people=None):
+            """
+            Returns a dict mapping lowercased emails and (first_name, last_name)
+            tuples to the valid attendees who have them.  Pass the people we're
+            looking for (anything with first_name, last_name, and email) to only
+            load the attendees who could match them.
+            """
+            attendees = self.valid_attendees()
+            if people is not None:
+                people = list(people)
+                emails = {person.email.lower() for person in people if person.email}
+                last_names = {person.last_name for person in people if person.last_name}
+                if not emails and not last_names:
+                    return defaultdict(list)
+                attendees = attendees.filter(or_(
+                    func.lower(Attendee.email).in_(list(emails)),
+                    Attendee.last_name.in_(list(last_names))))
 
-        def possible_match_list(self):
             possibles = defaultdict(list)
-            for a in self.valid_attendees():
+            for a in attendees:
                 possibles[a.email.lower()].append(a)
                 possibles[a.first_name, a.last_name].append(a)
             return possibles
 
+        def _duplicate_candidates(self):
+            """
+            Completed registrations which the duplicates report considers,
+            with their normalized name and email, skipping attendees in
+            dealer groups which are still waitlisted or unapproved.
+            """
+            return self.query(
+                Attendee.id.label('id'),
+                func.lower(func.trim(Attendee.first_name) + ' ' + func.trim(Attendee.last_name)).label('name_key'),
+                func.lower(func.trim(Attendee.email)).label('email_key'),
+            ).outerjoin(Attendee.group).filter(
+                Attendee.first_name != '',
+                Attendee.badge_status == c.COMPLETED_STATUS,
+                or_(Attendee.group_id == None,  # noqa: E711
+                    not_(Group.is_dealer),
+                    not_(Group.status.in_([c.WAITLISTED, c.UNAPPROVED]))))
+
+        def _stream_clusters(self, query, cluster_key):
+            """
+            Groups the Attendees from (Attendee, key...) rows, which must be
+            ordered by key, into (key, [Attendee, ...]) clusters while streaming
+            the rows from the database.
+            """
+            rows = query.options(joinedload(Attendee.group)).yield_per(500)
+            for key, cluster in groupby(rows, key=cluster_key):
+                yield key, [row[0] for row in cluster]
+
+        def duplicate_registrations(self):
+            """
+            Yields a ((full_name, email), [Attendee, ...]) tuple for every
+            group of completed registrations with the same name and email,
+            oldest registration first.  Names and emails are compared trimmed
+            and case-insensitively.
+
+            The counting is done with a window function, so only attendees who
+            actually have a duplicate are sent back, and they're streamed one
+            cluster at a time rather than loaded all at once.
+            """
+            keys = self._duplicate_candidates().subquery()
+            candidates = self.query(keys, func.count().over(
+                partition_by=[keys.c.name_key, keys.c.email_key]).label('copies')).subquery()
+
+            query = self.query(Attendee, candidates.c.name_key, candidates.c.email_key) \
+                .join(candidates, Attendee.id == candidates.c.id) \
+                .filter(candidates.c.copies > 1) \
+                .order_by(candidates.c.name_key, candidates.c.email_key, Attendee.registered, Attendee.id)
+
+            for _, attendees in self._stream_clusters(query, lambda row: row[1:]):
+                yield (attendees[0].full_name, attendees[0].email.lower()), attendees
+
+        def near_duplicate_registrations(self, similarity):
+            """
+            Yields a ((full_names, email), [Attendee, ...]) tuple for every
+            email address shared by completed registrations whose names are
+            different but have a trigram similarity of at least `similarity`,
+            e.g. "Jon Smith" and "John Smith".  Exact duplicates are left to
+            duplicate_registrations.  This requires Postgres with pg_trgm.
+            """
+            candidates = self._duplicate_candidates().filter(Attendee.email != '').subquery()
+            other = candidates.alias()
+            similar = self.query(candidates.c.id, candidates.c.email_key).join(other, and_(
+                other.c.email_key == candidates.c.email_key,
+                other.c.name_key != candidates.c.name_key,
+                func.similarity(candidates.c.name_key, other.c.name_key) >= similarity)).distinct().subquery()
+
+            query = self.query(Attendee, similar.c.email_key) \
+                .join(similar, Attendee.id == similar.c.id) \
+                .order_by(similar.c.email_key, Attendee.registered, Attendee.id)
+
+            for email, attendees in self._stream_clusters(query, lambda row: row[1]):
+                full_names = []
+                for attendee in attendees:
+                    if attendee.full_name not in full_names:
+                        full_names.append(attendee.full_name)
+                yield (' / '.join(full_names), email), attendees
+
         def guess_attendee_watchentry(self, attendee, active=True):
             """
             Finds all watchlist entries that match a given attendee.
@@ -922,32 +1076,12 @@ class Session(SessionManager):
                 a) one of the entry's first names or its last name matches the attendee's
                 b) the entry's email address or date of birth matches the attendee's
 
-            Because this could be run while in the middle of creating an attendee, we
-            need to do several checks on how the attendee's DOB might be formatted.
+            The matching itself is done by this process's WatchlistIndex; see uber.watchlist.
             """
-            or_clauses = [
-                and_(
-                    WatchList.email != '',
-                    func.lower(WatchList.email) == attendee.email.lower())]
-
-            if attendee.birthdate:
-                if isinstance(attendee.birthdate, six.string_types):
-                    try:
-                        birthdate = dateparser.parse(attendee.birthdate).date()
-                    except Exception:
-                        log.debug('Error parsing attendee birthdate: {}'.format(attendee.birthdate))
-                    else:
-                        or_clauses.append(WatchList.birthdate == birthdate)
-                elif isinstance(attendee.birthdate, datetime):
-                    or_clauses.append(WatchList.birthdate == attendee.birthdate.date())
-                elif isinstance(attendee.birthdate, date):
-                    or_clauses.append(WatchList.birthdate == attendee.birthdate)
-
-            return self.query(WatchList).filter(and_(
-                or_(func.lower(WatchList.first_names).contains(attendee.first_name.lower()),
-                    func.lower(WatchList.last_name) == attendee.last_name.lower()),
-                or_(*or_clauses),
-                WatchList.active == active)).all()  # noqa: E712
+            entry_ids = uber.watchlist.watchlist_index().match_attendee(attendee, active=active)
+            if not entry_ids:
+                return []
+            return self.query(WatchList).filter(WatchList.id.in_(entry_ids)).all()
 
         def guess_watchentry_attendees(self, entry):
             return self.query(Attendee).filter(
@@ -964,6 +1098,30 @@ class Session(SessionManager):
                     ),
                 Attendee.watchlist_id == None).all()
 
+        def guess_watchlist_attendees(self):
+            """
+            Matches every attendee who isn't already confirmed for a watchlist entry
+            against every active watchlist entry at once, and returns a dict mapping
+            each entry's id to its possible attendees.  This is one query for the
+            candidate attendees' names and contact details and one for the matches,
+            rather than calling guess_watchentry_attendees for every entry.
+            """
+            index = uber.watchlist.watchlist_index()
+            if not index:
+                return {}
+
+            rows = self.query(Attendee.id, Attendee.first_name, Attendee.last_name, Attendee.email,
+                              Attendee.birthdate).filter(
+                or_(func.lower(func.trim(Attendee.first_name)).in_(list(index.first_names)),
+                    func.lower(func.trim(Attendee.last_name)).in_(list(index.last_names))),
+                Attendee.watchlist_id == None)  # noqa: E711
+            matches = index.match_all(rows)
+
+            attendee_ids = set(chain.from_iterable(matches.values()))
+            attendees = {} if not attendee_ids else {
+                attendee.id: attendee for attendee in self.query(Attendee).filter(Attendee.id.in_(attendee_ids))}
+            return {entry_id: [attendees[attendee_id] for attendee_id in ids] for entry_id, ids in matches.items()}
+
         def get_attendee_account_by_email(self, email):
             return self.query(AttendeeAccount).filter_by(normalized_email=normalize_email_legacy(email)).one()
 
@@ -1261,31 +1419,23 @@ class Session(SessionManager):
 
             Arguments:
                 code (str): The id or code to search for.
+                used_codes (list): Codes which shouldn't be picked from a
+                    matching PromoCodeGroup.
 
             Returns:
                 PromoCode: A PromoCode object, either matching
                 the given code or found in the matching PromoCodeGroup.
             """
-            promo_code = self.lookup_promo_or_group_code(code, PromoCode)
-            if promo_code:
-                return promo_code
-
-            group = self.lookup_promo_or_group_code(code, PromoCodeGroup)
+            promo_code, group = self.resolve_promo_or_group_code(code)
             if group:
-                unused_valid_codes = [code for code in group.valid_codes if code.code not in used_codes]
-                return unused_valid_codes[0] if unused_valid_codes else None
+                return self.pick_unused_group_code(group, used_codes)
+            return promo_code
 
-        def lookup_promo_or_group_code(self, code, model=PromoCode):
+        def _promo_code_clause(self, code, model):
             """
-            Convenience method for finding a promo code by id or code.
-
-            Arguments:
-                model: Either PromoCode or PromoCodeGroup
-                code (str): The id or code to search for.
-
-            Returns:
-                Either the matching object of the given model,
-                 or None if not found.
+            Returns a filter clause matching the given id or code for either PromoCode or PromoCodeGroup, or None
+            if the code is empty.  Codes are compared with the model's normalized_code expression, so that the
+            normalized code indexes on both tables can serve the lookup.
             """
             if isinstance(code, uuid.UUID):
                 code = code.hex
@@ -1304,10 +1454,74 @@ class Session(SessionManager):
             except Exception:
                 pass
             else:
-                clause = clause.or_(model.id == promo_code_id)
+                clause = or_(clause, model.id == promo_code_id)
+
+            return clause
+
+        def lookup_promo_or_group_code(self, code, model=PromoCode):
+            """
+            Convenience method for finding a promo code by id or code.
+
+            Arguments:
+                model: Either PromoCode or PromoCodeGroup
+                code (str): The id or code to search for.
+
+            Returns:
+                Either the matching object of the given model,
+                 or None if not found.
+            """
+            clause = self._promo_code_clause(code, model)
+            if clause is None:
+                return None
 
             return self.query(model).filter(clause).order_by(model.normalized_code.desc()).first()
 
+        def resolve_promo_or_group_code(self, code):
+            """
+            Looks up the given id or code as both a PromoCode and a PromoCodeGroup in a single query, which
+            is what lookup_promo_or_group_code would find if we called it for each model in turn.
+
+            Returns:
+                tuple: (PromoCode, None) if a promo code matches, otherwise (None, PromoCodeGroup) if a group
+                    matches, otherwise (None, None).
+            """
+            code_clause = self._promo_code_clause(code, PromoCode)
+            if code_clause is None:
+                return None, None
+
+            matches = sqlalchemy.union_all(
+                sqlalchemy.select([
+                    PromoCode.id.label('id'),
+                    sqlalchemy.literal(0).label('is_group'),
+                    PromoCode.normalized_code.label('normalized_code'),
+                ]).where(code_clause),
+                sqlalchemy.select([
+                    PromoCodeGroup.id,
+                    sqlalchemy.literal(1),
+                    PromoCodeGroup.normalized_code,
+                ]).where(self._promo_code_clause(code, PromoCodeGroup)),
+            ).alias('matches')
+
+            match = self.query(PromoCode, PromoCodeGroup).select_from(matches) \
+                .outerjoin(PromoCode, and_(matches.c.is_group == 0, PromoCode.id == matches.c.id)) \
+                .outerjoin(PromoCodeGroup, and_(matches.c.is_group == 1, PromoCodeGroup.id == matches.c.id)) \
+                .order_by(matches.c.is_group, matches.c.normalized_code.desc()).first()
+            return tuple(match) if match else (None, None)
+
+        def pick_unused_group_code(self, group, used_codes=()):
+            """
+            Returns a valid promo code from the given PromoCodeGroup which isn't one of `used_codes`, or None
+            if there aren't any left.
+
+            The promo code's row stays locked until this session's transaction ends, and rows which another
+            transaction has locked are skipped, so attendees claiming badges from the same group at the same
+            time are given different codes rather than waiting on each other.
+            """
+            query = self.query(PromoCode).filter(PromoCode.group_id == group.id, PromoCode.is_valid)
+            if used_codes:
+                query = query.filter(PromoCode.code.notin_(list(used_codes)))
+            return query.order_by(PromoCode.code).with_for_update(skip_locked=True, of=PromoCode).first()
+
         def create_promo_code_group(self, attendee, name, badges, cost=None):
             pc_group = PromoCodeGroup(name=name, buyer=attendee)
 
@@ -1317,13 +1531,80 @@ class Session(SessionManager):
 
         def add_codes_to_pc_group(self, pc_group, badges, cost=None):
             cost = c.get_group_price() if cost is None else cost
-            for _ in range(badges):
-                self.add(PromoCode(
-                    discount=0,
-                    discount_type=PromoCode._FIXED_PRICE,
-                    uses_allowed=1,
-                    group=pc_group,
-                    cost=cost))
+            if badges <= 0:
+                return
+
+            # The new codes reference the group, so it needs to be in the database first.
+            self.add(pc_group)
+            self.flush()
+            self.insert_promo_codes(
+                badges,
+                discount=0,
+                discount_type=PromoCode._FIXED_PRICE,
+                uses_allowed=1,
+                group_id=pc_group.id,
+                cost=cost)
+            self.expire(pc_group, ['promo_codes'])
+
+        def insert_promo_codes(self, count, generator=None, batch_size=1000, **values):
+            """
+            Inserts `count` promo codes with the given column values and codes from `generator` (random codes
+            by default), and returns their ids.  Nothing is committed.
+
+            Rather than checking every new code against the promo_code table first, this inserts them in
+            batches and lets the unique index on normalized codes skip any which are taken, using
+            ON CONFLICT DO NOTHING (or INSERT OR IGNORE on SQLite), and then generates replacements for
+            only those.  Fewer than `count` codes are inserted if the generator keeps generating taken codes.
+
+            These inserts don't go through the ORM, so this records their Tracking entries and badge counts
+            itself, the way the session listeners would have.
+            """
+            generator = generator or PromoCode.random_code_generator()
+
+            # Apply the usual presave adjustments once, to a placeholder, rather than to every new code.
+            values.setdefault('expiration_date', c.ESCHATON)
+            template = PromoCode(code='placeholder', **values)
+            template.presave_adjustments()
+            values = {name: getattr(template, name) for name in values}
+
+            promo_code_ids, taken = [], set()
+            for _ in range(10):
+                codes = PromoCode._distinct_codes(generator, count - len(promo_code_ids), taken)
+                if not codes:
+                    break
+                taken.update(codes)
+
+                rows = [dict(values, id=str(uuid4()), code=code) for code in codes.values()]
+                for start in range(0, len(rows), batch_size):
+                    batch = rows[start:start + batch_size]
+                    inserted = self._insert_ignoring_conflicts(PromoCode.__table__, batch)
+                    for row in batch:
+                        if row['id'] in inserted:
+                            promo_code_ids.append(row['id'])
+                            if PromoCode not in Tracking.UNTRACKED:
+                                Tracking.track(c.CREATED, PromoCode(**row), session=self)
+
+                if len(promo_code_ids) >= count:
+                    break
+
+            deltas = self.info.setdefault('badge_count_deltas', defaultdict(int))
+            for field in _badge_counter_fields(PromoCode, {
+                    name: values.get(name) for name in _BADGE_COUNTER_COLUMNS[PromoCode]}):
+                deltas[field] += len(promo_code_ids)
+            return promo_code_ids
+
+        def _insert_ignoring_conflicts(self, table, rows):
+            """
+            Inserts the given rows, skipping any which would violate a unique constraint or index, and returns
+            the ids of the rows which were inserted.
+            """
+            if c.SQLALCHEMY_URL.startswith('sqlite'):
+                self.execute(table.insert().prefix_with('OR IGNORE').values(rows))
+                return {row_id for row_id, in self.execute(sqlalchemy.select([table.c.id]).where(
+                    table.c.id.in_([row['id'] for row in rows])))}
+
+            insert = postgresql.insert(table).values(rows).on_conflict_do_nothing().returning(table.c.id)
+            return {row_id for row_id, in self.execute(insert)}
         
         def remove_codes_from_pc_group(self, pc_group, badges):
             codes = sorted(pc_group.promo_codes, key=lambda x: x.cost, reverse=True)
@@ -1436,6 +1717,7 @@ class Session(SessionManager):
             """
             badge_type = uber.badge_funcs.get_real_badge_type(badge_type)
 
+            self._lock_badge_nums()
             new_badge_num = self.auto_badge_num(badge_type)
             lower_bound = c.BADGE_RANGES[badge_type][0]
             upper_bound = c.BADGE_RANGES[badge_type][1]
@@ -1529,27 +1811,80 @@ class Session(SessionManager):
                     type exist, and to select badges within a specific range.
 
             """
-            in_range = self.query(Attendee.badge_num).filter(
-                Attendee.badge_num != None,  # noqa: E711
-                Attendee.badge_num >= c.BADGE_RANGES[badge_type][0],
-                Attendee.badge_num <= c.BADGE_RANGES[badge_type][1])
+            lower_bound, upper_bound = c.BADGE_RANGES[badge_type]
 
-            in_range_list = [int(row[0]) for row in in_range.order_by(Attendee.badge_num)]
+            # The first gap which ends at or after the start of the range holds the lowest free number
+            # in the range, if there is one.  If there are no gaps, this is the latest badge number + 1,
+            # which lets admins manually set high badge numbers without filling up the badge type's range.
+            # The last gap always runs to BadgeGap.MAX_BADGE_NUM, so there are only no gaps at all if the
+            # table hasn't been built yet.
+            badge_num = self._first_free_badge_num(lower_bound)
+            if badge_num is None:
+                self.refresh_badge_gaps([(1, BadgeGap.MAX_BADGE_NUM)], build=True)
+                badge_num = self._first_free_badge_num(lower_bound)
+
+            if badge_num <= upper_bound and self.query(Attendee.id).filter(Attendee.badge_num == badge_num).first():
+                # Someone changed badge numbers without going through our sessions
+                log.warning('Badge gaps are out of date for badge #{}, recomputing {} - {}',
+                            badge_num, lower_bound, upper_bound)
+                self.refresh_badge_gaps([(lower_bound, upper_bound)])
+                badge_num = self._first_free_badge_num(lower_bound)
+            return min(badge_num, upper_bound + 1)
+
+        def _first_free_badge_num(self, lower_bound):
+            gaps = BadgeGap.__table__
+            start_num = self.execute(sqlalchemy.select([gaps.c.start_num]).where(
+                gaps.c.end_num >= lower_bound).order_by(gaps.c.end_num).limit(1)).scalar()
+            return None if start_num is None else max(start_num, lower_bound)
+
+        def _badge_gaps_built(self):
+            gaps = BadgeGap.__table__
+            return self.execute(sqlalchemy.select([gaps.c.id]).limit(1)).first() is not None
+
+        def _lock_badge_nums(self):
+            if not c.SQLALCHEMY_URL.startswith('sqlite'):
+                # Serialize badge number changes until our transaction ends, so two app servers
+                # can't both be handed the same free number or update the same badge gaps
+                self.execute(sqlalchemy.select([func.pg_advisory_xact_lock(BadgeGap.LOCK_ID)]))
+
+        def refresh_badge_gaps(self, spans, build=False):
+            """
+            Recomputes the BadgeGap rows for the given spans of badge numbers.
+            This is called for every badge number which may have been taken or
+            freed, so it only reads the attendees with badge numbers in those
+            spans; the gaps on either side are merged with what we find.
 
-            if len(in_range_list):
-                # Searches badge range for a gap in badge numbers; if none
-                # found, returns the latest badge number + 1.
-                # Doing this lets admins manually set high badge numbers
-                # without filling up the badge type's range.
-                start, end = c.BADGE_RANGES[badge_type][0], in_range_list[-1]
-                gap_nums = sorted(set(range(start, end + 1)).difference(in_range_list))
+            Args:
+                spans: A list of (lowest, highest) badge numbers to recompute.
+                build: If the badge gaps haven't been built yet, they're only
+                    kept up to date once auto_badge_num builds them, unless
+                    this is set.
 
-                if not gap_nums:
-                    return end + 1
-                else:
-                    return gap_nums[0]
-            else:
-                return c.BADGE_RANGES[badge_type][0]
+            """
+            if not build and not self._badge_gaps_built():
+                return
+
+            self._lock_badge_nums()
+            gaps = BadgeGap.__table__
+
+            def containing(badge_num):
+                return self.execute(sqlalchemy.select([gaps.c.start_num, gaps.c.end_num]).where(
+                    gaps.c.end_num >= badge_num).order_by(gaps.c.end_num).limit(1)).first()
+
+            for lo, hi in _merge_badge_spans(spans):
+                below, above = containing(lo - 1), containing(hi + 1)
+                region_lo = below.start_num if below and below.start_num < lo else lo
+                region_hi = above.end_num if above and above.start_num <= hi + 1 else hi
+
+                taken = [badge_num for (badge_num,) in self.execute(
+                    sqlalchemy.select([Attendee.badge_num]).distinct().where(
+                        and_(Attendee.badge_num >= lo, Attendee.badge_num <= hi)).order_by(Attendee.badge_num))]
+
+                self.execute(gaps.delete().where(and_(gaps.c.end_num >= region_lo, gaps.c.start_num <= region_hi)))
+                free = [{'id': str(uuid4()), 'start_num': start, 'end_num': end}
+                        for start, end in _free_badge_spans(region_lo, region_hi, taken)]
+                if free:
+                    self.execute(gaps.insert(), free)
 
         def shift_badges(self, badge_type, badge_num, *, until=None, up=False, down=False):
 
@@ -1568,17 +1903,265 @@ class Session(SessionManager):
                 Attendee.badge_num <= until)
 
             query.update({Attendee.badge_num: Attendee.badge_num + shift}, synchronize_session='evaluate')
+            self.refresh_badge_gaps([(badge_num - 1, until + 1)])
 
             return True
+
+        def renumber_badges(self, moves):
+            """
+            Applies a batch of badge changes in a single pass. Each move is
+            handled exactly as if the attendee's badge had been changed and
+            saved on its own (i.e. other badges are shifted out of the way or
+            into the gap left behind, per update_badge), but the final layout
+            is computed in memory and written with one UPDATE statement, and
+            a single summary Tracking entry is recorded instead of one per row.
+
+            Args:
+                moves: A list of (attendee, badge_num) or (attendee, badge_num,
+                    badge_type) tuples. The attendees should not have pending
+                    badge changes of their own.
+
+            Returns:
+                dict: The new badge number of every attendee that changed,
+                    keyed by attendee id. The caller is responsible for
+                    committing the session.
+            """
+            from uber.badge_funcs import get_badge_type, get_real_badge_type
+
+            moves = [(attendee, int(move[0]), get_real_badge_type(move[1] if len(move) > 1 else attendee.badge_type))
+                     for attendee, *move in moves]
+            if not moves:
+                return {}
+
+            badge_types = {attendee.badge_type for attendee, _, _ in moves} | {new for _, _, new in moves}
+            in_ranges = [and_(Attendee.badge_num >= c.BADGE_RANGES[badge_type][0],
+                              Attendee.badge_num <= c.BADGE_RANGES[badge_type][1]) for badge_type in badge_types]
+            original = dict(self.query(Attendee.id, Attendee.badge_num).filter(or_(*in_ranges)))
+            for attendee, _, _ in moves:
+                original.setdefault(attendee.id, attendee.badge_num)
+
+            layout = dict(original)
+            new_types = {}
+            shift_allowed = c.SHIFT_CUSTOM_BADGES and c.BEFORE_PRINTED_BADGE_DEADLINE and not c.AT_THE_CON
+
+            # The assigned badge numbers in order, alongside whose they are.  Shifting a run of
+            # badges by one never reorders them, so we only ever need to bisect for a run's ends.
+            nums, ids = [], []
+            for num, id in sorted((num, id) for id, num in layout.items() if num is not None):
+                nums.append(num)
+                ids.append(id)
+
+            def shift(badge_type, badge_num, until=None, up=False):
+                badge_type = get_badge_type(badge_num)[0] or badge_type
+                until = until or c.BADGE_RANGES[badge_type][1]
+                for i in range(bisect_left(nums, badge_num), bisect_right(nums, until)):
+                    nums[i] += 1 if up else -1
+                    layout[ids[i]] = nums[i]
+
+            for attendee, badge_num, badge_type in moves:
+                old_type, old_num = new_types.get(attendee.id, attendee.badge_type), layout[attendee.id]
+                collision = any(ids[i] != attendee.id
+                                for i in range(bisect_left(nums, badge_num), bisect_right(nums, badge_num)))
+
+                if old_num is not None:
+                    i = bisect_left(nums, old_num)
+                    while ids[i] != attendee.id:
+                        i += 1
+                    del nums[i], ids[i]
+
+                if shift_allowed:
+                    if old_num and collision:
+                        if old_type != badge_type:
+                            shift(old_type, old_num + 1)
+                            shift(badge_type, badge_num, up=True)
+                        elif old_num < badge_num:
+                            shift(old_type, old_num + 1, until=badge_num)
+                        else:
+                            shift(old_type, badge_num, until=old_num - 1, up=True)
+                    elif old_num:
+                        shift(old_type, old_num + 1)
+                    elif collision:
+                        shift(badge_type, badge_num, up=True)
+
+                layout[attendee.id] = badge_num
+                new_types[attendee.id] = badge_type
+                i = bisect_right(nums, badge_num)
+                nums.insert(i, badge_num)
+                ids.insert(i, attendee.id)
+
+            changes = {id: num for id, num in layout.items() if num != original[id] or id in new_types}
+            rows = [{'id': id, 'badge_num': num, 'badge_type': new_types.get(id)} for id, num in changes.items()]
+
+            if c.SQLALCHEMY_URL.startswith('sqlite'):
+                self.bulk_update_mappings(Attendee, [
+                    {key: val for key, val in row.items() if val is not None or key == 'badge_num'} for row in rows])
+            else:
+                # The unique badge_num constraint is deferred, so the intermediate states are fine
+                for chunk_start in range(0, len(rows), 5000):
+                    chunk = rows[chunk_start:chunk_start + 5000]
+                    values, params = [], {}
+                    for i, row in enumerate(chunk):
+                        values.append('(CAST(:id_{0} AS uuid), CAST(:num_{0} AS integer), CAST(:type_{0} AS integer))'
+                                      .format(i))
+                        params.update({'id_' + str(i): row['id'], 'num_' + str(i): row['badge_num'],
+                                       'type_' + str(i): row['badge_type']})
+                    self.execute(sqlalchemy.text(
+                        'UPDATE attendee SET badge_num = v.badge_num, '
+                        'badge_type = COALESCE(v.badge_type, attendee.badge_type) '
+                        'FROM (VALUES {}) AS v (id, badge_num, badge_type) '
+                        'WHERE attendee.id = v.id'.format(', '.join(values))), params)
+
+            for instance in list(self.identity_map.values()):
+                if isinstance(instance, Attendee) and instance.id in changes:
+                    self.expire(instance, ['badge_num', 'badge_type'])
+            self.refresh_badge_gaps([(num, num) for num in chain(changes.values(), map(original.get, changes)) if num])
+
+            Tracking.track_summary(
+                self, c.AUTO_BADGE_SHIFT, 'Attendee', moves[0][0].id, 'Badge renumbering',
+                'Moved {} badges, renumbering {} in total: {}'.format(len(moves), len(changes), ', '.join(
+                    '{} #{} -> #{}'.format(attendee.full_name, original[attendee.id], layout[attendee.id])
+                    for attendee, _, _ in moves)))
+
+            return changes
         
         def get_next_badge_to_print(self, printer_id=''):
             query = self.query(PrintJob).join(Tracking, PrintJob.id == Tracking.fk_id).filter(
                     PrintJob.printed == None, PrintJob.errors == '', PrintJob.printer_id == printer_id)
 
-            badge = query.order_by(Tracking.when.desc()).with_for_update().first()
+            badge = query.order_by(Tracking.when.desc()).with_for_update(skip_locked=True, of=PrintJob).first()
 
             return badge
 
+        def claim_print_jobs(self, printer_ids=(), count=None, station='', lease_seconds=None):
+            """
+            Atomically claims up to `count` pending print jobs (or all of them, if count is None) for the given
+            printers, or for any printer if no printer IDs are given, and returns the claimed PrintJobs.
+
+            A job is pending if it hasn't been printed or marked with an error and either it has never been
+            sent to a printer or its lease has run out.  Claimed jobs are marked as sent to the printer and,
+            if `lease_seconds` is set, leased to `station` for that long.  Jobs are claimed with a single
+            UPDATE over a FOR UPDATE SKIP LOCKED subquery, so stations polling at the same time never block
+            each other or claim the same job.  The claim is committed before this returns.
+            """
+            now = datetime.now(UTC)
+            pending = PrintJob.__table__.c
+            claimable = sqlalchemy.select([pending.id]).where(and_(
+                pending.printed == None,  # noqa: E711
+                pending.errors == '',
+                or_(pending.queued == None, pending.lease_expires < now),  # noqa: E711
+                *([pending.printer_id.in_(list(printer_ids))] if printer_ids else [])
+            )).order_by(pending.queued.nullsfirst(), pending.id).limit(count)
+
+            claim = PrintJob.__table__.update().values(
+                queued=now,
+                claimed_by=station,
+                lease_expires=now + timedelta(seconds=lease_seconds) if lease_seconds else None)
+
+            if c.SQLALCHEMY_URL.startswith('sqlite'):
+                job_ids = [job_id for job_id, in self.execute(claimable)]
+                self.execute(claim.where(pending.id.in_(job_ids)))
+            else:
+                claimable = claimable.with_for_update(skip_locked=True)
+                job_ids = [job_id for job_id, in self.execute(
+                    claim.where(pending.id.in_(claimable)).returning(pending.id))]
+
+            jobs = self.query(PrintJob).filter(PrintJob.id.in_(job_ids)).all() if job_ids else []
+            self.commit()
+            return jobs
+
+        def attendee_stats(self):
+            """
+            Returns the attendee counts shown on the statistics page (badge
+            statuses, paid states, ages, ribbons, interests, badge types,
+            check-ins, donation tiers, group badges, and no-shows), computed as
+            grouped aggregates rather than by loading every attendee.
+
+            MultiChoice columns are grouped by their stored value, i.e. by each
+            distinct combination of ribbons or interests, and then split, which
+            gives the same counts as unnesting them in the database.
+            """
+            def label(name, val):
+                if not val:
+                    return ''
+                if val == -1:
+                    return 'Unknown'
+                return Attendee.get_field(name).type.choices.get(int(val), '')
+
+            counts = defaultdict(OrderedDict)
+            counts['donation_tiers'] = OrderedDict([(k, 0) for k in sorted(c.DONATION_TIERS.keys()) if k > 0])
+            counts.update({
+                'groups': {'paid': 0, 'free': 0},
+                'noshows': {'paid': 0, 'free': 0},
+                'checked_in': {'yes': 0, 'no': 0}
+            })
+            count_labels = {
+                'badges': c.BADGE_OPTS,
+                'paid': c.PAYMENT_OPTS,
+                'ages': c.AGE_GROUP_OPTS,
+                'ribbons': c.RIBBON_OPTS,
+                'interests': c.INTEREST_OPTS,
+                'statuses': c.BADGE_STATUS_OPTS,
+                'checked_in_by_type': c.BADGE_OPTS,
+            }
+            for key, opts in count_labels.items():
+                for val, desc in opts:
+                    counts[key][desc] = 0
+
+            def grouped(*columns, valid_only=True):
+                query = self.query(*columns, func.count(Attendee.id))
+                if valid_only:
+                    query = query.filter(Attendee.badge_status.notin_([
+                        c.INVALID_GROUP_STATUS, c.INVALID_STATUS, c.IMPORTED_STATUS, c.REFUNDED_STATUS]))
+                return query.group_by(*columns).all()
+
+            for status, count in grouped(Attendee.badge_status, valid_only=False):
+                counts['statuses'][label('badge_status', status)] += count
+
+            for paid, count in grouped(Attendee.paid):
+                counts['paid'][label('paid', paid)] += count
+
+            for age_group, count in grouped(Attendee.age_group):
+                counts['ages'][label('age_group', age_group)] += count
+
+            checked_in = Attendee.checked_in != None  # noqa: E711
+            for badge_type, is_checked_in, count in grouped(Attendee.badge_type, checked_in):
+                counts['badges'][label('badge_type', badge_type)] += count
+                counts['checked_in']['yes' if is_checked_in else 'no'] += count
+                if is_checked_in:
+                    counts['checked_in_by_type'][label('badge_type', badge_type)] += count
+
+            for key, column, names in [('ribbons', Attendee.ribbon, c.RIBBONS),
+                                       ('interests', Attendee.interests, c.INTERESTS)]:
+                for value, count in grouped(column):
+                    for val in (value or '').split(','):
+                        if val and int(val) in names:
+                            counts[key][names[int(val)]] += count
+
+            donation_amounts = list(counts['donation_tiers'].keys())
+            for amount_extra, count in grouped(Attendee.amount_extra):
+                amount_extra = amount_extra or 0
+                for index, amount in enumerate(donation_amounts):
+                    next_amount = donation_amounts[index + 1] if index + 1 < len(donation_amounts) else six.MAXSIZE
+                    if amount_extra >= amount and amount_extra < next_amount:
+                        counts['donation_tiers'][amount] += count
+
+            has_group = Group.id != None  # noqa: E711
+            group_paid = func.coalesce(Group.amount_paid, 0) != 0
+            for paid, is_checked_in, in_group, is_group_paid, count in self.query(
+                    Attendee.paid, checked_in, has_group, group_paid, func.count(Attendee.id)) \
+                    .outerjoin(Group, Attendee.group_id == Group.id) \
+                    .filter(Attendee.badge_status.notin_([
+                        c.INVALID_GROUP_STATUS, c.INVALID_STATUS, c.IMPORTED_STATUS, c.REFUNDED_STATUS])) \
+                    .group_by(Attendee.paid, checked_in, has_group, group_paid):
+                paid_by_group = paid == c.PAID_BY_GROUP and in_group
+                if paid_by_group:
+                    counts['groups']['paid' if is_group_paid else 'free'] += count
+                if not is_checked_in:
+                    is_paid = paid == c.HAS_PAID or paid_by_group and is_group_paid
+                    counts['noshows']['paid' if is_paid else 'free'] += count
+
+            return counts
+
         def valid_attendees(self):
             return self.query(Attendee).filter(Attendee.is_valid == True)
 
@@ -1788,8 +2371,12 @@ class Session(SessionManager):
 
             or_checks = []
             and_checks = []
+            use_trigram_index = not c.SQLALCHEMY_URL.startswith('sqlite')
 
             def check_text_fields(search_text):
+                if use_trigram_index:
+                    return [Attendee.id.in_(self.text_search_attendee_ids(search_text))]
+
                 check_list = [
                     Group.name.ilike('%' + search_text + '%'),
                     aliased_pcg.name.ilike('%' + search_text + '%'),
@@ -1867,6 +2454,8 @@ class Session(SessionManager):
                         last_term = term
             else:
                 or_checks.extend(check_text_fields(text))
+                if use_trigram_index:
+                    attendees = attendees.ranked_by(func.word_similarity(text.lower(), Attendee.search_text).desc())
 
             if or_checks and and_checks:
                 return attendees.filter(or_(*or_checks), and_(*and_checks)), ''
@@ -1877,7 +2466,28 @@ class Session(SessionManager):
             else:
                 return attendees, ''
 
-        def property_search(self, text):
+        def text_search_attendee_ids(self, search_text):
+            """
+            Returns a subquery of the ids of attendees whose searchable fields, group
+            name, promo code group name, or account email contain search_text. Each
+            branch of the UNION can be served by its own trigram index, which an OR
+            across several outer-joined tables never could.
+            """
+            pattern = '%' + search_text.lower() + '%'
+            subqueries = [
+                self.query(Attendee.id).filter(Attendee.search_text.like(pattern)),
+                self.query(Attendee.id).join(Group, Attendee.group_id == Group.id).filter(Group.name.ilike(pattern)),
+                self.query(Attendee.id).join(PromoCode, Attendee.promo_code_id == PromoCode.id)
+                    .join(PromoCodeGroup, PromoCode.group_id == PromoCodeGroup.id)
+                    .filter(PromoCodeGroup.name.ilike(pattern)),
+            ]
+            if c.ATTENDEE_ACCOUNTS_ENABLED:
+                subqueries.append(
+                    self.query(Attendee.id).join(Attendee.managers).filter(AttendeeAccount.email.ilike(pattern)))
+
+            return subqueries[0].union(*subqueries[1:]).subquery()
+
+        def property_search(self, text, batch_size=1000):
             """
             Many of our most useful forms of data are properties on the Attendee model.
             However, these often are too complex to create SQL statements for, so we
@@ -1885,29 +2495,113 @@ class Session(SessionManager):
             has been either creating custom reports or making sysadmins cry. This is our
             quick-ish solution -- a way to filter attendees by any property. Because this is
             resource-intensive, it is locked behind the Devtools site section.
+
+            Conditions are separated by AND and OR, with AND binding more tightly.
+            Any condition on a column or hybrid property is pushed down into SQL;
+            the rest are evaluated in Python over batches of attendees, with the
+            relationships those properties use eager-loaded.
+
+            Returns:
+                A list of matching attendees and a message, which is either an
+                error or a report of how long the search took.
             """
-            if "OR" in text:
-                return None, 'Sorry, property search does not support OR conditions due to I don\'t want to install Pandas.'
-            delimited_text = text.replace('AND', 'AND,')
-            list_of_attr_searches = delimited_text.split(',')
-            last_term = None
+            before = datetime.now()
+            clauses = []
+            for clause_text in re.split(r'\s+OR\s+', text.strip()):
+                conditions = []
+                for search_text in re.split(r'\s+AND\s+', clause_text):
+                    if ':' not in search_text:
+                        return None, 'ERROR: {} is not a valid property search'.format(search_text)
 
-            conditions_list = []
-            results = []
+                    target, term, search_term, op = self.parse_attr_search_terms(search_text)
+                    try:
+                        search_term = int(search_term)
+                    except Exception:
+                        pass
 
-            for search_text in list_of_attr_searches:
-                target, term, search_term, op = self.parse_attr_search_terms(search_text)
-                try:
-                    search_term = int(search_term)
-                except Exception as ex:
-                    pass
-                conditions_list.append((target, search_term, op))
-
-            for attendee in self.valid_attendees():
-                if all([self.get_truth(getattr(attendee, target), op, search_term) for target, search_term, op in conditions_list]):
-                    results.append(attendee)
-            
-            return results, ''
+                    try:
+                        column = getattr(Attendee, target)
+                        sql_condition = self.get_truth(column, op, search_term)
+                    except AttributeError:
+                        return None, 'ERROR: {} is not a valid attribute'.format(target)
+                    except Exception:
+                        sql_condition = None
+
+                    if not isinstance(sql_condition, sqlalchemy.sql.elements.ClauseElement):
+                        sql_condition = None
+                    elif op is operator.ne:
+                        # SQL's != is never true for NULL, but None != search_term is in Python
+                        sql_condition = or_(sql_condition, column == None)  # noqa: E711
+                    conditions.append((target, search_term, op, sql_condition))
+                clauses.append(conditions)
+
+            clause_filters = [and_(*[sql for _, _, _, sql in conditions if sql is not None])
+                              if any(sql is not None for _, _, _, sql in conditions) else None
+                              for conditions in clauses]
+            python_conditions = [
+                [(target, search_term, op) for target, search_term, op, sql in conditions if sql is None]
+                for conditions in clauses]
+
+            # Every clause needs its SQL conditions to be true, so unless one of them is pure Python,
+            # the SQL conditions alone narrow down which attendees we need to look at
+            prefilter = [or_(*clause_filters)] if None not in clause_filters else []
+
+            if not any(python_conditions):
+                results = self.valid_attendees().filter(*prefilter).all()
+            else:
+                clause_flags = [sqlalchemy.case([(clause_filter, True)], else_=False) if clause_filter is not None
+                                else sqlalchemy.literal(True) for clause_filter in clause_filters]
+                targets = {target for conditions in python_conditions for target, _, _ in conditions}
+                query = self.query(Attendee, *clause_flags).filter(
+                    Attendee.is_valid == True, *prefilter).options(*self._eager_loads(Attendee, targets))  # noqa: E712
+
+                def get_truth(attendee, target, op, search_term):
+                    try:
+                        return self.get_truth(getattr(attendee, target), op, search_term)
+                    except TypeError:
+                        return False
+
+                results, last_id = [], None
+                while True:
+                    batch_query = query.order_by(Attendee.id)
+                    if last_id:
+                        batch_query = batch_query.filter(Attendee.id > last_id)
+                    batch = batch_query.limit(batch_size).all()
+                    if not batch:
+                        break
+
+                    for attendee, *flags in batch:
+                        if any(flag and all(get_truth(attendee, *condition) for condition in conditions)
+                               for flag, conditions in zip(flags, python_conditions)):
+                            results.append(attendee)
+                    # The identity map only holds weak references to unchanged objects, so
+                    # attendees we didn't match are freed once we move on to the next batch
+                    last_id = batch[-1][0].id
+
+            elapsed = (datetime.now() - before).total_seconds()
+            log.debug('Property search "{}" found {} attendees in {} seconds', text, len(results), elapsed)
+            return results, 'Found {} attendees in {:.2f} seconds.'.format(len(results), elapsed)
+
+        def _eager_loads(self, model, attr_names):
+            """
+            Loader options which selectin-load the relationships that the given
+            attributes of a model read, as declared in its PROPERTY_RELATIONSHIPS.
+            Attributes which are themselves relationships are loaded directly.
+            """
+            relationships = model.__mapper__.relationships
+            declared = getattr(model, 'PROPERTY_RELATIONSHIPS', {})
+            paths = {path for name in attr_names
+                     for path in ([name] if name in relationships else declared.get(name, []))}
+
+            options = []
+            for path in sorted(paths):
+                loader, cls = None, model
+                for name in path.split('.'):
+                    attr = getattr(cls, name)
+                    loader = selectinload(attr) if loader is None else loader.selectinload(attr)
+                    cls = attr.property.mapper.class_
+                options.append(loader)
+            return options
 
         def delete_from_group(self, attendee, group):
             """
@@ -2043,6 +2737,8 @@ class Session(SessionManager):
                 model.presave_adjustments()
             try:
                 self.bulk_save_objects(models)
+                # Bulk saves skip the flush events, so record what changed for _invalidate_shared_cache ourselves.
+                self.info.setdefault('changed_models', set()).update(model.__class__.__name__ for model in models)
                 self.commit()
                 return models
             except IntegrityError as error:
@@ -2275,6 +2971,28 @@ def _presave_adjustments(session, context, instances='deprecated'):
         model.predelete_adjustments()
 
 
+def _record_check_ins(session, context, instances='deprecated'):
+    unchecked_ids = []
+    states = [(session.new, False), (session.dirty, True)]
+    for instances, has_orig in states:
+        for attendee in instances:
+            if not isinstance(attendee, Attendee):
+                continue
+            was_checked_in = attendee.orig_value_of('checked_in') if has_orig else None
+            if attendee.checked_in and not was_checked_in:
+                session.add(CheckIn(
+                    attendee_id=attendee.id,
+                    checked_in=attendee.checked_in,
+                    who=Tracking.current_who(),
+                    reg_station_id=CheckIn.current_reg_station(),
+                    badge_type=attendee.badge_type))
+            elif was_checked_in and not attendee.checked_in:
+                unchecked_ids.append(attendee.id)
+
+    if unchecked_ids:
+        session.query(CheckIn).filter(CheckIn.attendee_id.in_(unchecked_ids)).delete(synchronize_session=False)
+
+
 def _track_changes(session, context, instances='deprecated'):
     states = [
         (c.CREATED, session.new),
@@ -2287,12 +3005,201 @@ def _track_changes(session, context, instances='deprecated'):
                 Tracking.track(action, instance)
 
 
+def _write_tracking_entries(session):
+    entries = session.info.pop('tracking_entries', None)
+    if entries:
+        Tracking.enqueue(entries)
+
+
+def _discard_tracking_entries(session):
+    session.info.pop('tracking_entries', None)
+
+
+def _badge_counter_fields(model, values):
+    """
+    Returns the badge counters (see Config.count_badge_counter) which a model
+    instance with the given column values counts towards.  These mirror the
+    filters in Config.count_badge_counter, except that group_badges_sold depends
+    on group payments, so it's left to the reconcile_badge_counts task.
+    """
+    if values is None:
+        return []
+
+    fields = []
+    if model is Attendee:
+        has_or_will_have_badge = values['badge_status'] not in \
+            Attendee.INVALID_STATUSES + Attendee.NOT_GETTING_BADGE_STATUSES
+        if values['paid'] != c.NOT_PAID and has_or_will_have_badge:
+            fields.append('badge_type:{}'.format(values['badge_type']))
+        if values['paid'] in [c.HAS_PAID, c.REFUNDED] and values['badge_status'] == c.COMPLETED_STATUS:
+            fields.append('individual_badges_sold')
+    elif model is PromoCode:
+        if (values['cost'] or 0) > 0 and values['group_id']:
+            fields.append('paid_promo_codes')
+    elif model is Group:
+        if (values['tables'] or 0) > 0 and (values['cost'] or 0) > 0 and values['status'] == c.UNAPPROVED:
+            fields.append('dealer_apps')
+    return fields
+
+
+_BADGE_COUNTER_COLUMNS = {
+    Attendee: ['paid', 'badge_type', 'badge_status'],
+    PromoCode: ['cost', 'group_id'],
+    Group: ['tables', 'cost', 'status'],
+}
+
+
+def _badge_counter_values(instance, old=False):
+    state = instance_state(instance)
+    values = {}
+    for name in _BADGE_COUNTER_COLUMNS[instance.__class__]:
+        history = state.attrs[name].history
+        values[name] = history.deleted[0] if old and history.deleted else getattr(instance, name)
+    return values
+
+
+def _track_badge_counts(session, context, instances='deprecated'):
+    deltas = session.info.setdefault('badge_count_deltas', defaultdict(int))
+    states = [
+        (session.new, False, True),
+        (session.dirty, True, True),
+        (session.deleted, True, False)]
+
+    for instances, had_old, has_new in states:
+        for instance in instances:
+            model = instance.__class__
+            if model in _BADGE_COUNTER_COLUMNS:
+                old_values = _badge_counter_values(instance, old=True) if had_old else None
+                new_values = _badge_counter_values(instance) if has_new else None
+                for field in _badge_counter_fields(model, old_values):
+                    deltas[field] -= 1
+                for field in _badge_counter_fields(model, new_values):
+                    deltas[field] += 1
+
+
+def _apply_badge_counts(session):
+    deltas = session.info.pop('badge_count_deltas', {})
+    c.increment_badge_counters({field: delta for field, delta in deltas.items() if delta})
+
+
+def _discard_badge_counts(session):
+    session.info.pop('badge_count_deltas', None)
+
+
+def _merge_badge_spans(spans):
+    """
+    Sorts (lowest, highest) spans of badge numbers, clipped to the numbers a
+    badge can have, merging the ones which overlap or touch.
+    """
+    merged = []
+    for lo, hi in sorted((max(lo, 1), min(hi, BadgeGap.MAX_BADGE_NUM)) for lo, hi in spans):
+        if lo > hi:
+            continue
+        if merged and lo <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], hi)
+        else:
+            merged.append([lo, hi])
+    return merged
+
+
+def _free_badge_spans(lo, hi, taken):
+    """
+    Returns the (start, end) runs of badge numbers between lo and hi which
+    aren't in the sorted list `taken`.
+    """
+    spans, start = [], lo
+    for badge_num in taken:
+        if badge_num > start:
+            spans.append((start, badge_num - 1))
+        start = max(start, badge_num + 1)
+    if start <= hi:
+        spans.append((start, hi))
+    return spans
+
+
+def _load_old_badge_num(target, value, oldvalue, initiator):
+    """
+    Registered with active_history, so that the badge number an attendee had
+    is always in the attribute history for _update_badge_gaps, even if it
+    wasn't loaded before the new one was set.
+    """
+
+
+def _update_badge_gaps(session, context, instances='deprecated'):
+    badge_nums = set()
+    for instance in chain(session.new, session.dirty, session.deleted):
+        if isinstance(instance, Attendee):
+            history = sqlalchemy.inspect(instance).attrs.badge_num.history
+            if instance in session.deleted:
+                badge_nums.update(history.unchanged or history.deleted)
+            elif instance in session.new or history.has_changes():
+                badge_nums.update(history.added)
+                badge_nums.update(history.deleted)
+
+    spans = [(badge_num, badge_num) for badge_num in badge_nums if badge_num]
+    if spans:
+        session.refresh_badge_gaps(spans)
+
+
+def _track_queued_print_jobs(session, context, instances='deprecated'):
+    session.info.setdefault('queued_printer_ids', set()).update(
+        instance.printer_id for instance in chain(session.new, session.dirty)
+        if isinstance(instance, PrintJob) and not instance.queued and not instance.printed and not instance.errors)
+
+
+def _publish_queued_print_jobs(session):
+    printer_ids = session.info.pop('queued_printer_ids', None)
+    if printer_ids:
+        uber.push.print_jobs_queued(printer_ids)
+
+
+def _discard_queued_print_jobs(session):
+    session.info.pop('queued_printer_ids', None)
+
+
+def _track_changed_models(session, context, instances='deprecated'):
+    session.info.setdefault('changed_models', set()).update(
+        instance.__class__.__name__ for instance in chain(session.new, session.dirty, session.deleted))
+
+
+def _track_bulk_changed_models(context):
+    context.session.info.setdefault('changed_models', set()).add(context.mapper.class_.__name__)
+
+
+def _invalidate_shared_cache(session):
+    changed_models = session.info.pop('changed_models', None)
+    if changed_models:
+        uber.config.invalidate_shared_cache(changed_models)
+        uber.decorators.invalidate_cached_pages(changed_models)
+        uber.watchlist.invalidate_watchlist_index(changed_models)
+
+
+def _discard_changed_models(session):
+    session.info.pop('changed_models', None)
+
+
 def register_session_listeners():
     """
     The order in which we register these listeners matters.
     """
     listen(Session.session_factory, 'before_flush', _presave_adjustments)
+    listen(Session.session_factory, 'before_flush', _record_check_ins)
     listen(Session.session_factory, 'after_flush', _track_changes)
+    listen(Session.session_factory, 'after_flush', _track_badge_counts)
+    listen(Session.session_factory, 'after_flush', _update_badge_gaps)
+    listen(Attendee.badge_num, 'set', _load_old_badge_num, active_history=True)
+    listen(Session.session_factory, 'after_flush', _track_changed_models)
+    listen(Session.session_factory, 'after_flush', _track_queued_print_jobs)
+    listen(Session.session_factory, 'after_bulk_update', _track_bulk_changed_models)
+    listen(Session.session_factory, 'after_bulk_delete', _track_bulk_changed_models)
+    listen(Session.session_factory, 'after_commit', _write_tracking_entries)
+    listen(Session.session_factory, 'after_commit', _apply_badge_counts)
+    listen(Session.session_factory, 'after_commit', _invalidate_shared_cache)
+    listen(Session.session_factory, 'after_commit', _publish_queued_print_jobs)
+    listen(Session.session_factory, 'after_rollback', _discard_tracking_entries)
+    listen(Session.session_factory, 'after_rollback', _discard_badge_counts)
+    listen(Session.session_factory, 'after_rollback', _discard_changed_models)
+    listen(Session.session_factory, 'after_rollback', _discard_queued_print_jobs)
 
 
 register_session_listeners()
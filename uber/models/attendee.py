@@ -33,7 +33,7 @@ from uber.utils import add_opt, get_age_from_birthday, get_age_conf_from_birthda
     normalize_email, normalize_email_legacy, remove_opt
 
 
-__all__ = ['Attendee', 'AttendeeAccount', 'FoodRestrictions']
+__all__ = ['Attendee', 'AttendeeAccount', 'BadgeGap', 'FoodRestrictions']
 
 
 RE_NONDIGIT = re.compile(r'\D+')
@@ -222,6 +222,10 @@ class Attendee(MagModel, TakesPaymentMixin):
     for_review = Column(UnicodeText, admin_only=True)
     admin_notes = Column(UnicodeText, admin_only=True)
 
+    # A lowercased copy of all our searchable_fields, kept up to date on save
+    # so attendee search can use a single trigram index instead of scanning
+    search_text = Column(UnicodeText, admin_only=True)
+
     public_id = Column(UUID, default=lambda: str(uuid4()))
     badge_num = Column(Integer, default=None, nullable=True, admin_only=True)
     badge_type = Column(Choice(c.BADGE_OPTS), default=c.ATTENDEE_BADGE)
@@ -457,10 +461,39 @@ class Attendee(MagModel, TakesPaymentMixin):
     ]
     if not c.SQLALCHEMY_URL.startswith('sqlite'):
         _attendee_table_args.append(UniqueConstraint('badge_num', deferrable=True, initially='DEFERRED'))
+        _attendee_table_args.extend([
+            Index('ix_attendee_{}_trgm'.format(col.name), col,
+                  postgresql_using='gin', postgresql_ops={col.name: 'gin_trgm_ops'})
+            for col in [search_text, first_name, last_name, legal_name]])
 
     __table_args__ = tuple(_attendee_table_args)
     _repr_attr_names = ['full_name']
 
+    # The relationships which some of our properties read, so that searches which check
+    # them across many attendees can eager-load them; "shifts.job" loads each shift's job.
+    PROPERTY_RELATIONSHIPS = {
+        'amount_pending': ['active_receipt'],
+        'can_self_service_refund_badge': ['active_receipt'],
+        'food_restrictions_filled_out': ['food_restrictions'],
+        'has_been_refunded': ['group', 'promo_code.group.buyer'],
+        'hotel_nights': ['hotel_requests'],
+        'hotel_nights_without_shifts_that_day': ['hotel_requests', 'shifts.job'],
+        'hotel_status': ['hotel_requests'],
+        'is_checklist_admin': ['dept_memberships'],
+        'is_dept_head': ['dept_memberships'],
+        'multiply_assigned': ['dept_memberships'],
+        'must_contact': ['depts_where_working'],
+        'paid_for_badge': ['group', 'promo_code.group'],
+        'setup_hotel_approved': ['hotel_requests'],
+        'shift_minutes': ['shifts.job'],
+        'teardown_hotel_approved': ['hotel_requests'],
+        'total_cost': ['active_receipt'],
+        'unweighted_hours': ['shifts.job'],
+        'weighted_hours': ['shifts.job'],
+        'worked_hours': ['shifts.job'],
+        'worked_shifts': ['shifts'],
+    }
+
     def to_dict(self, *args, **kwargs):
         # Kludgey fix for SQLAlchemy breaking our stuff
         d = super().to_dict(*args, **kwargs)
@@ -638,6 +671,10 @@ class Attendee(MagModel, TakesPaymentMixin):
         if c.ATTENDEE_ACCOUNTS_ENABLED and self.email and not self.managers:
             self.session.match_attendee_to_account(self)
 
+    @presave_adjustment
+    def _update_search_text(self):
+        self.search_text = '\n'.join(str(getattr(self, name) or '') for name in self.searchable_fields).lower()
+
     @hybrid_property
     def times_printed(self):
         return len([job.id for job in self.print_requests if job.printed])
@@ -1120,25 +1157,27 @@ class Attendee(MagModel, TakesPaymentMixin):
     def valid_placeholder(self):
         return self.placeholder and self.first_name and self.last_name
 
+    # Badge statuses which make an attendee invalid, and the ones which additionally
+    # mean a valid attendee won't be getting a badge; the badge counters use these too
+    INVALID_STATUSES = [c.PENDING_STATUS, c.AT_DOOR_PENDING_STATUS, c.INVALID_STATUS,
+                        c.IMPORTED_STATUS, c.INVALID_GROUP_STATUS]
+    NOT_GETTING_BADGE_STATUSES = [c.REFUNDED_STATUS, c.NOT_ATTENDING, c.UNAPPROVED_DEALER_STATUS]
+
     @hybrid_property
     def is_valid(self):
-        return self.badge_status not in [c.PENDING_STATUS, c.AT_DOOR_PENDING_STATUS, c.INVALID_STATUS, 
-                                         c.IMPORTED_STATUS, c.INVALID_GROUP_STATUS]
+        return self.badge_status not in self.INVALID_STATUSES
 
     @is_valid.expression
     def is_valid(cls):
-        return not_(cls.badge_status.in_([c.PENDING_STATUS, c.AT_DOOR_PENDING_STATUS, c.INVALID_STATUS, 
-                                          c.IMPORTED_STATUS, c.INVALID_GROUP_STATUS]))
+        return not_(cls.badge_status.in_(cls.INVALID_STATUSES))
 
     @hybrid_property
     def has_or_will_have_badge(self):
-        return self.is_valid and self.badge_status not in [c.REFUNDED_STATUS, c.NOT_ATTENDING, c.UNAPPROVED_DEALER_STATUS]
+        return self.is_valid and self.badge_status not in self.NOT_GETTING_BADGE_STATUSES
     
     @has_or_will_have_badge.expression
     def has_or_will_have_badge(cls):
-        return and_(cls.is_valid,
-            not_(cls.badge_status.in_([c.REFUNDED_STATUS, c.NOT_ATTENDING, c.UNAPPROVED_DEALER_STATUS])
-            ))
+        return and_(cls.is_valid, not_(cls.badge_status.in_(cls.NOT_GETTING_BADGE_STATUSES)))
 
     @hybrid_property
     def has_badge(self):
@@ -1371,10 +1410,8 @@ class Attendee(MagModel, TakesPaymentMixin):
     @property
     def watchlist_guess(self):
         try:
-            from uber.models import Session
-            with Session() as session:
-                watchentries = session.guess_attendee_watchentry(self)
-                return [w.to_dict() for w in watchentries]
+            index = uber.watchlist.watchlist_index()
+            return [index.entries[entry_id] for entry_id in index.match_attendee(self)]
         except Exception as ex:
             log.warning('Error guessing watchlist entry: {}', ex)
             return None
@@ -1616,6 +1653,11 @@ class Attendee(MagModel, TakesPaymentMixin):
         return bool(self.staffing and self.badge_type != c.CONTRACTOR_BADGE and any(
             not d.is_shiftless for d in self.assigned_depts))
 
+    @property
+    def shift_intervals(self):
+        from uber.models.department import ShiftIntervals
+        return ShiftIntervals(shift.job for shift in self.shifts)
+
     @property
     def shift_minutes(self):
         all_minutes = set()
@@ -1723,8 +1765,9 @@ class Attendee(MagModel, TakesPaymentMixin):
     @classproperty
     def searchable_fields(cls):
         fields = [col.name for col in cls.__table__.columns if isinstance(col.type, UnicodeText)]
-        if "other_accessibility_requests" in fields:
-            fields.remove('other_accessibility_requests')
+        for name in ['other_accessibility_requests', 'search_text']:
+            if name in fields:
+                fields.remove(name)
         return fields
 
     @classproperty
@@ -2260,6 +2303,12 @@ class AttendeeAccount(MagModel):
     public_id = Column(UUID, default=lambda: str(uuid4()), nullable=True)
     email = Column(UnicodeText)
     hashed = Column(UnicodeText, private=True)
+
+    if not c.SQLALCHEMY_URL.startswith('sqlite'):
+        __table_args__ = (
+            Index('ix_attendee_account_email_trgm', email,
+                  postgresql_using='gin', postgresql_ops={'email': 'gin_trgm_ops'}),
+        )
     password_reset = relationship('PasswordReset', backref='attendee_account', uselist=False)
     attendees = relationship(
         'Attendee', backref='managers', order_by='Attendee.registered', cascade='save-update,merge,refresh-expire,expunge',
@@ -2365,3 +2414,27 @@ class FoodRestrictions(MagModel):
                 return True
             else:
                 return restriction in self.standard_ints
+
+
+class BadgeGap(MagModel):
+    """
+    One row per run of consecutive badge numbers which no attendee has, from start_num through end_num,
+    so that Session.auto_badge_num can find the lowest free number in a badge range with a single lookup
+    on the end_num index.  The rows cover every number from 1 to MAX_BADGE_NUM, regardless of badge type,
+    so they don't depend on c.BADGE_RANGES.
+
+    The table is built the first time it's needed and kept up to date by Session.refresh_badge_gaps,
+    which the after_flush listeners call for attendees whose badge numbers changed, and which
+    shift_badges and renumber_badges call for the badges they move with bulk UPDATEs.
+    """
+    MAX_BADGE_NUM = 2 ** 31 - 1
+
+    # Postgres advisory lock which badge number allocation and changes to these rows hold until they commit
+    LOCK_ID = 0x62616467
+
+    start_num = Column(Integer)
+    end_num = Column(Integer)
+
+    __table_args__ = (
+        Index('ix_badge_gap_end_num', end_num, unique=True),
+    )
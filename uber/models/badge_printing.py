@@ -5,7 +5,7 @@ from pytz import UTC
 from residue import CoerceUTF8 as UnicodeText, UTCDateTime, UUID
 from sqlalchemy.dialects.postgresql.json import JSONB
 from sqlalchemy.ext.mutable import MutableDict
-from sqlalchemy.schema import ForeignKey
+from sqlalchemy.schema import ForeignKey, Index
 from sqlalchemy.types import Boolean, Integer
 
 from uber.config import c
@@ -28,3 +28,12 @@ class PrintJob(MagModel):
     errors = Column(UnicodeText)
     is_minor = Column(Boolean)
     json_data = Column(MutableDict.as_mutable(JSONB), default={})
+
+    # Jobs claimed with Session.claim_print_jobs are leased to the station which claimed them; if the
+    # job isn't printed or marked with an error before lease_expires, it goes back into the queue.
+    claimed_by = Column(UnicodeText)
+    lease_expires = Column(UTCDateTime, nullable=True, default=None)
+
+    __table_args__ = (
+        Index('ix_print_job_printer_id_printed', printer_id, printed),
+    )
@@ -6,10 +6,10 @@ from pockets import cached_property, classproperty, groupify
 from pockets.autolog import log
 from pytz import UTC
 from residue import CoerceUTF8 as UnicodeText, UTCDateTime, UUID
-from sqlalchemy import func, or_, select, update
+from sqlalchemy import and_, exists, func, or_, select, update
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import relationship
-from sqlalchemy.schema import ForeignKey
+from sqlalchemy.schema import ForeignKey, Index
 from sqlalchemy.types import Boolean, Integer
 
 from uber import utils
@@ -235,22 +235,29 @@ class AutomatedEmail(MagModel, BaseEmailMixin):
         with request_cached_context(clear_cache_on_start=True):
             return JinjaEnv.env().from_string(text).render(data)
 
+    def send_kwargs(self, model_instance):
+        """
+        Renders this email for model_instance and returns the keyword
+        arguments send_email() needs to send it.
+        """
+        data = self.renderable_data(model_instance)
+        return {
+            'sender': self.sender,
+            'to': model_instance.email_to_address,
+            'subject': self.render_template(self.subject, data),
+            'body': self.render_template(self.body, data),
+            'format': self.format,
+            'model': model_instance.to_dict('id'),
+            'cc': self.cc,
+            'bcc': self.bcc,
+            'ident': self.ident,
+            'automated_email': self.to_dict('id')}
+
     def send_to(self, model_instance, delay=True, raise_errors=False):
         try:
             from uber.tasks.email import send_email
-            data = self.renderable_data(model_instance)
             send_func = send_email.delay if delay else send_email
-            send_func(
-                self.sender,
-                model_instance.email_to_address,
-                self.render_template(self.subject, data),
-                self.render_template(self.body, data),
-                self.format,
-                model=model_instance.to_dict('id'),
-                cc=self.cc,
-                bcc=self.bcc,
-                ident=self.ident,
-                automated_email=self.to_dict('id'))
+            send_func(**self.send_kwargs(model_instance))
             return True
         except Exception:
             log.error('Error sending {!r} email to {}', self.subject, model_instance.email_to_address, exc_info=True)
@@ -258,6 +265,18 @@ class AutomatedEmail(MagModel, BaseEmailMixin):
                 raise
         return False
 
+    def filter_unsent(self, query):
+        """
+        Narrows a query of this email's model down to the instances which have
+        not already been sent this email and which pass the fixture's SQL
+        filters. The fixture's Python filter still has to be checked against
+        each result via would_send_if_approved().
+        """
+        model_class = self.model_class
+        return query.filter(
+            ~exists().where(and_(Email.fk_id == model_class.id, Email.automated_email_id == self.id)),
+            *self.query).options(*self.query_options)
+
     def would_send_if_approved(self, model_instance):
         return model_instance and getattr(model_instance, 'email_to_address', False) and self.filter(model_instance)
 
@@ -271,6 +290,10 @@ class Email(MagModel, BaseEmailMixin):
     to = Column(UnicodeText)
     when = Column(UTCDateTime, default=lambda: datetime.now(UTC))
 
+    __table_args__ = (
+        Index('ix_email_automated_email_id_fk_id', automated_email_id, fk_id),
+    )
+
     @cached_property
     def fk(self):
         return self.session.query(self.model_class).filter_by(id=self.fk_id).first() if self.session and self.fk_id else None
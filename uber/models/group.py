@@ -9,7 +9,7 @@ from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.ext.mutable import MutableDict
 from sqlalchemy.dialects.postgresql.json import JSONB
 from sqlalchemy.orm import backref
-from sqlalchemy.schema import ForeignKey
+from sqlalchemy.schema import ForeignKey, Index
 from sqlalchemy.sql.elements import not_
 from sqlalchemy.types import Boolean, Integer, Numeric
 
@@ -73,6 +73,11 @@ class Group(MagModel, TakesPaymentMixin):
                         'ModelReceipt.closed == None)',
         uselist=False)
 
+    if not c.SQLALCHEMY_URL.startswith('sqlite'):
+        __table_args__ = (
+            Index('ix_group_name_trgm', name, postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        )
+
     _repr_attr_names = ['name']
 
     @presave_adjustment
@@ -142,6 +142,17 @@ class PromoCodeGroup(MagModel):
         foreign_keys=buyer_id,
         cascade='save-update,merge,refresh-expire,expunge')
 
+    __table_args__ = (
+        Index(
+            'ix_promo_code_group_normalized_code',
+            func.replace(func.replace(func.lower(code), '-', ''), ' ', '')),
+    )
+    if not c.SQLALCHEMY_URL.startswith('sqlite'):
+        __table_args__ += (
+            Index('ix_promo_code_group_name_trgm', name,
+                  postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+        )
+
     email_model_name = 'group'
 
     @presave_adjustment
@@ -328,7 +339,7 @@ class PromoCode(MagModel):
     uses_allowed = Column(Integer, nullable=True, default=None)
     cost = Column(Integer, nullable=True, default=None)
 
-    group_id = Column(UUID, ForeignKey('promo_code_group.id', ondelete='SET NULL'), nullable=True)
+    group_id = Column(UUID, ForeignKey('promo_code_group.id', ondelete='SET NULL'), nullable=True, index=True)
     group = relationship(
         PromoCodeGroup, backref='promo_codes',
         foreign_keys=group_id,
@@ -518,43 +529,88 @@ class PromoCode(MagModel):
         return min(max(discounted_price, 0), price)
 
     @classmethod
-    def _generate_code(cls, generator, count=None):
+    def _distinct_codes(cls, generator, count, taken=()):
         """
-        Helper method to limit collisions for the other generate() methods.
+        Helper method to limit collisions between newly generated codes.
 
         Arguments:
             generator (callable): Function that returns a newly generated code.
-            count (int): The number of codes to generate. If `count` is `None`,
-                then a single code will be generated. Defaults to `None`.
+            count (int): The number of codes to generate.
+            taken (collection): Normalized codes which shouldn't be generated.
 
         Returns:
-            If an `int` value was passed for `count`, then a `list` of newly
-            generated codes is returned. If `count` is `None`, then a single
-            `str` is returned.
+            dict: Up to `count` new codes, keyed by their normalized codes.
+            Fewer codes are returned if the generator runs dry or keeps
+            generating codes we already have.
         """
-        from uber.models import Session
-        with Session() as session:
-            # Kind of inefficient, but doing one big query for all the existing
-            # codes will be faster than a separate query for each new code.
-            old_codes = set(s for (s,) in session.query(cls.code).all())
-
         # Set an upper limit on the number of collisions we'll allow,
         # otherwise this loop could potentially run forever.
         max_collisions = 100
         collisions = 0
-        codes = set()
-        while len(codes) < (1 if count is None else count):
+        codes = {}
+        while len(codes) < count:
             code = generator().strip()
             if not code:
                 break
-            if code in codes or code in old_codes:
+            normalized_code = cls.normalize_code(code)
+            if normalized_code in codes or normalized_code in taken:
                 collisions += 1
                 if collisions >= max_collisions:
                     break
             else:
-                codes.add(code)
+                codes[normalized_code] = code
+        return codes
+
+    @classmethod
+    def _generate_code(cls, generator, count=None):
+        """
+        Helper method to limit collisions for the other generate() methods.
+
+        Only the newly generated codes are checked against the database, using
+        the unique index on normalized codes, and any which are taken are
+        replaced with new ones.  To insert a lot of new promo codes at once,
+        use Session.insert_promo_codes instead, which skips the check and lets
+        the unique index reject the collisions.
+
+        Arguments:
+            generator (callable): Function that returns a newly generated code.
+            count (int): The number of codes to generate. If `count` is `None`,
+                then a single code will be generated. Defaults to `None`.
+
+        Returns:
+            If an `int` value was passed for `count`, then a `list` of newly
+            generated codes is returned. If `count` is `None`, then a single
+            `str` is returned.
+        """
+        from uber.models import Session
+        wanted = 1 if count is None else count
+        codes, taken = {}, set()
+        with Session() as session:
+            while len(codes) < wanted:
+                new_codes = cls._distinct_codes(generator, wanted - len(codes), set(codes) | taken)
+                if not new_codes:
+                    break
+                taken.update(s for (s,) in session.query(cls.normalized_code).filter(
+                    cls.normalized_code.in_(list(new_codes))))
+                codes.update((s, code) for s, code in new_codes.items() if s not in taken)
+                # Give up rather than loop forever if we're running out of unused codes.
+                if len(taken) >= 100:
+                    break
+        codes = set(codes.values())
         return (codes.pop() if codes else None) if count is None else codes
 
+    @classmethod
+    def random_code_generator(cls, length=9, segment_length=3):
+        """
+        Returns a function which generates random promo codes; see
+        `generate_random_code` for the format.
+        """
+        def _generate_random_code():
+            letters = ''.join(random.choice(cls._UNAMBIGUOUS_CHARS) for _ in range(length))
+            return '-'.join(textwrap.wrap(letters, segment_length))
+
+        return _generate_random_code
+
     @classmethod
     def generate_random_code(cls, count=None, length=9, segment_length=3):
         """
@@ -579,13 +635,25 @@ class PromoCode(MagModel):
             generated codes is returned. If `count` is `None`, then a single
             `str` is returned.
         """
+        return cls._generate_code(cls.random_code_generator(length, segment_length), count=count)
 
-        # The actual generator function, called repeatedly by `_generate_code`
-        def _generate_random_code():
-            letters = ''.join(random.choice(cls._UNAMBIGUOUS_CHARS) for _ in range(length))
-            return '-'.join(textwrap.wrap(letters, segment_length))
+    @classmethod
+    def word_code_generator(cls):
+        """
+        Returns a function which generates promo codes consisting of one word
+        of each part of speech from `PromoCodeWord`.  The words are read from
+        c.PROMO_CODE_WORDS, which is cached until a PromoCodeWord changes.
+        """
+        words = c.PROMO_CODE_WORDS
 
-        return cls._generate_code(_generate_random_code, count=count)
+        def _generate_word_code():
+            code_words = []
+            for part_of_speech, _ in PromoCodeWord._PART_OF_SPEECH_OPTS:
+                if words[part_of_speech]:
+                    code_words.append(random.choice(words[part_of_speech]))
+            return ' '.join(code_words)
+
+        return _generate_word_code
 
     @classmethod
     def generate_word_code(cls, count=None):
@@ -601,20 +669,7 @@ class PromoCode(MagModel):
             generated codes is returned. If `count` is `None`, then a single
             `str` is returned.
         """
-        from uber.models import Session
-        with Session() as session:
-            words = PromoCodeWord.group_by_parts_of_speech(
-                session.query(PromoCodeWord).order_by(PromoCodeWord.normalized_word).all())
-
-        # The actual generator function, called repeatedly by `_generate_code`
-        def _generate_word_code():
-            code_words = []
-            for part_of_speech, _ in PromoCodeWord._PART_OF_SPEECH_OPTS:
-                if words[part_of_speech]:
-                    code_words.append(random.choice(words[part_of_speech]))
-            return ' '.join(code_words)
-
-        return cls._generate_code(_generate_word_code, count=count)
+        return cls._generate_code(cls.word_code_generator(), count=count)
 
     @classmethod
     def disambiguate_code(cls, code):
@@ -1,8 +1,11 @@
+import base64
 import json
+import pickle
 import sys
 from datetime import datetime
 from threading import current_thread
 from urllib.parse import parse_qsl
+from uuid import uuid4
 
 import cherrypy
 from pytz import UTC
@@ -11,7 +14,7 @@ from sqlalchemy.ext import associationproxy
 from pockets.autolog import log
 from residue import CoerceUTF8 as UnicodeText, UTCDateTime, UUID
 from sideboard.lib import serializer
-from sqlalchemy import Sequence
+from sqlalchemy import Index, Sequence
 from sqlalchemy.types import Boolean, Integer
 from sqlalchemy.dialects.postgresql.json import JSONB
 from sqlalchemy.ext.mutable import MutableDict
@@ -22,8 +25,9 @@ from uber.models import MagModel
 from uber.models.admin import AdminAccount
 from uber.models.email import Email
 from uber.models.types import Choice, DefaultColumn as Column, MultiChoice, utcnow
+from uber.push import terminal_status_changed
 
-__all__ = ['PageViewTracking', 'Tracking', 'TxnRequestTracking']
+__all__ = ['CheckIn', 'PageViewTracking', 'Tracking', 'TxnRequestTracking']
 
 serializer.register(associationproxy._AssociationList, list)
 
@@ -68,7 +72,13 @@ class Tracking(MagModel):
     links = Column(UnicodeText)
     action = Column(Choice(c.TRACKING_OPTS))
     data = Column(UnicodeText)
+
+    # Older rows have a full JSON dump of the instance in snapshot.  Newer rows
+    # leave it blank and store only what changed in delta: every column for
+    # created rows, the new values of changed columns for updates, and the
+    # full to_dict() of deleted rows so they can be undeleted.
     snapshot = Column(UnicodeText)
+    delta = Column(JSONB, default={})
 
     @classmethod
     def format(cls, values):
@@ -96,69 +106,113 @@ class Tracking(MagModel):
             raise ValueError('Error formatting {} ({!r})'.format(column.name, value)) from e
 
     @classmethod
-    def differences(cls, instance):
-        diff = {}
-        for attr, column in instance.__table__.columns.items():
+    def safe_repr(cls, column, value):
+        """
+        Like repr(), but returns '<ERROR>' instead of raising.
+
+        Sometimes, if we changed the type of the value in the database (via a
+        database migration) an old value might not be able to be shown as the
+        new type (i.e. it used to be a string, now it's int).  In theory the
+        database migration SHOULD be the thing handling this, but if it
+        doesn't, it becomes our problem to deal with.
+
+        We are overly paranoid with exception handling here because the
+        tracking code should be made to never, ever, ever crash, even
+        if it encounters insane/old data that really shouldn't be our
+        problem.
+        """
+        try:
+            return cls.repr(column, value)
+        except Exception:
+            log.error('Tracking repr({}) failed'.format(column.name), exc_info=True)
+            return '<ERROR>'
+
+    @classmethod
+    def changes(cls, instance):
+        """
+        Returns {attr: (old_value, new_value)} for every tracked column of the
+        instance which has changed.
+        """
+        changes = {}
+        for attr in instance.__table__.columns.keys():
+            if attr in cls.UNTRACKED_COLUMNS:
+                continue
             new_val = getattr(instance, attr)
             old_val = instance.orig_value_of(attr)
             if old_val != new_val:
-                """
-                Important note: here we try and show the old vs new value for
-                something that has been changed so that we can report it in the
-                tracking page.
-
-                Sometimes, however, if we changed the type of the value in the
-                database (via a database migration) the old value might not be
-                able to be shown as the new type (i.e. it used to be a string,
-                now it's int).
-
-                In that case, we won't be able to show a representation of the
-                old value and instead we'll log it as '<ERROR>'. In theory the
-                database migration SHOULD be the thing handling this, but if it
-                doesn't, it becomes our problem to deal with.
-
-                We are overly paranoid with exception handling here because the
-                tracking code should be made to never, ever, ever crash, even
-                if it encounters insane/old data that really shouldn't be our
-                problem.
-                """
-                try:
-                    old_val_repr = cls.repr(column, old_val)
-                except Exception:
-                    log.error('Tracking repr({}) failed on old value'.format(attr), exc_info=True)
-                    old_val_repr = '<ERROR>'
-
-                try:
-                    new_val_repr = cls.repr(column, new_val)
-                except Exception:
-                    log.error('Tracking repr({}) failed on new value'.format(attr), exc_info=True)
-                    new_val_repr = '<ERROR>'
-
-                diff[attr] = "'{} -> {}'".format(old_val_repr, new_val_repr)
-        return diff
-
-    @classmethod
-    def track(cls, action, instance):
-        from uber.models import AutomatedEmail
+                changes[attr] = (old_val, new_val)
+        return changes
 
+    @classmethod
+    def differences(cls, instance):
+        return cls.format_changes(instance.__table__.columns, cls.changes(instance))
+
+    @classmethod
+    def format_changes(cls, columns, changes):
+        return {
+            attr: "'{} -> {}'".format(cls.safe_repr(columns[attr], old_val), cls.safe_repr(columns[attr], new_val))
+            for attr, (old_val, new_val) in changes.items()}
+
+    @classmethod
+    def current_who(cls):
+        if sys.argv == ['']:
+            return 'server admin'
+        return AdminAccount.admin_name() or (current_thread().name if current_thread().daemon else 'non-admin')
+
+    @classmethod
+    def track_summary(cls, session, action, model, fk_id, which, data):
+        """
+        Records a single Tracking entry for a bulk operation that bypassed the
+        ORM, e.g. renumbering a few thousand badges with one UPDATE, instead of
+        one entry per affected row.
+        """
+        session.add(Tracking(
+            model=model,
+            fk_id=fk_id,
+            which=which,
+            who=cls.current_who(),
+            page=c.PAGE_PATH,
+            action=action,
+            data=data,
+        ))
+
+    @classmethod
+    def track(cls, action, instance, session=None):
+        """
+        Records a change to a model instance.  This runs on every flush, so it
+        only reads the values it needs; formatting them for the history pages
+        and writing the Tracking row happen in from_entry.  Pass `session` for
+        rows which were inserted without going through the ORM, whose
+        instances don't belong to a session.
+
+        With c.ASYNC_TRACKING the entry waits in session.info until the
+        session commits (and is dropped if it rolls back), and then goes onto a
+        Redis queue which the write_tracking task drains in batches, so none of
+        this work happens inside the request's transaction.
+        """
+        from uber.models import AutomatedEmail, Session
+
+        snapshot = None
         if action in [c.CREATED, c.UNPAID_PREREG, c.EDITED_PREREG]:
-            vals = {
-                attr: cls.repr(column, getattr(instance, attr))
-                for attr, column in instance.__table__.columns.items()}
-            data = cls.format(vals)
+            values = {
+                attr: getattr(instance, attr)
+                for attr in instance.__table__.columns.keys() if attr not in cls.UNTRACKED_COLUMNS}
         elif action == c.UPDATED:
-            diff = cls.differences(instance)
-            data = cls.format(diff)
-            if len(diff) == 1 and 'badge_num' in diff and c.SHIFT_CUSTOM_BADGES:
+            values = cls.changes(instance)
+            if len(values) == 1 and 'badge_num' in values and c.SHIFT_CUSTOM_BADGES:
                 action = c.AUTO_BADGE_SHIFT
-            if isinstance(instance, AutomatedEmail) and not diff.keys().isdisjoint(("currently_sending", 
-                                                                                    "last_send_time", 
-                                                                                    "unapproved_count")):
+            if isinstance(instance, AutomatedEmail) and not values.keys().isdisjoint(("currently_sending",
+                                                                                      "last_send_time",
+                                                                                      "unapproved_count")):
                 return
-            elif not data:
+            elif not values:
                 return
         else:
-            data = 'id={}'.format(instance.id)
+            values = None
+            try:
+                snapshot = json.dumps(instance.to_dict(), cls=serializer)
+            except TypeError as e:
+                snapshot = "(Could not save JSON dump due to error: {}".format(e)
 
         links = ', '.join(
             '{}({})'.format(list(column.foreign_keys)[0].column.table.name, getattr(instance, name))
@@ -166,34 +220,159 @@ class Tracking(MagModel):
                                                                    and 'creator' not in str(column)
                                                                    and getattr(instance, name))
 
-        if sys.argv == ['']:
-            who = 'server admin'
+        entry = {
+            'id': str(uuid4()),
+            'when': datetime.now(UTC),
+            'model': instance.__class__.__name__,
+            'fk_id': instance.id,
+            'which': repr(instance),
+            'who': cls.current_who(),
+            'page': c.PAGE_PATH,
+            'links': links,
+            'action': action,
+            'values': values,
+            'snapshot': snapshot,
+        }
+
+        session = session or instance.session
+        if c.ASYNC_TRACKING and session:
+            session.info.setdefault('tracking_entries', []).append(entry)
+        elif c.ASYNC_TRACKING:
+            cls.enqueue([entry])
+        elif session:
+            session.add(cls.from_entry(entry))
         else:
-            who = AdminAccount.admin_name() or (current_thread().name if current_thread().daemon else 'non-admin')
-            
-        try:
-            snapshot = json.dumps(instance.to_dict(), cls=serializer)
-        except TypeError as e:
-            snapshot = "(Could not save JSON dump due to error: {}".format(e)
-
-        def _insert(session):
-            session.add(Tracking(
-                model=instance.__class__.__name__,
-                fk_id=instance.id,
-                which=repr(instance),
-                who=who,
-                page=c.PAGE_PATH,
-                links=links,
-                action=action,
-                data=data,
-                snapshot=snapshot,
-            ))
-        if instance.session:
-            _insert(instance.session)
+            with Session() as session:
+                session.add(cls.from_entry(entry))
+
+    @classmethod
+    def from_entry(cls, entry):
+        """
+        Builds the Tracking row for an entry recorded by Tracking.track.
+        """
+        from uber.models import Session
+
+        values, snapshot = entry['values'], entry['snapshot']
+        if values is None:
+            data = 'id={}'.format(entry['fk_id'])
+            try:
+                delta = json.loads(snapshot)
+            except ValueError:
+                delta = {'error': snapshot}
         else:
+            columns = Session.resolve_model(entry['model']).__table__.columns
+            if entry['action'] in [c.UPDATED, c.AUTO_BADGE_SHIFT]:
+                data = cls.format(cls.format_changes(columns, values))
+                values = {attr: new_val for attr, (old_val, new_val) in values.items()}
+            else:
+                data = cls.format({attr: cls.safe_repr(columns[attr], value) for attr, value in values.items()})
+            try:
+                delta = json.loads(json.dumps(values, cls=serializer))
+            except TypeError as e:
+                delta = {'error': 'Could not save JSON dump due to error: {}'.format(e)}
+
+        return Tracking(
+            id=entry['id'],
+            when=entry['when'],
+            model=entry['model'],
+            fk_id=entry['fk_id'],
+            which=entry['which'],
+            who=entry['who'],
+            page=entry['page'],
+            links=entry['links'],
+            action=entry['action'],
+            data=data,
+            delta=delta,
+        )
+
+    @classmethod
+    def enqueue(cls, entries):
+        """
+        Pushes tracking entries onto the Redis queue for the write_tracking
+        task.  If Redis is unavailable they're written to the database right
+        away instead, since losing history is worse than a slow save.
+        """
+        try:
+            c.REDIS_STORE.rpush(c.REDIS_PREFIX + 'tracking_queue', *[
+                base64.b64encode(pickle.dumps(entry)).decode('ascii') for entry in entries])
+        except Exception:
+            log.error('Unable to queue {} tracking entries, writing them directly'.format(len(entries)),
+                      exc_info=True)
             from uber.models import Session
             with Session() as session:
-                _insert(session)
+                session.bulk_insert([cls.from_entry(entry) for entry in entries])
+
+    # Lua script which moves up to ARGV[1] entries from the front of the queue onto a
+    # processing list in one step, and records that list in the set of processing lists
+    _CLAIM_QUEUE = """
+        local entries = redis.call('LRANGE', KEYS[1], 0, ARGV[1] - 1)
+        if #entries > 0 then
+            redis.call('LTRIM', KEYS[1], #entries, -1)
+            redis.call('RPUSH', KEYS[2], unpack(entries))
+            redis.call('SADD', KEYS[3], KEYS[2])
+        end
+        return entries
+    """
+
+    @classmethod
+    def claim_queue(cls, processing_key, limit):
+        """
+        Moves up to `limit` entries from the front of the queue onto the
+        processing list `processing_key` and returns them.  They stay there
+        until release_processing is called once they've been written, so no
+        entries are lost if we die in between.
+        """
+        entries = c.REDIS_STORE.eval(cls._CLAIM_QUEUE, 3, c.REDIS_PREFIX + 'tracking_queue', processing_key,
+                                     c.REDIS_PREFIX + 'tracking_processing', limit)
+        return [pickle.loads(base64.b64decode(entry)) for entry in entries]
+
+    @classmethod
+    def processing_keys(cls):
+        """
+        Returns the processing lists which still hold entries that may not have been written.
+        """
+        return c.REDIS_STORE.smembers(c.REDIS_PREFIX + 'tracking_processing')
+
+    @classmethod
+    def processing_entries(cls, processing_key):
+        entries = c.REDIS_STORE.lrange(processing_key, 0, -1)
+        return [pickle.loads(base64.b64decode(entry)) for entry in entries]
+
+    @classmethod
+    def release_processing(cls, processing_key):
+        """
+        Removes a processing list whose entries have all been written.
+        """
+        pipeline = c.REDIS_STORE.pipeline()
+        pipeline.delete(processing_key)
+        pipeline.srem(c.REDIS_PREFIX + 'tracking_processing', processing_key)
+        pipeline.execute()
+
+
+class CheckIn(MagModel):
+    """
+    One row per attendee check-in, recorded whenever an attendee's checked_in
+    goes from empty to set (see _record_check_ins in uber/models/__init__.py),
+    so check-in reports can group these instead of searching Tracking.data.
+    Un-checking-in an attendee deletes their rows.
+    """
+    attendee_id = Column(UUID)
+    checked_in = Column(UTCDateTime, default=lambda: datetime.now(UTC))
+    who = Column(UnicodeText)
+    reg_station_id = Column(Integer, nullable=True)
+    badge_type = Column(Choice(c.BADGE_OPTS))
+
+    __table_args__ = (
+        Index('ix_check_in_attendee_id', attendee_id),
+        Index('ix_check_in_checked_in_who', checked_in, who),
+    )
+
+    @classmethod
+    def current_reg_station(cls):
+        try:
+            return int(cherrypy.session.get('reg_station') or 0) or None
+        except Exception:
+            return None
 
 
 class TxnRequestTracking(MagModel):
@@ -214,6 +393,10 @@ class TxnRequestTracking(MagModel):
             c.REDIS_STORE.hset(c.REDIS_PREFIX + 'spin_terminal_txns:' + self.terminal_id,
                                    'last_error',
                                    self.internal_error)
+            terminal_status_changed(self.terminal_id)
+
 
+Tracking.UNTRACKED = [CheckIn, Tracking, Email, PageViewTracking, TxnRequestTracking]
 
-Tracking.UNTRACKED = [Tracking, Email, PageViewTracking, TxnRequestTracking]
+# Columns which only duplicate other columns, e.g. Attendee.search_text
+Tracking.UNTRACKED_COLUMNS = ['search_text']
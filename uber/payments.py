@@ -19,6 +19,7 @@ import uber
 from uber.config import c
 from uber.custom_tags import format_currency, email_only
 from uber.errors import CSRFException, HTTPRedirect
+from uber.push import terminal_status_changed
 from uber.utils import report_critical_exception
 
 
@@ -815,10 +816,12 @@ class SpinTerminalRequest(TransactionRequest):
 
         if self.api_response_successful(response_json):
             c.REDIS_STORE.hset(c.REDIS_PREFIX + 'spin_terminal_txns:' + self.terminal_id, 'last_response', json.dumps(response_json))
+            terminal_status_changed(self.terminal_id)
         else:
             error_message = self.error_message_from_response(response_json)
             log.error(f"Error while processing terminal sale for transaction {self.tracking_id}: {error_message}")
             c.REDIS_STORE.hset(c.REDIS_PREFIX + 'spin_terminal_txns:' + self.terminal_id, 'last_error', error_message)
+            terminal_status_changed(self.terminal_id)
     
     def process_sale_response(self, session, response):
         from uber.models import ReceiptTransaction
@@ -847,6 +850,7 @@ class SpinTerminalRequest(TransactionRequest):
                 and spin_rest_utils.insecure_entry_type(response_json):
             error_message = "Signature was skipped so transaction was voided. Please retry payment"
             c.REDIS_STORE.hset(c.REDIS_PREFIX + 'spin_terminal_txns:' + self.terminal_id, 'last_error', error_message)
+            terminal_status_changed(self.terminal_id)
             self.tracker.internal_error = error_message
 
             void_response = self.send_void_txn()
@@ -871,12 +875,14 @@ class SpinTerminalRequest(TransactionRequest):
         approval_amount = Decimal(str(spin_rest_utils.approved_amount(response_json))) * 100 # don't @ me
         if approval_amount != self.amount and abs(approval_amount - self.amount) > 5:
             c.REDIS_STORE.hset(c.REDIS_PREFIX + 'spin_terminal_txns:' + self.terminal_id, 'last_error', "Partial approval")
+            terminal_status_changed(self.terminal_id)
 
         matching_txns = session.query(ReceiptTransaction).filter_by(intent_id=self.intent.id).all()
         if not matching_txns:
             error_message = "Payment was successful, but did not have any matching transactions"
             log.error(f"Error while processing terminal sale for transaction {self.tracking_id}: {error_message}")
             c.REDIS_STORE.hset(c.REDIS_PREFIX + 'spin_terminal_txns:' + self.terminal_id, 'last_error', error_message)
+            terminal_status_changed(self.terminal_id)
             return
         
         running_total = approval_amount
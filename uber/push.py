@@ -0,0 +1,96 @@
+"""
+Wakes up long-polling clients over Redis pub/sub, so badge printer stations
+and reg desk card terminals hear about new print jobs and finished terminal
+transactions as soon as they happen, instead of re-checking every few seconds.
+
+Publishers call publish() (or one of the helpers below) after the change is
+visible to other processes, e.g. after the session which made it commits.
+Long-polling handlers call wait_for() with a function which checks whether
+there's anything for the client yet.  wait_for() subscribes before it checks,
+so nothing published in between is missed.
+"""
+import time
+
+import redis
+from pockets.autolog import log
+
+from uber.config import c
+
+__all__ = ['publish', 'wait_for', 'print_jobs_channel', 'terminal_channel', 'print_jobs_queued',
+           'terminal_status_changed']
+
+
+# If Redis is unavailable, waiting clients fall back to checking this often.
+FALLBACK_POLL_SECONDS = 1
+
+
+def _channel_key(channel):
+    return c.REDIS_PREFIX + 'push:' + channel
+
+
+def print_jobs_channel(printer_id='*'):
+    return 'print_jobs:' + printer_id
+
+
+def terminal_channel(terminal_id):
+    return 'terminal:' + terminal_id
+
+
+def publish(channel, message=''):
+    try:
+        c.REDIS_STORE.publish(_channel_key(channel), message)
+    except redis.exceptions.RedisError as e:
+        log.warning('Unable to publish to {}: {}', channel, e)
+
+
+def print_jobs_queued(printer_ids):
+    for printer_id in set(printer_ids):
+        publish(print_jobs_channel(printer_id or ''))
+
+
+def terminal_status_changed(terminal_id):
+    publish(terminal_channel(terminal_id))
+
+
+def wait_for(channels, timeout, check):
+    """
+    Returns check() as soon as it's truthy, waiting up to `timeout` seconds
+    for something to be published on one of `channels` before checking again.
+    Channels ending in * are patterns.  Returns the last result of check(),
+    which is falsy if we timed out.
+    """
+    deadline = time.time() + timeout
+    pubsub = c.REDIS_STORE.pubsub(ignore_subscribe_messages=True)
+    try:
+        patterns = [_channel_key(channel) for channel in channels if channel.endswith('*')]
+        names = [_channel_key(channel) for channel in channels if not channel.endswith('*')]
+        if patterns:
+            pubsub.psubscribe(*patterns)
+        if names:
+            pubsub.subscribe(*names)
+    except redis.exceptions.RedisError as e:
+        log.warning('Unable to subscribe to {}, polling instead: {}', channels, e)
+        pubsub.close()
+        pubsub = None
+
+    try:
+        result = check()
+        while not result and time.time() < deadline:
+            if pubsub is None:
+                time.sleep(min(FALLBACK_POLL_SECONDS, max(0, deadline - time.time())))
+            elif not _next_message(pubsub, deadline):
+                continue
+            result = check()
+        return result
+    finally:
+        if pubsub is not None:
+            pubsub.close()
+
+
+def _next_message(pubsub, deadline):
+    try:
+        return pubsub.get_message(timeout=max(0, deadline - time.time()))
+    except redis.exceptions.RedisError as e:
+        log.warning('Lost our Redis subscription while waiting: {}', e)
+        time.sleep(min(FALLBACK_POLL_SECONDS, max(0, deadline - time.time())))
+        return True
@@ -1,4 +1,5 @@
 from sqlalchemy import not_
+from sqlalchemy.orm import joinedload
 from uber.barcode import generate_barcode_from_badge_num
 from uber.config import c
 from uber.models.attendee import Attendee
@@ -24,8 +25,9 @@ class PersonalizedBadgeReport(ReportBase):
 
     def run(self, out, session, *filters, order_by=None, badge_type_override=None):
         for a in (session.query(Attendee)
+                         .options(joinedload(Attendee.group))
                          .filter(Attendee.has_badge == True, *filters)
-                         .order_by(order_by).all()):
+                         .order_by(order_by).yield_per(1000)):
 
             # write the actual data
             row = [a.id, a.badge_num] if self._include_badge_nums else [a.id]
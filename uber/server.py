@@ -1,17 +1,24 @@
+import hashlib
 import json
 import mimetypes
 import os
+import threading
+import time
 import traceback
+from collections import defaultdict
+from contextlib import ExitStack
 from pprint import pformat
 
 import cherrypy
 import sentry_sdk
 import jinja2
+import redis
 from cherrypy import HTTPError
-from pockets import is_listy
+from pockets import is_listy, unwrap
 from pockets.autolog import log
 from sideboard.jsonrpc import json_handler, ERR_INVALID_RPC, ERR_MISSING_FUNC, ERR_INVALID_PARAMS, \
     ERR_FUNC_EXCEPTION, ERR_INVALID_JSON
+from sideboard.lib import on_startup
 from sideboard.websockets import trigger_delayed_notifications
 
 from uber.config import c, Config
@@ -166,63 +173,117 @@ class StaticViews:
 
 
 class AngularJavascript:
-    @cherrypy.expose
-    def magfest_js(self):
+    """
+    We have several Angular apps which need to be able to access our constants like c.ATTENDEE_BADGE and such.
+    We also need those apps to be able to make HTTP requests with CSRF tokens, so we set that default.
+
+    Plain constants don't change while we're running, so they're serialized once per process into constants.js,
+    which browsers cache for as long as the content hash in its URL stays the same.  Config properties, including
+    the @dynamic ones which run database queries, are served separately by dynamic_constants.js with a short cache.
+    Neither contains the CSRF token; pages set window.MAGFEST_CSRF_TOKEN instead (see the angular_constants()
+    template function).  magfest.js and static_magfest.js still serve everything in one script.
+    """
+    DYNAMIC_MAX_AGE = 60
+    PER_REQUEST_PROPERTIES = ['CSRF_TOKEN', 'QUERY_STRING', 'QUERY_STRING_NO_MSG']
+
+    _constants = None
+    _constants_lock = threading.Lock()
+
+    @classmethod
+    def constants(cls):
         """
-        We have several Angular apps which need to be able to access our constants like c.ATTENDEE_BADGE and such.
-        We also need those apps to be able to make HTTP requests with CSRF tokens, so we set that default.
+        Returns the text of constants.js and its content hash, building them on first use.
         """
-        cherrypy.response.headers['Content-Type'] = 'text/javascript'
+        if cls._constants is None:
+            with cls._constants_lock:
+                if cls._constants is None:
+                    consts = {}
+                    for attr in dir(c):
+                        if hasattr(getattr(Config, attr, None), 'fget'):
+                            continue
+                        try:
+                            consts[attr] = getattr(c, attr, None)
+                        except Exception:
+                            pass
+
+                    js = '\n'.join([
+                        'window.magconsts = angular.extend(window.magconsts || {{}}, {});'.format(cls._to_json(consts)),
+                        'angular.module("magfest", [])',
+                        '.constant("c", window.magconsts)',
+                        '.constant("magconsts", window.magconsts)',
+                        '.run(function ($http) {',
+                        '   var csrfToken = window.MAGFEST_CSRF_TOKEN || window.csrf_token;',
+                        '   $http.defaults.headers.common["CSRF-Token"] = csrfToken;',
+                        '});'
+                    ])
+                    cls._constants = js, hashlib.sha256(js.encode('utf-8')).hexdigest()[:16]
+        return cls._constants
+
+    @staticmethod
+    def _to_json(consts):
+        return json.dumps({k: v for k, v in consts.items() if isinstance(v, (bool, int, str))},
+                          indent=4, sort_keys=True)
 
+    @classmethod
+    def properties_js(cls, dynamic=True):
+        """
+        Returns a script which adds our config properties to the constants, skipping the @dynamic properties
+        which generate database queries unless `dynamic` is set.  Properties which describe the current request,
+        like the CSRF token and query string, are left out so the script can be shared between pages.
+        """
         consts = {}
         for attr in dir(c):
+            fget = getattr(getattr(Config, attr, None), 'fget', None)
+            if not fget or attr in cls.PER_REQUEST_PROPERTIES or (not dynamic and getattr(fget, '_dynamic', None)):
+                continue
             try:
                 consts[attr] = getattr(c, attr, None)
             except Exception:
                 pass
+        return 'window.magconsts = angular.extend(window.magconsts || {{}}, {});'.format(cls._to_json(consts))
+
+    @staticmethod
+    def _serve(js, etag, cache_control):
+        cherrypy.response.headers['Content-Type'] = 'text/javascript'
+        cherrypy.response.headers['ETag'] = '"{}"'.format(etag)
+        cherrypy.response.headers['Cache-Control'] = cache_control
+        cherrypy.lib.cptools.validate_etags()
+        return js
+
+    @cherrypy.expose
+    def constants_js(self, v=None):
+        js, content_hash = self.constants()
+        cache_control = 'public, max-age=31536000, immutable' if v == content_hash else 'no-cache'
+        return self._serve(js, content_hash, cache_control)
+
+    @cherrypy.expose
+    def dynamic_constants_js(self, dynamic='true'):
+        js = self.properties_js(dynamic=dynamic != 'false')
+        etag = hashlib.sha256(js.encode('utf-8')).hexdigest()[:16]
+        return self._serve(js, etag, 'private, max-age={}'.format(self.DYNAMIC_MAX_AGE))
 
-        js_consts = json.dumps({k: v for k, v in consts.items() if isinstance(v, (bool, int, str))}, indent=4)
+    def _combined_js(self, dynamic):
+        cherrypy.response.headers['Content-Type'] = 'text/javascript'
         return '\n'.join([
-            'angular.module("magfest", [])',
-            '.constant("c", {})'.format(js_consts),
-            '.constant("magconsts", {})'.format(js_consts),
-            '.run(function ($http) {',
-            '   $http.defaults.headers.common["CSRF-Token"] = "{}";'.format(c.CSRF_TOKEN),
-            '});'
+            'window.MAGFEST_CSRF_TOKEN = {};'.format(json.dumps(c.CSRF_TOKEN)),
+            self.constants()[0],
+            self.properties_js(dynamic)
         ])
 
+    @cherrypy.expose
+    def magfest_js(self):
+        return self._combined_js(dynamic=True)
+
     @cherrypy.expose
     def static_magfest_js(self):
         """
-        We have several Angular apps which need to be able to access our constants like c.ATTENDEE_BADGE and such.
-        We also need those apps to be able to make HTTP requests with CSRF tokens, so we set that default.
-
         The static_magfest_js() version of magfest_js() omits any config
         properties that generate database queries.
         """
-        cherrypy.response.headers['Content-Type'] = 'text/javascript'
+        return self._combined_js(dynamic=False)
 
-        consts = {}
-        for attr in dir(c):
-            try:
-                prop = getattr(Config, attr, None)
-                if prop:
-                    fget = getattr(prop, 'fget', None)
-                    if fget and getattr(fget, '_dynamic', None):
-                        continue
-                consts[attr] = getattr(c, attr, None)
-            except Exception:
-                pass
 
-        js_consts = json.dumps({k: v for k, v in consts.items() if isinstance(v, (bool, int, str))}, indent=4)
-        return '\n'.join([
-            'angular.module("magfest", [])',
-            '.constant("c", {})'.format(js_consts),
-            '.constant("magconsts", {})'.format(js_consts),
-            '.run(function ($http) {',
-            '   $http.defaults.headers.common["CSRF-Token"] = "{}";'.format(c.CSRF_TOKEN),
-            '});'
-        ])
+on_startup(AngularJavascript.constants)
 
 
 @all_renderable(public=True)
@@ -265,28 +326,73 @@ cherrypy.tree.mount(Root(), c.CHERRYPY_MOUNT_PATH, c.APPCONF)
 static_overrides(os.path.join(c.MODULE_ROOT, 'static'))
 
 
+def _record_jsonrpc_stats(calls):
+    """
+    Adds the (method, seconds, failed) of each call to the per-method JSON-RPC
+    statistics in Redis, which are shown on the API reference page.
+    """
+    key = c.REDIS_PREFIX + 'jsonrpc_stats'
+    try:
+        pipe = c.REDIS_STORE.pipeline()
+        for method, seconds, failed in calls:
+            pipe.hincrby(key, method + ':calls')
+            pipe.hincrbyfloat(key, method + ':seconds', seconds)
+            if failed:
+                pipe.hincrby(key, method + ':errors')
+        pipe.execute()
+    except redis.exceptions.RedisError as e:
+        log.warning('Unable to record JSON-RPC stats: {}', e)
+
+
+def jsonrpc_stats():
+    """
+    Returns a dict mapping each JSON-RPC method which has been called to its
+    number of calls, number of errors, and average time in milliseconds.
+    """
+    stats = defaultdict(lambda: {'calls': 0, 'errors': 0, 'seconds': 0.0})
+    for field, value in c.REDIS_STORE.hgetall(c.REDIS_PREFIX + 'jsonrpc_stats').items():
+        method, _, stat = field.rpartition(':')
+        stats[method][stat] = float(value) if stat == 'seconds' else int(value)
+    for stat in stats.values():
+        stat['avg_ms'] = 1000 * stat['seconds'] / stat['calls'] if stat['calls'] else None
+    return dict(stats)
+
+
 def _make_jsonrpc_handler(services, debug=c.DEV_BOX, precall=lambda body: None):
 
-    @cherrypy.expose
-    @cherrypy.tools.force_json_in()
-    @cherrypy.tools.json_out(handler=json_handler)
-    def _jsonrpc_handler(self=None):
+    def _resolve(request_body):
+        """
+        Returns the service function for a request body, or None if it doesn't name one.
+        """
+        method = request_body.get('method') if isinstance(request_body, dict) else None
+        if not isinstance(method, str) or method.count('.') != 1:
+            return None
+        module, function = method.split('.')
+        return getattr(services[module], function, None) if module in services else None
+
+    def _is_read_only(request_body):
+        func = _resolve(request_body)
+        required_access = getattr(unwrap(func), 'required_access', None) if func else None
+        return bool(required_access) and required_access <= {'api_read'}
+
+    def _call(request_body, stats):
+        """
+        Makes a single JSON-RPC call and returns its HTTP status and response.
+        Never raises, so each call in a batch succeeds or fails on its own.
+        """
         id = None
 
         def error(status, code, message):
             response = {'jsonrpc': '2.0', 'id': id, 'error': {'code': code, 'message': message}}
             log.debug('Returning error message: {}', repr(response).encode('utf-8'))
-            cherrypy.response.status = status
-            return response
+            return status, response
 
         def success(result):
             response = {'jsonrpc': '2.0', 'id': id, 'result': result}
             log.debug('Returning success message: {}', {
                 'jsonrpc': '2.0', 'id': id, 'result': len(result) if is_listy(result) else str(result).encode('utf-8')})
-            cherrypy.response.status = 200
-            return response
+            return 200, response
 
-        request_body = cherrypy.request.json
         if not isinstance(request_body, dict):
             return error(400, ERR_INVALID_JSON, 'Invalid json input: {!r}'.format(request_body))
 
@@ -313,19 +419,73 @@ def _make_jsonrpc_handler(services, debug=c.DEV_BOX, precall=lambda body: None):
 
         args, kwargs = (params, {}) if isinstance(params, list) else ([], params)
 
-        precall(request_body)
+        status = 500
+        started = time.perf_counter()
         try:
-            return success(getattr(service, function)(*args, **kwargs))
+            precall(request_body)
+            status, response = success(getattr(service, function)(*args, **kwargs))
         except HTTPError as http_error:
-            return error(http_error.code, ERR_FUNC_EXCEPTION, http_error._message)
+            status, response = error(http_error.code, ERR_FUNC_EXCEPTION, http_error._message)
         except Exception as e:
             log.error('Unexpected error', exc_info=True)
             message = 'Unexpected error: {}'.format(e)
             if debug:
                 message += '\n' + traceback.format_exc()
-            return error(500, ERR_FUNC_EXCEPTION, message)
+            status, response = error(500, ERR_FUNC_EXCEPTION, message)
         finally:
+            elapsed = time.perf_counter() - started
+            stats.append((method, elapsed, status != 200))
+            log.debug('jsonrpc {} took {:.1f}ms', method, elapsed * 1000)
             trigger_delayed_notifications()
+        return status, response
+
+    def _call_batch(request_body, stats):
+        """
+        Makes each call in a JSON-RPC 2.0 batch in order.  Runs of consecutive
+        read-only calls share one database session, and authentication is only
+        checked once per access level for the whole batch.
+        """
+        from uber.models import Session
+
+        cherrypy.request.api_auth_checked = {}
+        shared, sharing = ExitStack(), False
+        responses = []
+        try:
+            for call in request_body:
+                if not _is_read_only(call):
+                    shared.close()
+                    sharing = False
+                elif not sharing:
+                    shared.enter_context(Session.shared())
+                    sharing = True
+                responses.append(_call(call, stats)[1])
+        finally:
+            shared.close()
+            del cherrypy.request.api_auth_checked
+        return responses
+
+    @cherrypy.expose
+    @cherrypy.tools.force_json_in()
+    @cherrypy.tools.json_out(handler=json_handler)
+    def _jsonrpc_handler(self=None):
+        request_body = cherrypy.request.json
+        stats = []
+        try:
+            if isinstance(request_body, list):
+                if not request_body or len(request_body) > c.API_MAX_BATCH_SIZE:
+                    cherrypy.response.status = 400
+                    return {'jsonrpc': '2.0', 'id': None, 'error': {
+                        'code': ERR_INVALID_RPC,
+                        'message': 'Batches must have between 1 and {} calls'.format(c.API_MAX_BATCH_SIZE)}}
+                cherrypy.response.status = 200
+                return _call_batch(request_body, stats)
+
+            status, response = _call(request_body, stats)
+            cherrypy.response.status = status
+            return response
+        finally:
+            if stats:
+                _record_jsonrpc_stats(stats)
 
     return _jsonrpc_handler
 
@@ -4,6 +4,7 @@ from inspect import getargspec, getmembers, ismethod
 
 import cherrypy
 import pytz
+import redis
 import stripe
 from pockets import unwrap
 from pockets.autolog import log
@@ -39,9 +40,14 @@ class Root:
         }
 
     def reference(self, session):
-        from uber.server import jsonrpc_services as jsonrpc
+        from uber.server import jsonrpc_services as jsonrpc, jsonrpc_stats
         newlines = re.compile(r'(^|[^\n])\n([^\n]|$)')
         admin_account = session.current_admin_account()
+        try:
+            stats = jsonrpc_stats()
+        except redis.exceptions.RedisError as e:
+            log.warning('Unable to load JSON-RPC stats: {}', e)
+            stats = {}
         services = []
         for name in sorted(jsonrpc.keys()):
             service = jsonrpc[name]
@@ -59,7 +65,8 @@ class Root:
                         'name': method_name,
                         'doc': newlines.sub(r'\1 \2', doc).strip(),
                         'args': args,
-                        'required_access': required_access
+                        'required_access': required_access,
+                        'stats': stats.get('{}.{}'.format(name, method_name)),
                     })
             doc = service.__doc__ or ''
             services.append({
@@ -18,8 +18,10 @@ from sqlalchemy.types import Date, Boolean, Integer
 from sqlalchemy import text
 
 from uber.badge_funcs import badge_consistency_check
-from uber.config import c, _config
-from uber.decorators import all_renderable, csv_file, public, set_csv_filename, site_mappable
+from uber.config import c, _config, invalidate_shared_cache, shared_cache_stats
+from uber.decorators import all_renderable, cached_page_stats, csrf_protected, csv_file, invalidate_cached_pages, \
+    public, set_csv_filename, site_mappable
+from uber.errors import HTTPRedirect
 from uber.models import Choice, MultiChoice, Session, UTCDateTime
 from uber.tasks.health import ping
 
@@ -42,10 +44,12 @@ def run_git_cmd(cmd):
 
 
 def prepare_model_export(model, filtered_models=None):
-    rows = []
-
+    """
+    Yields a header row and then a row for each of the filtered models, so
+    large exports can be streamed straight from a yield_per() query.
+    """
     cols = [getattr(model, col.name) for col in model.__table__.columns]
-    rows.append([col.name for col in cols])
+    yield [col.name for col in cols]
 
     for model in filtered_models:
         row = []
@@ -71,8 +75,7 @@ def prepare_model_export(model, filtered_models=None):
                 # For everything else we'll just dump the value, although we might
                 # consider adding more special cases for things like foreign keys.
                 row.append(getattr(model, col.name))
-        rows.append(row)
-    return rows
+        yield row
 
 @all_renderable()
 class Root:
@@ -112,6 +115,24 @@ class Root:
             'ran_check': run_check,
         }
 
+    def config_cache(self, message=''):
+        return {
+            'message': message,
+            'enabled': c.SHARED_CONFIG_CACHE,
+            'stats': shared_cache_stats(),
+            'page_stats': cached_page_stats(),
+        }
+
+    @csrf_protected
+    def clear_config_cache(self):
+        invalidate_shared_cache()
+        raise HTTPRedirect('config_cache?message={}', 'Shared config cache cleared')
+
+    @csrf_protected
+    def clear_cached_pages(self):
+        invalidate_cached_pages()
+        raise HTTPRedirect('config_cache?message={}', 'Cached pages marked stale')
+
     def csv_import(self, message='', all_instances=None):
         return {
             'message': message,
@@ -199,12 +220,11 @@ class Root:
             'tables': sorted(model.__name__ for model in Session.all_models())
         }
 
-    @csv_file
-    def export_model(self, out, session, selected_model=''):
+    @csv_file(stream=True)
+    def export_model(self, session, selected_model=''):
         model = Session.resolve_model(selected_model)
-        rows = prepare_model_export(model, filtered_models=session.query(model).all())
-        for row in rows:
-            out.writerow(row)
+        yield from prepare_model_export(
+            model, filtered_models=session.query(model).enable_eagerloads(False).yield_per(1000))
 
     @public
     def health(self, session):
@@ -2,7 +2,6 @@ from collections import defaultdict, OrderedDict
 from datetime import timedelta
 import random
 
-from pockets.autolog import log
 from sqlalchemy import and_, or_
 from sqlalchemy.orm import joinedload, subqueryload
 
@@ -10,6 +9,7 @@ from uber.config import c
 from uber.decorators import all_renderable, csv_file
 from uber.models import Attendee, HotelRequests, Job, Room, RoomAssignment, Shift
 from uber.utils import noon_datetime
+from uber.zipcodes import zipcode_index
 
 
 def _inconsistent_shoulder_shifts(session):
@@ -404,21 +404,15 @@ class Root:
             'Zip Code',
             'Non-US?'
         ])
-        engine = None
-        if c.MAPS_ENABLED:
-            from uszipcode import SearchEngine
-            try:
-                engine = SearchEngine(db_file_dir=c.MAPS_DIR)
-            except Exception as e:
-                log.error("Error calling SearchEngine: " + e)
+        zipcodes = zipcode_index() if c.MAPS_ENABLED else None
 
         for attendee in session.valid_attendees().filter(Attendee.is_unassigned == False):
             city = ''
             state = ''
-            if engine and attendee.zip_code and not attendee.international:
-                simple_zip = engine.by_zipcode(attendee.zip_code[:5])
-                city = simple_zip.city
-                state = simple_zip.state
+            found = zipcodes.get(attendee.zip_code) if zipcodes and not attendee.international else None
+            if found:
+                city = found.city
+                state = found.state
             out.writerow([
                 attendee.first_name,
                 attendee.last_name,
@@ -68,14 +68,13 @@ class Root:
         }
 
     def badges(self, session):
-        possibles = session.possible_match_list()
+        unmatched = [a for team in session.mits_teams() if team.status == c.ACCEPTED
+                     for a in team.applicants if not a.attendee_id]
+        possibles = session.possible_match_list(unmatched)
 
         applicants = []
-        for team in session.mits_teams():
-            if team.status == c.ACCEPTED:
-                for a in team.applicants:
-                    if not a.attendee_id:
-                        applicants.append([a, set(possibles[a.email.lower()] + possibles[a.first_name, a.last_name])])
+        for a in unmatched:
+            applicants.append([a, set(possibles[a.email.lower()] + possibles[a.first_name, a.last_name])])
 
         return {'applicants': applicants}
 
@@ -138,12 +138,13 @@ class Root:
         }
 
     def badges(self, session):
-        possibles = session.possible_match_list()
+        unmatched = [pa for pa in session.panel_applicants()
+                     if not pa.attendee_id and pa.application.status == c.ACCEPTED]
+        possibles = session.possible_match_list(unmatched)
 
         applicants = []
-        for pa in session.panel_applicants():
-            if not pa.attendee_id and pa.application.status == c.ACCEPTED:
-                applicants.append([pa, set(possibles[pa.email.lower()] + possibles[pa.first_name, pa.last_name])])
+        for pa in unmatched:
+            applicants.append([pa, set(possibles[pa.email.lower()] + possibles[pa.first_name, pa.last_name])])
 
         return {'applicants': applicants}
 
@@ -9,7 +9,7 @@ from uber.config import c
 from uber.decorators import ajax, all_renderable, csv_file, log_pageview, site_mappable
 from uber.errors import HTTPRedirect
 from uber.models import PromoCode, PromoCodeWord, Session
-from uber.utils import check, check_all, localized_now
+from uber.utils import check, localized_now
 
 
 @all_renderable()
@@ -118,8 +118,7 @@ class Root:
         except Exception:
             params['is_single_promo_code'] = 0
 
-        words = PromoCodeWord.group_by_parts_of_speech(
-            session.query(PromoCodeWord).order_by(PromoCodeWord.normalized_word).all())
+        words = c.PROMO_CODE_WORDS
 
         result = dict(
             params,
@@ -128,20 +127,16 @@ class Root:
             words=[(i, s) for (i, s) in words.items()])
 
         if cherrypy.request.method == 'POST':
-            codes = None
+            generator = None
             if params['is_single_promo_code']:
                 params['count'] = 1
-                if params['code']:
-                    codes = [params['code']]
 
-            if params['use_words'] and not codes and \
-                    not any(s for (_, s) in words.items()):
-                result['message'] = 'Please add some promo code words!'
-                return result
-
-            if not codes:
+            if not params['is_single_promo_code'] or not params['code']:
                 if params['use_words']:
-                    codes = PromoCode.generate_word_code(params['count'])
+                    if not any(s for (_, s) in words.items()):
+                        result['message'] = 'Please add some promo code words!'
+                        return result
+                    generator = PromoCode.word_code_generator()
                 else:
                     try:
                         length = int(params['length'])
@@ -151,20 +146,27 @@ class Root:
                         segment_length = int(params['segment_length'])
                     except Exception:
                         segment_length = 3
-                    codes = PromoCode.generate_random_code(
-                        params['count'], length, segment_length)
+                    generator = PromoCode.random_code_generator(length, segment_length)
+                params['code'] = ''
 
-            promo_codes = []
-            for code in codes:
-                params['code'] = code
-                promo_codes.append(PromoCode().apply(params, restricted=False))
-
-            message = check_all(promo_codes)
+            # Check a single promo code with the requested settings; generated
+            # codes are copies of it which differ only in their codes.
+            promo_code = PromoCode().apply(params, restricted=False)
+            message = check(promo_code)
             if message:
                 result['message'] = message
                 return result
 
-            result['promo_codes'] = session.bulk_insert(promo_codes)
+            if generator:
+                promo_code_ids = session.insert_promo_codes(params['count'], generator, **{
+                    name: getattr(promo_code, name)
+                    for name in ['discount', 'discount_type', 'expiration_date', 'uses_allowed']})
+                session.commit()
+                result['promo_codes'] = session.query(PromoCode).filter(
+                    PromoCode.id.in_(promo_code_ids)).order_by(PromoCode.code).all() if promo_code_ids else []
+            else:
+                result['promo_codes'] = session.bulk_insert([promo_code])
+
             generated_count = len(result['promo_codes'])
             if generated_count <= 0:
                 result['message'] = "Could not generate any of the requested " \
@@ -803,9 +803,10 @@ class Root:
         raise HTTPRedirect('orphaned_attendees?show_all={}&message={}', show_all, ' '.join(messages))
 
     def payment_pending_attendees(self, session):
-        possibles = session.possible_match_list()
         attendees = []
-        pending = session.query(Attendee).filter_by(paid=c.PENDING).filter(Attendee.badge_status != c.INVALID_STATUS)
+        pending = session.query(Attendee).filter_by(paid=c.PENDING) \
+            .filter(Attendee.badge_status != c.INVALID_STATUS).all()
+        possibles = session.possible_match_list(pending)
         for attendee in pending:
             attendees.append([attendee, set(possibles[attendee.email.lower()] + 
                                             possibles[attendee.first_name, attendee.last_name])])
@@ -977,9 +978,9 @@ class Root:
 
         raise HTTPRedirect('manage_workstations?message={}', f"Started closeout for workstations matching ID(s) {params.get('workstation_ids')}.{extra_warning}")
 
-    @csv_file
+    @csv_file(stream=True)
     @not_site_mappable
-    def attendee_search_export(self, out, session, search_text='', order='last_first', invalid=''):
+    def attendee_search_export(self, session, search_text='', order='last_first', invalid=''):
         filter = Attendee.badge_status.in_([c.NEW_STATUS, c.COMPLETED_STATUS, c.WATCHED_STATUS]) if not invalid else None
         
         search_text = search_text.strip()
@@ -989,11 +990,9 @@ class Root:
         if error:
             raise HTTPRedirect('../registration/index?search_text={}&order={}&invalid={}&message={}'
                               ).format(search_text, order, invalid, error)
-        attendees = attendees.order(order)
+        attendees = attendees.order(order).enable_eagerloads(False).yield_per(1000)
 
-        rows = devtools.prepare_model_export(Attendee, filtered_models=attendees)
-        for row in rows:
-            out.writerow(row)
+        yield from devtools.prepare_model_export(Attendee, filtered_models=attendees)
 
     def attendee_account_form(self, session, id, message='', **params):
         account = session.attendee_account(id)
@@ -30,6 +30,7 @@ from uber.site_sections.preregistration import check_if_can_reg
 from uber.utils import add_opt, check, check_pii_consent, get_page, hour_day_format, \
     localized_now, Order, normalize_email, validate_model
 from uber.payments import TransactionRequest, ReceiptManager, SpinTerminalRequest
+from uber.push import terminal_channel, wait_for
 
 
 def check_atd(func):
@@ -309,14 +310,27 @@ class Root:
         raise HTTPRedirect('../reg_admin/manage_workstations?message={}', message)
     
     @ajax
-    def poll_terminal_payment(self, session, **params):
+    def poll_terminal_payment(self, session, wait=0, **params):
+        """
+        Returns the result of this workstation's terminal transaction.  If `wait` is set and the
+        transaction hasn't finished yet, waits up to that many seconds (at most c.LONG_POLL_SECONDS)
+        for it to finish before answering.
+        """
         from spin_rest_utils import utils as spin_rest_utils
         error, terminal_id = session.get_assigned_terminal_id()
 
         if error:
             return {'error': error}
 
-        terminal_status = c.REDIS_STORE.hgetall(c.REDIS_PREFIX + 'spin_terminal_txns:' + terminal_id)
+        def finished_status():
+            status = c.REDIS_STORE.hgetall(c.REDIS_PREFIX + 'spin_terminal_txns:' + terminal_id)
+            return status if status.get('last_error') or status.get('last_response') else None
+
+        wait = min(int(wait or 0), c.LONG_POLL_SECONDS)
+        if wait > 0:
+            session.commit()  # Don't hold a database connection while we wait
+        terminal_status = wait_for([terminal_channel(terminal_id)], wait, finished_status) if wait > 0 else None
+        terminal_status = terminal_status or c.REDIS_STORE.hgetall(c.REDIS_PREFIX + 'spin_terminal_txns:' + terminal_id)
         error_message = terminal_status.get('last_error', '')
         intent_id = terminal_status.get('intent_id', '')
         response = json.loads(terminal_status.get('last_response')) if terminal_status.get('last_response') else {}
@@ -1186,7 +1200,7 @@ class Root:
                 model_class = Session.resolve_model(tracked_delete.model)
 
             if model_class:
-                params = json.loads(tracked_delete.snapshot)
+                params = tracked_delete.delta or json.loads(tracked_delete.snapshot)
                 model_id = params.get('id').strip()
                 if model_id:
                     existing_model = session.query(model_class).filter(
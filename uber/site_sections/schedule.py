@@ -60,7 +60,7 @@ def get_schedule_data(session, message):
 
 @all_renderable()
 class Root:
-    @cached
+    @cached(invalidated_by=['Event', 'AssignedPanelist'])
     @schedule_view
     def index(self, session, message=''):
         if c.ALT_SCHEDULE_URL:
@@ -12,9 +12,10 @@ class Root:
     @log_pageview
     def index(self, session, message='', **params):
         watchlist_entries = session.query(WatchList).order_by(WatchList.last_name).all()
+        attendee_guesses = session.guess_watchlist_attendees()
         for entry in watchlist_entries:
             if entry.active:
-                entry.attendee_guesses = session.guess_watchentry_attendees(entry)
+                entry.attendee_guesses = attendee_guesses.get(entry.id, [])
 
         return {
             'watchlist_entries': watchlist_entries,
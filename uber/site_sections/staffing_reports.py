@@ -141,7 +141,7 @@ class Root:
     def consecutive_threshold(self, session):
         def exceeds_threshold(start_time, attendee):
             time_slice = (start_time, start_time + timedelta(hours=18))
-            return len([h for h in attendee.shift_minutes if time_slice[0] < h < time_slice[1]]) >= 13 * 60
+            return attendee.shift_intervals.minutes_between(*time_slice) >= 13 * 60
         flagged = []
         for attendee in session.staffers():
             if attendee.staffing and attendee.unweighted_hours >= 12:
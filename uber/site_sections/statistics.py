@@ -1,18 +1,17 @@
 from collections import Counter, defaultdict, OrderedDict
 
-from geopy.distance import VincentyDistance
 from pockets.autolog import log
 from pytz import UTC
-import six
-from sqlalchemy import and_, func
-from sqlalchemy.orm import joinedload
+from sqlalchemy import and_, distinct, func
 from sqlalchemy.sql.expression import literal
 
 from uber.config import c
-from uber.decorators import ajax, all_renderable, csv_file, not_site_mappable
+from uber.decorators import ajax, ajax_gettable, all_renderable, csv_file, not_site_mappable
+from uber.errors import HTTPRedirect
 from uber.jinja import JinjaEnv
-from uber.models import Attendee, Group, PromoCode, Tracking
-from uber.utils import localize_datetime
+from uber.models import Attendee, CheckIn, Group, PromoCode
+from uber.utils import hour_day_format, localize_datetime
+from uber.zipcodes import zipcode_index
 
 
 @JinjaEnv.jinja_filter
@@ -163,26 +162,8 @@ class RegistrationDataOneYear:
 @all_renderable()
 class Root:
     def index(self, session):
-        counts = defaultdict(OrderedDict)
-        counts['donation_tiers'] = OrderedDict([(k, 0) for k in sorted(c.DONATION_TIERS.keys()) if k > 0])
-
-        counts.update({
-            'groups': {'paid': 0, 'free': 0},
-            'noshows': {'paid': 0, 'free': 0},
-            'checked_in': {'yes': 0, 'no': 0}
-        })
-        count_labels = {
-            'badges': c.BADGE_OPTS,
-            'paid': c.PAYMENT_OPTS,
-            'ages': c.AGE_GROUP_OPTS,
-            'ribbons': c.RIBBON_OPTS,
-            'interests': c.INTEREST_OPTS,
-            'statuses': c.BADGE_STATUS_OPTS,
-            'checked_in_by_type': c.BADGE_OPTS,
-        }
-        for label, opts in count_labels.items():
-            for val, desc in opts:
-                counts[label][desc] = 0
+        counts = defaultdict(OrderedDict, c.ATTENDEE_STATS)
+
         badge_stocks = c.BADGE_PRICES['stocks']
         for var in c.BADGE_VARS:
             badge_type = getattr(c, var)
@@ -194,33 +175,6 @@ class Root:
             counts['shirt_stocks'][c.PREREG_SHIRTS[shirt_enum_key]] = shirt_stocks.get(shirt_enum_key, 'no limit set')
             counts['shirt_counts'][c.PREREG_SHIRTS[shirt_enum_key]] = c.REDIS_STORE.hget(c.REDIS_PREFIX + 'shirt_counts', shirt_enum_key)
 
-        for a in session.query(Attendee).options(joinedload(Attendee.group)):
-            counts['statuses'][a.badge_status_label] += 1
-            
-            if a.badge_status not in [c.INVALID_GROUP_STATUS, c.INVALID_STATUS, c.IMPORTED_STATUS, c.REFUNDED_STATUS]:
-                counts['paid'][a.paid_label] += 1
-                counts['ages'][a.age_group_label] += 1
-                for val in a.ribbon_ints:
-                    counts['ribbons'][c.RIBBONS[val]] += 1
-                counts['badges'][a.badge_type_label] += 1
-                counts['checked_in']['yes' if a.checked_in else 'no'] += 1
-                if a.checked_in:
-                    counts['checked_in_by_type'][a.badge_type_label] += 1
-                for val in a.interests_ints:
-                    counts['interests'][c.INTERESTS[val]] += 1
-                if a.paid == c.PAID_BY_GROUP and a.group:
-                    counts['groups']['paid' if a.group.amount_paid else 'free'] += 1
-
-                donation_amounts = list(counts['donation_tiers'].keys())
-                for index, amount in enumerate(donation_amounts):
-                    next_amount = donation_amounts[index + 1] if index + 1 < len(donation_amounts) else six.MAXSIZE
-                    if a.amount_extra >= amount and a.amount_extra < next_amount:
-                        counts['donation_tiers'][amount] = counts['donation_tiers'][amount] + 1
-                if not a.checked_in:
-                    is_paid = a.paid == c.HAS_PAID or a.paid == c.PAID_BY_GROUP and a.group and a.group.amount_paid
-                    key = 'paid' if is_paid else 'free'
-                    counts['noshows'][key] += 1
-
         return {
             'counts': counts,
         }
@@ -252,129 +206,133 @@ class Root:
     
     @csv_file
     def checkins_by_admin_by_hour(self, out, session):
-        header = ["Time", "Total Checked In"]
-        admins = session.query(Tracking.who).filter(Tracking.action == c.UPDATED,
-                                                    Tracking.model == "Attendee",
-                                                    Tracking.data.contains("checked_in='None -> datetime")
-                                                    ).group_by(Tracking.who).order_by(Tracking.who).distinct().all()
-        for admin in admins:
-            if not isinstance(admin, six.string_types):
-                admin = admin[0] # SQLAlchemy quirk
-            
-            header.append(f"{admin} # Checked In")
-
-        out.writerow(header)
-
-        query_result = session.query(
-            date_trunc_hour(Attendee.checked_in),
-            func.count(date_trunc_hour(Attendee.checked_in))
-        ) \
-            .filter(Attendee.checked_in.isnot(None)) \
-            .group_by(date_trunc_hour(Attendee.checked_in)) \
-            .order_by(date_trunc_hour(Attendee.checked_in)) \
-            .all()
-        
-        for result in query_result:
-            hour = localize_datetime(result[0])
-            count = result[1]
-            row = [hour, count]
-            for admin in admins:
-                if not isinstance(admin, six.string_types):
-                    admin = admin[0] # SQLAlchemy quirk
-                admin_count = session.query(Tracking.which).filter(
-                    date_trunc_hour(Tracking.when) == result[0],
-                    Tracking.who == admin,
-                    Tracking.action == c.UPDATED,
-                    Tracking.model == "Attendee",
-                    Tracking.data.contains("checked_in='None -> datetime")).group_by(Tracking.which).count()
-                row.append(admin_count)
-            out.writerow(row)
+        hour = date_trunc_hour(CheckIn.checked_in)
+        admins = [who for [who] in session.query(CheckIn.who).distinct().order_by(CheckIn.who)]
+        out.writerow(["Time", "Total Checked In"] + [f"{admin} # Checked In" for admin in admins])
+
+        totals = OrderedDict()
+        by_admin = defaultdict(dict)
+        for result_hour, who, count in session.query(hour, CheckIn.who, func.count(distinct(CheckIn.attendee_id))) \
+                .group_by(hour, CheckIn.who).order_by(hour):
+            totals[result_hour] = totals.get(result_hour, 0) + count
+            by_admin[result_hour][who] = count
+
+        for result_hour, total in totals.items():
+            out.writerow([localize_datetime(result_hour), total] + [by_admin[result_hour].get(a, 0) for a in admins])
+
+    def checkins_dashboard(self, session):
+        return {}
+
+    @ajax_gettable
+    def checkin_stats(self, session):
+        """
+        Check-in counts by hour, admin, reg station, and badge type, which the
+        check-in dashboard polls while the event is running.
+        """
+        query = session.query(CheckIn)
+        hour = date_trunc_hour(CheckIn.checked_in)
+
+        def grouped(column):
+            return [
+                [key, count] for key, count in
+                query.with_entities(column, func.count(CheckIn.id)).group_by(column).order_by(column)]
 
+        return {
+            'total': query.count(),
+            'by_hour': [[hour_day_format(localize_datetime(h)), n] for h, n in grouped(hour)],
+            'by_admin': grouped(CheckIn.who),
+            'by_station': [[station or 'None', n] for station, n in grouped(CheckIn.reg_station_id)],
+            'by_badge_type': [[c.BADGES.get(t, t), n] for t, n in grouped(CheckIn.badge_type)],
+        }
 
     if c.MAPS_ENABLED:
-        from uszipcode import SearchEngine
-        zips_counter = Counter()
-        zips = {}
-        try:
-            center = SearchEngine(db_file_dir="/srv/reggie/data").by_zipcode(20745)
-        except Exception as e:
-            log.error("Error calling SearchEngine: " + e)
-
-        def map(self):
+        DEFAULT_CENTER_ZIP = '20745'
+        NO_ZIPCODES_MESSAGE = 'The zip code database could not be loaded, so zip codes cannot be looked up.'
+
+        def _center_zip(self):
+            return c.REDIS_STORE.get(c.REDIS_PREFIX + 'map_center_zip') or self.DEFAULT_CENTER_ZIP
+
+        def _map_center(self):
+            """
+            The zip code the map and radius report are centered on, kept in
+            Redis so every worker process agrees on it.  This is None if we
+            can't find that zip code.
+            """
+            zipcodes = zipcode_index()
+            return zipcodes.get(self._center_zip()) if zipcodes else None
+
+        def _no_center_message(self):
+            if not zipcode_index():
+                return self.NO_ZIPCODES_MESSAGE
+            return 'The map is centered on {}, which is not a zip code we know; please set a new center.'.format(
+                self._center_zip())
+
+        def _zip_counts(self, session):
+            """
+            Returns the number of attendees with badges in each 5-digit zip code.
+            """
+            zip5 = func.substr(Attendee.zip_code, 1, 5)
+            return Counter(dict(session.attendees_with_badges().filter(Attendee.zip_code != '')
+                                .with_entities(zip5, func.count(Attendee.id)).group_by(zip5)))
+
+        def map(self, session, message=''):
+            zipcodes = zipcode_index()
+            zip_counts = self._zip_counts(session) if zipcodes else Counter()
+            zips = {}
+            for zipcode in zip_counts:
+                found = zipcodes.get(zipcode)
+                if found:
+                    zips[zipcode] = found
+
+            center = self._map_center()
             return {
-                'zip_counts': self.zips_counter,
-                'center': self.center,
-                'zips': self.zips
+                'message': message or ('' if center else self._no_center_message()),
+                'zip_counts': zip_counts,
+                'center': center,
+                'zips': zips
             }
 
-        @ajax
-        def refresh(self, session, **params):
-            zips = {}
-            self.zips_counter = Counter()
-            attendees = session.query(Attendee).all()
-            for person in attendees:
-                if person.zip_code:
-                    self.zips_counter[person.zip_code] += 1
-
-            for z in self.zips_counter.keys():
-                try:
-                    found = SearchEngine(db_file_dir="/srv/reggie/data").by_zipcode(int(z))
-                except Exception as e:
-                    log.error("Error calling SearchEngine: " + e)
-                else:
-                    if found.zipcode:
-                        zips[z] = found
-
-            self.zips = zips
-            return True
-
         @csv_file
         @not_site_mappable
         def radial_zip_data(self, out, session, **params):
             if params.get('radius'):
-                try:
-                    res = SearchEngine(db_file_dir="/srv/reggie/data").by_coordinates(
-                        self.center.lat, self.center.lng, radius=int(params['radius']), returns=None)
-                except Exception as e:
-                    log.error("Error calling SearchEngine: " + e)
-                else:
-                    out.writerow(['# of Attendees', 'City', 'State', 'Zipcode', 'Miles from Event', '% of Total Attendees'])
-                    if len(res) > 0:
-                        keys = self.zips.keys()
-                        center_coord = (self.center.lat, self.center.lng)
-                        total_count = session.attendees_with_badges().count()
-                        for x in res:
-                            if x.zipcode in keys:
-                                out.writerow([self.zips_counter[x.zipcode], x.city, x.state, x.zipcode,
-                                            VincentyDistance((x.lat, x.lng), center_coord).miles,
-                                            "%.2f" % float(self.zips_counter[x.zipcode] / total_count * 100)])
+                center = self._map_center()
+                if not center:
+                    raise HTTPRedirect('map?message={}', self._no_center_message())
+
+                out.writerow(['# of Attendees', 'City', 'State', 'Zipcode', 'Miles from Event', '% of Total Attendees'])
+                zip_counts = self._zip_counts(session)
+                total_count = session.attendees_with_badges().count()
+                for found, miles in zipcode_index().within(center.lat, center.lng, int(params['radius'])):
+                    if found.zipcode in zip_counts:
+                        out.writerow([zip_counts[found.zipcode], found.city, found.state, found.zipcode, miles,
+                                      "%.2f" % float(zip_counts[found.zipcode] / total_count * 100)])
 
         @ajax
         def set_center(self, session, **params):
-            if params.get("zip"):
-                try:
-                    self.center = SearchEngine(db_file_dir="/srv/reggie/data").by_zipcode(int(params["zip"]))
-                except Exception as e:
-                    log.error("Error calling SearchEngine: " + e)
-                else:
-                    return "Set to %s, %s - %s" % (self.center.city, self.center.state, self.center.zipcode)
+            zipcodes = zipcode_index()
+            if not zipcodes:
+                return self.NO_ZIPCODES_MESSAGE
+
+            found = zipcodes.get(params.get("zip"))
+            if found:
+                c.REDIS_STORE.set(c.REDIS_PREFIX + 'map_center_zip', found.zipcode)
+                return "Set to %s, %s - %s" % (found.city, found.state, found.zipcode)
             return False
 
         @csv_file
         def attendees_by_state(self, out, session):
-            # Result of set(map(lambda x: x.state, SearchEngine(db_file_dir="/srv/reggie/data").ses.query(SimpleZipcode))) -- literally all the states uszipcode knows about
-            states = ['SD', 'IL', 'WY', 'NV', 'NJ', 'NM', 'UT', 'OR', 'TX', 'NE', 'MS', 'FL', 'VA', 'HI', 'KY', 'MO', 'NY', 'WV', 'DC', 'AR', 'MT', 'MD', 'SC', 'NC', 'KS', 'OH', 'PR', 'CO', 'IN', 'VT', 'LA', 'ND', 'AZ', 'AK', 'AL', 'CT', 'TN', 'PA', 'IA', 'WA', 'ME', 'NH', 'MA', 'ID', 'OK', 'WI', 'GA', 'CA', 'DE', 'MN', 'MI', 'RI']
+            zipcodes = zipcode_index()
+            if not zipcodes:
+                raise HTTPRedirect('index?message={}', self.NO_ZIPCODES_MESSAGE)
+
+            states = zipcodes.states_by_zipcode()
+            state_counts = Counter()
+            for zipcode, count in self._zip_counts(session).items():
+                if zipcode in states:
+                    state_counts[states[zipcode]] += count
             total_count = session.attendees_with_badges().count()
 
             out.writerow(['# of Attendees', 'State', '% of Total Attendees'])
-
-            for state in states:
-                try:
-                    zip_codes = list(map(lambda x: x.zipcode, SearchEngine(db_file_dir="/srv/reggie/data").by_state(state, returns=None)))
-                except Exception as e:
-                    log.error("Error calling SearchEngine: " + e)
-                else:
-                    current_count = session.attendees_with_badges().filter(Attendee.zip_code.in_(zip_codes)).count()
-                    if current_count:
-                        out.writerow([current_count, state, "%.2f" % float(current_count / total_count * 100)])
-
+            for state, current_count in state_counts.most_common():
+                out.writerow([current_count, state, "%.2f" % float(current_count / total_count * 100)])
@@ -1,13 +1,13 @@
-from collections import Mapping
+from collections import defaultdict, Mapping
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta, datetime
 import pytz
-from time import sleep, time
+from time import time
 import traceback
 
 from celery.schedules import crontab
 from pockets import groupify, listify
 from pockets.autolog import log
-from sqlalchemy.orm import joinedload
 
 from uber import utils
 from uber.amazon_ses import email_sender
@@ -23,6 +23,8 @@ __all__ = ['notify_admins_of_pending_emails', 'send_automated_emails', 'send_ema
 
 celery.on_startup(AutomatedEmail.reconcile_fixtures)
 
+_ses_rate_limiter = utils.TokenBucket(c.EMAIL_SEND_RATE)
+
 
 def _is_dev_email(email):
     """
@@ -34,8 +36,49 @@ def _is_dev_email(email):
     return email.endswith('mailinator.com') or email in c.DEVELOPER_EMAIL
 
 
-@celery.task
-def send_email(
+def _recipients(to, cc, bcc):
+    """
+    Returns the to, cc, and bcc address lists we were asked to send to, along
+    with the lists we will actually send to, which on a dev box only include
+    development email addresses.
+    """
+    to, cc, bcc = map(lambda x: listify(x if x else []), [to, cc, bcc])
+    original = to, cc, bcc
+    if c.DEV_BOX:
+        to, cc, bcc = map(lambda xs: list(filter(_is_dev_email, xs)), [to, cc, bcc])
+    return original, (to, cc, bcc)
+
+
+def _email_record(sender, to, cc, bcc, subject, body, model=None, ident=None, automated_email=None):
+    """
+    Returns an unsaved Email record for an email we sent (or would have sent).
+    """
+    body = body.decode('utf-8') if isinstance(body, bytes) else body
+    if isinstance(model, MagModel):
+        fk_kwargs = {'fk_id': model.id, 'model': model.__class__.__name__}
+    elif isinstance(model, Mapping):
+        fk_kwargs = {'fk_id': model.get('id', None), 'model': model.get('_model', model.get('__type__', 'n/a'))}
+    else:
+        fk_kwargs = {'model': 'n/a'}
+
+    if automated_email:
+        if isinstance(automated_email, MagModel):
+            fk_kwargs['automated_email_id'] = automated_email.id
+        elif isinstance(model, Mapping):
+            fk_kwargs['automated_email_id'] = automated_email.get('id', None)
+
+    return Email(
+        subject=subject,
+        body=body,
+        sender=sender,
+        to=','.join(to),
+        cc=','.join(cc),
+        bcc=','.join(bcc),
+        ident=ident or subject,
+        **fk_kwargs)
+
+
+def _deliver_email(
         sender,
         to,
         subject,
@@ -45,15 +88,14 @@ def send_email(
         bcc=(),
         model=None,
         ident=None,
-        automated_email=None,
-        session=None):
-
-    to, cc, bcc = map(lambda x: listify(x if x else []), [to, cc, bcc])
-    original_to, original_cc, original_bcc = to, cc, bcc
-    ident = ident or subject
-    if c.DEV_BOX:
-        to, cc, bcc = map(lambda xs: list(filter(_is_dev_email, xs)), [to, cc, bcc])
-
+        automated_email=None):
+    """
+    Sends one email through SES, waiting on the SES rate limiter first, and
+    returns an unsaved Email record for it, or None if nothing should be
+    recorded. This touches no database session, so it is safe to call from
+    the threads send_automated_emails fans out to.
+    """
+    (original_to, original_cc, original_bcc), (to, cc, bcc) = _recipients(to, cc, bcc)
     record_email = False
 
     if c.SEND_EMAILS and to:
@@ -64,6 +106,7 @@ def send_email(
             }
         log.info('Attempting to send email {}', locals())
 
+        _ses_rate_limiter.acquire()
         try:
             error_msg = email_sender.sendEmail(
                             source=sender,
@@ -77,45 +120,101 @@ def send_email(
                 record_email = True
         except Exception as error:
             log.error('Error while sending email: {}'.format(str(error)))
-        sleep(0.1)  # Avoid hitting rate limit
     else:
         log.error('Email sending turned off, so unable to send {}', locals())
         record_email = True if c.DEV_BOX else False
 
-    if original_to:
-        body = body.decode('utf-8') if isinstance(body, bytes) else body
-        if isinstance(model, MagModel):
-            fk_kwargs = {'fk_id': model.id, 'model': model.__class__.__name__}
-        elif isinstance(model, Mapping):
-            fk_kwargs = {'fk_id': model.get('id', None), 'model': model.get('_model', model.get('__type__', 'n/a'))}
+    if original_to and record_email:
+        return _email_record(sender, original_to, original_cc, original_bcc, subject, body,
+                             model=model, ident=ident, automated_email=automated_email)
+
+
+def _deliver_bulk(sender, format, batch):
+    """
+    Sends a list of rendered emails from one sender and in one format with
+    SendBulkTemplatedEmail, and returns an unsaved Email record for each one
+    which SES accepted. SES reports a status for every recipient, so one bad
+    address only keeps its own record from being written.
+    """
+    emails = []
+    for start in range(0, len(batch), email_sender.BULK_DESTINATION_LIMIT):
+        chunk = batch[start:start + email_sender.BULK_DESTINATION_LIMIT]
+        destinations = []
+        for kwargs in chunk:
+            _, (to, cc, bcc) = _recipients(kwargs['to'], kwargs.get('cc'), kwargs.get('bcc'))
+            destinations.append({'to': to, 'cc': cc, 'bcc': bcc, 'subject': kwargs['subject'], 'body': kwargs['body']})
+
+        _ses_rate_limiter.acquire(len(destinations))
+        errors = email_sender.sendBulkEmail(source=sender, format=format, destinations=destinations)
+        for kwargs, error_msg in zip(chunk, errors):
+            if error_msg:
+                log.error('Error while sending email to {}: {}', kwargs['to'], error_msg)
+            else:
+                (to, cc, bcc), _ = _recipients(kwargs['to'], kwargs.get('cc'), kwargs.get('bcc'))
+                emails.append(_email_record(
+                    sender, to, cc, bcc, kwargs['subject'], kwargs['body'],
+                    model=kwargs.get('model'), ident=kwargs.get('ident'),
+                    automated_email=kwargs.get('automated_email')))
+    return emails
+
+
+@celery.task
+def send_email(
+        sender,
+        to,
+        subject,
+        body,
+        format='text',
+        cc=(),
+        bcc=(),
+        model=None,
+        ident=None,
+        automated_email=None,
+        session=None):
+
+    email = _deliver_email(sender, to, subject, body, format, cc, bcc, model, ident, automated_email)
+    if email:
+        session = session or getattr(model, 'session', getattr(automated_email, 'session', None))
+        if session:
+            session.add(email)
+            session.commit()
         else:
-            fk_kwargs = {'model': 'n/a'}
-
-        if automated_email:
-            if isinstance(automated_email, MagModel):
-                fk_kwargs['automated_email_id'] = automated_email.id
-            elif isinstance(model, Mapping):
-                fk_kwargs['automated_email_id'] = automated_email.get('id', None)
-
-        if record_email:
-            email = Email(
-                subject=subject,
-                body=body,
-                sender=sender,
-                to=','.join(original_to),
-                cc=','.join(original_cc),
-                bcc=','.join(original_bcc),
-                ident=ident,
-                **fk_kwargs)
-
-            session = session or getattr(model, 'session', getattr(automated_email, 'session', None))
-            if session:
+            with Session() as session:
                 session.add(email)
                 session.commit()
+
+
+def _send_batch(pool, batch):
+    """
+    Sends a batch of rendered automated emails (see AutomatedEmail.send_kwargs)
+    in parallel on the given thread pool, then records the ones which went
+    out with a single bulk insert. Returns the number of emails recorded.
+
+    With SES_BULK_SEND on, emails which SES will actually be asked to deliver
+    are grouped by sender and format and sent with SendBulkTemplatedEmail;
+    everything else goes through _deliver_email one at a time.
+
+    The insert uses its own session so that committing it doesn't expire the
+    model instances the caller is still iterating over.
+    """
+    jobs = []
+    if c.SES_BULK_SEND and c.SEND_EMAILS:
+        bulk, single = defaultdict(list), []
+        for kwargs in batch:
+            _, (to, _, _) = _recipients(kwargs['to'], kwargs.get('cc'), kwargs.get('bcc'))
+            if to:
+                bulk[kwargs['sender'], 'text' if kwargs.get('format') == 'text' else 'html'].append(kwargs)
             else:
-                with Session() as session:
-                    session.add(email)
-                    session.commit()
+                single.append(kwargs)
+        jobs.extend(pool.submit(_deliver_bulk, sender, format, emails) for (sender, format), emails in bulk.items())
+        batch = single
+
+    jobs.extend(pool.submit(lambda kwargs: [_deliver_email(**kwargs)], kwargs) for kwargs in batch)
+    emails = [email for job in jobs for email in job.result() if email]
+    if emails:
+        with Session() as session:
+            session.bulk_insert(emails)
+    return len(emails)
 
 
 @celery.schedule(crontab(hour=6, minute=0, day_of_week=1))
@@ -169,10 +268,9 @@ def send_automated_emails():
         expiration = timedelta(hours=1)
         quantity_sent = 0
         start_time = time()
-        with Session() as session:
+        with Session() as session, ThreadPoolExecutor(max_workers=c.EMAIL_SEND_THREADS) as pool:
             active_automated_emails = session.query(AutomatedEmail) \
-                .filter(*AutomatedEmail.filters_for_active) \
-                .options(joinedload(AutomatedEmail.emails)).all()
+                .filter(*AutomatedEmail.filters_for_active).all()
 
             automated_emails_by_model = groupify(active_automated_emails, 'model')
 
@@ -195,24 +293,35 @@ def send_automated_emails():
                     unapproved_count = 0
                     
                     log.debug("Loading instances for " + automated_email.ident)
-                    model_instances = query_func(session)
+                    model_instances = automated_email.filter_unsent(query_func(session))
                     log.trace("Finished loading instances")
+                    batch = []
                     for model_instance in model_instances:
                         log.trace("Checking " + str(model_instance.id))
-                        if model_instance.id not in automated_email.emails_by_fk_id:
-                            if automated_email.would_send_if_approved(model_instance):
-                                if automated_email.approved or not automated_email.needs_approval:
-                                    if getattr(model_instance, 'active_receipt', None):
-                                        session.refresh_receipt_and_model(model_instance)
-                                    automated_email.send_to(model_instance, delay=False)
-                                    quantity_sent += 1
-                                else:
-                                    unapproved_count += 1
+                        if automated_email.would_send_if_approved(model_instance):
+                            if automated_email.approved or not automated_email.needs_approval:
+                                if getattr(model_instance, 'active_receipt', None):
+                                    session.refresh_receipt_and_model(model_instance)
+                                try:
+                                    batch.append(automated_email.send_kwargs(model_instance))
+                                except Exception:
+                                    log.error('Error rendering {!r} email to {}', automated_email.subject,
+                                              model_instance.email_to_address, exc_info=True)
+                            else:
+                                unapproved_count += 1
+
+                        if len(batch) >= c.AUTOMATED_EMAIL_BATCH_SIZE:
+                            quantity_sent += _send_batch(pool, batch)
+                            batch = []
+
                         if datetime.now(pytz.UTC) - last_send_time > (expiration / 2):
                             automated_email.last_send_time = datetime.now(pytz.UTC)
                             session.add(automated_email)
                             session.commit()
 
+                    if batch:
+                        quantity_sent += _send_batch(pool, batch)
+
                     automated_email.unapproved_count = unapproved_count
                     automated_email.currently_sending = False
                     session.add(automated_email)
@@ -222,28 +331,3 @@ def send_automated_emails():
             return {e.ident: e.unapproved_count for e in active_automated_emails if e.unapproved_count > 0}
     except:
         traceback.print_exc()
-
-        # TODO: Once we finish converting each AutomatedEmailFixture.filter
-        #       into an AutomatedEmailFixture.query, we'll be able to remove
-        #       AutomatedEmailFixture.queries entirely and send our
-        #       automated emails using the code below.
-        #
-        # for automated_email in active_automated_emails:
-        #     model_class = automated_email.model_class or Attendee
-        #     model_instances = session.query(model_class).filter(
-        #         not_(exists().where(and_(
-        #             Email.fk_id == model_class.id,
-        #             Email.automated_email_id == automated_email.id))
-        #         ),
-        #         *automated_email.query
-        #     ).options(*automated_email.query_options)
-        #
-        #     automated_email.unapproved_count = 0
-        #     for model_instance in model_instances:
-        #         if automated_email.would_send_if_approved(model_instance):
-        #             if automated_email.approved or not automated_email.needs_approval:
-        #                 automated_email.send_to(model_instance, delay=False)
-        #             else:
-        #                 automated_email.unapproved_count += 1
-        #
-        # return {e.ident: e.unapproved_count for e in active_automated_emails if e.unapproved_count > 0}
@@ -1,5 +1,6 @@
 from collections import defaultdict
 from datetime import datetime, timedelta
+from uuid import uuid4
 
 import stripe
 import time
@@ -10,14 +11,14 @@ from sqlalchemy.orm import joinedload
 
 from uber.config import c
 from uber.decorators import render
-from uber.models import ApiJob, Attendee, Email, Session, ReceiptTransaction
+from uber.models import ApiJob, Attendee, Email, Session, ReceiptTransaction, Tracking
 from uber.tasks.email import send_email
 from uber.tasks import celery
 from uber.utils import localized_now, TaskUtils
 from uber.payments import ReceiptManager
 
 
-__all__ = ['expire_processed_saml_assertions', 'update_shirt_counts']
+__all__ = ['expire_processed_saml_assertions', 'reconcile_badge_counts', 'update_shirt_counts', 'write_tracking']
 
 
 @celery.schedule(timedelta(minutes=30))
@@ -51,4 +52,90 @@ def update_shirt_counts():
         else:
             rsession.srem(c.REDIS_PREFIX + 'sold_out_shirt_sizes', shirt_enum_key)
 
-    rsession.execute()
\ No newline at end of file
+    rsession.execute()
+
+
+@celery.schedule(timedelta(minutes=5))
+def reconcile_badge_counts():
+    """
+    Recounts the badge counters behind c.BADGES_SOLD, c.ATTENDEE_BADGE_COUNT,
+    c.DEALER_APPS, and c.get_badge_count_by_type() from the database.  The
+    session listeners keep these up to date between runs, but they can drift
+    (e.g. changes made outside of our sessions, or group payments, which only
+    this task picks up), so this overwrites whatever is in Redis.
+    """
+    counts = {field: c.count_badge_counter(field) for field in c.BADGE_COUNTER_FIELDS}
+    c.REDIS_STORE.hset(c.BADGE_COUNTERS_KEY, mapping=counts)
+    return counts
+
+
+# How long, in seconds, a write_tracking run holds the queue lock without renewing it.  The
+# lock is renewed after every batch, so another run only takes over if this one stops.
+TRACKING_LOCK_TIMEOUT = 300
+
+# Lua scripts which renew and release a lock only if it's still held with our token,
+# so that a run which has lost its lock never renews or releases someone else's.
+_RENEW_LOCK = """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        return redis.call('EXPIRE', KEYS[1], ARGV[2])
+    end
+    return 0
+"""
+_RELEASE_LOCK = """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        return redis.call('DEL', KEYS[1])
+    end
+    return 0
+"""
+
+
+def _write_tracking_entries(entries):
+    trackings = []
+    for entry in entries:
+        try:
+            trackings.append(Tracking.from_entry(entry))
+        except Exception:
+            log.error('Unable to build tracking entry for {} {}', entry['model'], entry['fk_id'], exc_info=True)
+
+    with Session() as session:
+        session.bulk_insert(trackings)
+    return len(trackings)
+
+
+@celery.schedule(timedelta(seconds=10))
+def write_tracking():
+    """
+    Drains the tracking entries queued by Tracking.track when sessions commit,
+    writing each batch of c.TRACKING_BATCH_SIZE with a single bulk insert.
+
+    Only the worker holding the queue lock drains the queue.  Each batch is
+    moved onto a processing list for this run before it's written and only
+    removed once it has been, so if a run dies part way through, the next run
+    finds its processing list and writes those entries; bulk_insert skips any
+    rows which were already written.  If renewing the lock after a batch shows
+    that another run has taken over, we stop.
+    """
+    lock_key = c.REDIS_PREFIX + 'tracking_queue_lock'
+    token = uuid4().hex
+    if not c.REDIS_STORE.set(lock_key, token, nx=True, ex=TRACKING_LOCK_TIMEOUT):
+        return 0
+
+    processing_key = c.REDIS_PREFIX + 'tracking_processing:' + token
+    written = 0
+    try:
+        for orphaned_key in Tracking.processing_keys():
+            written += _write_tracking_entries(Tracking.processing_entries(orphaned_key))
+            Tracking.release_processing(orphaned_key)
+
+        while c.REDIS_STORE.eval(_RENEW_LOCK, 1, lock_key, token, TRACKING_LOCK_TIMEOUT):
+            entries = Tracking.claim_queue(processing_key, c.TRACKING_BATCH_SIZE)
+            if not entries:
+                return written
+
+            written += _write_tracking_entries(entries)
+            Tracking.release_processing(processing_key)
+
+        log.warning('Another write_tracking run took over the tracking queue, stopping after {} entries', written)
+        return written
+    finally:
+        c.REDIS_STORE.eval(_RELEASE_LOCK, 1, lock_key, token)
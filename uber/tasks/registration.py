@@ -15,6 +15,7 @@ from uber.config import c
 from uber.custom_tags import readable_join
 from uber.decorators import render
 from uber.models import ApiJob, Attendee, TerminalSettlement, Email, Session, ReceiptInfo, ReceiptTransaction
+from uber.push import terminal_status_changed
 from uber.tasks.email import send_email
 from uber.tasks import celery
 from uber.utils import localized_now, TaskUtils
@@ -34,32 +35,36 @@ def check_duplicate_registrations():
     then sets paid duplicates from "Completed" to "New" and sends an email to
     the registration email address. This allows us to see new duplicate
     attendees without repetitive emails.
+
+    If c.DUPLICATE_NAME_SIMILARITY is set, the email also lists attendees who
+    share an email address and have similar (but not identical) names.  These
+    are only reported, never changed.
     """
     if c.PRE_CON and (c.DEV_BOX or c.SEND_EMAILS):
         subject = c.EVENT_NAME + ' Duplicates Report for ' + localized_now().strftime('%Y-%m-%d')
         with Session() as session:
             if session.no_email(subject):
-                grouped = defaultdict(list)
-                for a in session.query(Attendee).filter(Attendee.first_name != '') \
-                        .filter(Attendee.badge_status == c.COMPLETED_STATUS).options(joinedload(Attendee.group)) \
-                        .order_by(Attendee.registered):
-                    if not a.group or (not a.group.is_dealer or a.group.status not in [c.WAITLISTED, c.UNAPPROVED]):
-                        grouped[a.full_name, a.email.lower()].append(a)
-
-                dupes = {k: v for k, v in grouped.items() if len(v) > 1}
-
-                for who, attendees in dupes.items():
+                dupes = []
+                for who, attendees in session.duplicate_registrations():
                     paid = [a for a in attendees if a.paid == c.HAS_PAID]
                     unpaid = [a for a in attendees if a.paid == c.NOT_PAID]
                     if len(paid) == 1 and len(attendees) == 1 + len(unpaid):
                         for a in unpaid:
                             session.delete(a)
-                        del dupes[who]
+                    else:
+                        dupes.append((who, attendees))
                     for a in paid:
                         a.badge_status = c.NEW_STATUS
 
-                if dupes and session.no_email(subject):
-                    body = render('emails/daily_checks/duplicates.html', {'dupes': sorted(dupes.items())}, encoding=None)
+                near_dupes = []
+                if c.DUPLICATE_NAME_SIMILARITY and not c.SQLALCHEMY_URL.startswith('sqlite'):
+                    near_dupes = list(session.near_duplicate_registrations(c.DUPLICATE_NAME_SIMILARITY))
+
+                if (dupes or near_dupes) and session.no_email(subject):
+                    body = render('emails/daily_checks/duplicates.html', {
+                        'dupes': sorted(dupes, key=lambda dupe: dupe[0]),
+                        'near_dupes': near_dupes,
+                    }, encoding=None)
                     send_email.delay(c.REPORTS_EMAIL, c.REGDESK_EMAIL, subject, body, format='html', model='n/a')
 
 
@@ -369,6 +374,7 @@ def process_terminal_sale(workstation_num, terminal_id, model_id=None, account_i
             payment_request.process_sale_response(session, response)
         else:
             c.REDIS_STORE.hset(c.REDIS_PREFIX + 'spin_terminal_txns:' + terminal_id, 'last_error', payment_request.error_message)
+            terminal_status_changed(terminal_id)
             txn_tracker.internal_error = payment_request.error_message
 
 
@@ -398,19 +404,52 @@ def check_missed_stripe_payments():
     return paid_ids
 
 
+def _import_in_batches(session, import_jobs, import_batch, noun):
+    jobs_by_target = defaultdict(list)
+    for job in import_jobs:
+        jobs_by_target[(job.target_server, job.api_token)].append(job)
+
+    jobs_processed = 0
+    for target_jobs in jobs_by_target.values():
+        for start in range(0, len(target_jobs), c.API_IMPORT_BATCH_SIZE):
+            batch = target_jobs[start:start + c.API_IMPORT_BATCH_SIZE]
+            batch_started = time.time()
+            completed = import_batch(batch)
+            session.commit()
+            jobs_processed += len(batch)
+
+            elapsed = time.time() - batch_started
+            log.info('Imported {} of {} {noun} from {} in {:.1f}s ({:.1f} {noun}/s), {} failed',
+                     completed, len(batch), batch[0].target_server, elapsed,
+                     completed / elapsed if elapsed else 0, len(batch) - completed, noun=noun)
+    return jobs_processed
+
+
 @celery.schedule(timedelta(minutes=30))
 def process_api_queue():
     known_job_names = ['attendee_account_import', 'attendee_import', 'group_import']
+    batched_imports = {
+        'attendee_import': (TaskUtils.attendee_import_batch, 'attendees'),
+        'group_import': (TaskUtils.group_import_batch, 'groups'),
+    }
     completed_jobs = {}
     safety_limit = 500
     jobs_processed = 0
 
     with Session() as session:
         for job_name in known_job_names:
-            jobs_to_run = session.query(ApiJob).filter(ApiJob.job_name == job_name, ApiJob.queued == None).limit(safety_limit)
+            jobs_to_run = session.query(ApiJob).filter(ApiJob.job_name == job_name, ApiJob.queued == None)
             completed_jobs[job_name] = 0
 
-            for job in jobs_to_run:
+            if job_name in batched_imports:
+                # These are imported in batches, so they have their own limit
+                import_batch, noun = batched_imports[job_name]
+                completed_jobs[job_name] = _import_in_batches(
+                    session, jobs_to_run.limit(c.API_IMPORT_BATCH_SIZE * c.API_IMPORT_BATCHES_PER_RUN),
+                    import_batch, noun)
+                continue
+
+            for job in jobs_to_run.limit(safety_limit):
                 getattr(TaskUtils, job_name)(job)
                 session.commit()
                 completed_jobs[job_name] += 1
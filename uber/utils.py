@@ -4,12 +4,15 @@ import os
 import random
 import re
 import string
+import threading
+import time
 import traceback
 from typing import Iterable
 import urllib
 from collections import defaultdict, OrderedDict
 from datetime import date, datetime, timedelta
 from glob import glob
+from itertools import chain, islice
 from os.path import basename
 from random import randrange
 from rpctools.jsonrpc import ServerProxy
@@ -1029,6 +1032,46 @@ class request_cached_context:
         threadlocal.clear()
 
 
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter. Tokens refill continuously at `rate`
+    per second up to `capacity`, and acquire() blocks until enough tokens are
+    available. This lets bursts through right away while holding the average
+    rate steady, which a fixed sleep after every call can't do.
+
+    example of how to use:
+    bucket = TokenBucket(rate=14)
+    for message in messages:
+        bucket.acquire()
+        send(message)
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def acquire(self, tokens=1):
+        # Requests larger than the bucket wait for a full bucket and then run it into
+        # debt, which later callers pay off, so the average rate still holds.
+        needed = min(tokens, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= needed:
+                    self._tokens -= tokens
+                    return
+                wait = (needed - self._tokens) / self.rate
+            time.sleep(wait)
+
+
 class ExcelWorksheetStreamWriter:
     """
     Wrapper for xlsxwriter which treats it more like a stream where we append rows to it
@@ -1042,6 +1085,10 @@ class ExcelWorksheetStreamWriter:
     Any cell starting with an '=' will be treated as a string, NOT a formula
     """
 
+    # Column widths are sized to fit the header and this many rows, so we
+    # don't need to hold the whole report in memory to lay out the sheet.
+    COLUMN_WIDTH_SAMPLE_SIZE = 500
+
     def __init__(self, workbook, worksheet):
         self.workbook = workbook
         self.worksheet = worksheet
@@ -1062,16 +1109,22 @@ class ExcelWorksheetStreamWriter:
             self.worksheet.set_column(i, i, width)
 
     def writerows(self, header_row, rows, header_format={'bold': True}):
-        rows = [list(map(str, row)) for row in rows]
+        """
+        Writes the header and then each row, which may come from a generator or
+        a yield_per() query; only the first COLUMN_WIDTH_SAMPLE_SIZE rows are
+        read ahead to work out the column widths.
+        """
+        rows = (list(map(str, row)) for row in rows)
+        sample = list(islice(rows, self.COLUMN_WIDTH_SAMPLE_SIZE))
 
         if header_row:
-            self.set_column_widths([header_row] + rows)
+            self.set_column_widths([header_row] + sample)
             if header_format:
                 header_format = self.workbook.add_format(header_format)
             self.writerow(header_row, header_format)
         else:
-            self.set_column_widths(rows)
-        for row in rows:
+            self.set_column_widths(sample)
+        for row in chain(sample, rows):
             self.writerow(row)
 
     def writerow(self, row_items, row_format=None):
@@ -1360,163 +1413,261 @@ class TaskUtils:
     Utility functions for use in celery tasks.
     """
     @staticmethod
-    def _guess_dept(session, id_name):
-        from uber.models import Department
-        from sqlalchemy import or_
+    def _add_import_errors(import_job, errors):
+        if errors:
+            import_job.errors += "; {}".format("; ".join(errors)) if import_job.errors else "; ".join(errors)
 
-        id, name = id_name
-        dept = session.query(Department).filter(or_(
-            Department.id == id,
-            Department.normalized_name == Department.normalize_name(name))).first()
+    @staticmethod
+    def _export_import_accounts(service, attendees):
+        """
+        Fetches the accounts of every exported attendee with a single
+        attendee_account.export call.  Returns the accounts keyed by their
+        remote ID, and the error from that call if it failed.
+        """
+        account_ids = set(id for attendee in attendees for id in attendee.get('attendee_account_ids', []))
+        if not account_ids:
+            return {}, ''
 
-        if dept:
-            return (id, dept)
-        return None
+        try:
+            return {account['id']: account for account in service.attendee_account.export(
+                ','.join(sorted(account_ids)), False).get('accounts', [])}, ''
+        except Exception as ex:
+            return {}, str(ex)
 
     @staticmethod
-    def attendee_import(import_job):
-        from uber.models import Attendee, AttendeeAccount, DeptMembership, DeptMembershipRequest
-        from functools import partial
+    def _attendee_import_lookups(session, remote_accounts, account_error=''):
+        """
+        Returns a function which finds the local department for an exported
+        (id, name) pair, and a function which returns the local account for an
+        exported account id.  Departments and existing accounts are each loaded
+        with one query, and an account shared by several imported attendees is
+        only created once.
+        """
+        from uber.models import AttendeeAccount, Department
+
+        departments = session.query(Department).all()
+        depts_by_id = {dept.id: dept for dept in departments}
+        depts_by_name = {dept.normalized_name: dept for dept in departments}
+
+        emails = set(normalize_email_legacy(account['email']) for account in remote_accounts.values())
+        accounts = {account.normalized_email: account for account in session.query(AttendeeAccount).filter(
+            AttendeeAccount.normalized_email.in_(emails))} if emails else {}
+
+        def guess_dept(id_name):
+            id, name = id_name
+            dept = depts_by_id.get(id) or depts_by_name.get(Department.normalize_name(name))
+            return (id, dept) if dept else None
+
+        def get_account(account_id):
+            if account_error:
+                raise Exception(account_error)
+            if account_id not in remote_accounts:
+                raise Exception("ERROR: We expected one account for this query, but got 0 instead.")
+
+            account_to_import = dict(remote_accounts[account_id])
+            email = normalize_email_legacy(account_to_import['email'])
+            if email not in accounts:
+                del account_to_import['id']
+                account = AttendeeAccount().apply(account_to_import, restricted=False)
+                account.email = normalize_email(account.email)
+                account.imported = True
+                accounts[email] = account
+            return accounts[email]
 
-        with uber.models.Session() as session:
-            service, message, target_url = get_api_service_from_server(import_job.target_server,
-                                                                       import_job.api_token)
+        return guess_dept, get_account
 
-            import_job.queued = datetime.now()
-            session.commit()
+    @staticmethod
+    def _imported_attendee(import_job, attendee, guess_dept, get_account):
+        """
+        Builds a new Attendee for an attendee_import job from the exported
+        attendee data, and returns it with a list of errors for any of its
+        accounts which couldn't be imported.
+        """
+        from uber.models import Attendee, DeptMembership, DeptMembershipRequest
 
-            errors = []
-            badge_type = int(import_job.json_data.get('badge_type', c.ATTENDEE_BADGE))
-            badge_status = int(import_job.json_data.get('badge_status', c.NEW_STATUS))
-            extra_admin_notes = import_job.json_data.get('admin_notes', '')
+        attendee = dict(attendee)
+        badge_type = int(import_job.json_data.get('badge_type', c.ATTENDEE_BADGE))
+        badge_status = int(import_job.json_data.get('badge_status', c.NEW_STATUS))
+        extra_admin_notes = import_job.json_data.get('admin_notes', '')
+        badge_label = c.BADGES[badge_type].lower()
 
-            if badge_type not in c.BADGES:
-                errors.append("ERROR: Attendee badge type not recognized: " + str(badge_type))
+        if badge_type == c.STAFF_BADGE:
+            paid = c.NEED_NOT_PAY
+        else:
+            paid = c.NOT_PAID
 
-            try:
-                results = service.attendee.export(import_job.query, True)
-            except Exception as ex:
-                errors.append(str(ex))
-            else:
-                num_attendees = len(results.get('attendees', []))
-                if num_attendees != 1:
-                    errors.append("ERROR: We expected one attendee for this query, but got " + str(num_attendees) + " instead.")
-            
-            if errors:
-                import_job.errors += "; {}".format("; ".join(errors)) if import_job.errors else "; ".join(errors)
-                session.commit()
-                return
-            
-            attendee = results.get('attendees', [])[0]
-            badge_label = c.BADGES[badge_type].lower()
+        import_from_url = '{}/registration/form?id={}\n\n'.format(import_job.target_server, attendee['id'])
+        new_admin_notes = '{}\n\n'.format(extra_admin_notes) if extra_admin_notes else ''
+        old_admin_notes = 'Old Admin Notes:\n{}\n'.format(attendee['admin_notes']) if attendee['admin_notes'] else ''
 
-            if badge_type == c.STAFF_BADGE:
-                paid = c.NEED_NOT_PAY
-            else:
-                paid = c.NOT_PAID
-        
-            import_from_url = '{}/registration/form?id={}\n\n'.format(import_job.target_server, attendee['id'])
-            new_admin_notes = '{}\n\n'.format(extra_admin_notes) if extra_admin_notes else ''
-            old_admin_notes = 'Old Admin Notes:\n{}\n'.format(attendee['admin_notes']) if attendee['admin_notes'] else ''
+        attendee.update({
+            'badge_type': badge_type,
+            'badge_status': badge_status,
+            'paid': paid,
+            'placeholder': True,
+            'admin_notes': 'Imported {} from {}{}{}'.format(
+                badge_label, import_from_url, new_admin_notes, old_admin_notes),
+            'past_years': attendee['all_years'],
+        })
+        if attendee['shirt'] not in c.SHIRT_OPTS:
+            del attendee['shirt']
+
+        del attendee['id']
+        del attendee['all_years']
+        del attendee['badge_num']
+
+        account_ids = attendee.get('attendee_account_ids', [])
+
+        if badge_type != c.STAFF_BADGE:
+            attendee = Attendee().apply(attendee, restricted=False)
+        else:
+            assigned_depts = {attendee[0]:
+                              attendee[1] for attendee in map(guess_dept, attendee.pop('assigned_depts', {}).items())
+                              if attendee}
+            checklist_admin_depts = attendee.pop('checklist_admin_depts', {})
+            dept_head_depts = attendee.pop('dept_head_depts', {})
+            poc_depts = attendee.pop('poc_depts', {})
+            requested_depts = dict(attendee.pop('requested_depts', {}))
 
             attendee.update({
-                'badge_type': badge_type,
-                'badge_status': badge_status,
-                'paid': paid,
-                'placeholder': True,
-                'admin_notes': 'Imported {} from {}{}{}'.format(
-                    badge_label, import_from_url, new_admin_notes, old_admin_notes),
-                'past_years': attendee['all_years'],
+                'staffing': True,
+                'ribbon': str(c.DEPT_HEAD_RIBBON) if dept_head_depts else '',
             })
-            if attendee['shirt'] not in c.SHIRT_OPTS:
-                del attendee['shirt']
-                
-            del attendee['id']
-            del attendee['all_years']
-            del attendee['badge_num']
-
-            account_ids = attendee.get('attendee_account_ids', [])
 
-            if badge_type != c.STAFF_BADGE:
-                attendee = Attendee().apply(attendee, restricted=False)
-            else:
-                assigned_depts = {attendee[0]: 
-                                  attendee[1] for attendee in map(partial(TaskUtils._guess_dept, session),
-                                  attendee.pop('assigned_depts', {}).items()) if attendee}
-                checklist_admin_depts = attendee.pop('checklist_admin_depts', {})
-                dept_head_depts = attendee.pop('dept_head_depts', {})
-                poc_depts = attendee.pop('poc_depts', {})
-                requested_depts = attendee.pop('requested_depts', {})
-
-                attendee.update({
-                    'staffing': True,
-                    'ribbon': str(c.DEPT_HEAD_RIBBON) if dept_head_depts else '',
-                })
-
-                attendee = Attendee().apply(attendee, restricted=False)
-
-                for id, dept in assigned_depts.items():
-                    attendee.dept_memberships.append(DeptMembership(
-                        department=dept,
-                        attendee=attendee,
-                        is_checklist_admin=bool(id in checklist_admin_depts),
-                        is_dept_head=bool(id in dept_head_depts),
-                        is_poc=bool(id in poc_depts),
-                    ))
-
-                requested_anywhere = requested_depts.pop('All', False)
-                requested_depts = {d[0]: d[1] for d in map(partial(TaskUtils._guess_dept, session), requested_depts.items()) if d}
-
-                if requested_anywhere:
-                    attendee.dept_membership_requests.append(DeptMembershipRequest(attendee=attendee))
-                for id, dept in requested_depts.items():
-                    attendee.dept_membership_requests.append(DeptMembershipRequest(
-                        department=dept,
-                        attendee=attendee,
-                    ))
-
-            session.add(attendee)
-
-            for id in account_ids:
-                try:
-                    account_to_import = TaskUtils.get_attendee_account_by_id(id, service)
-                except Exception as ex:
-                    import_job.errors += "; {}".format("; ".join(str(ex))) if import_job.errors else "; ".join(str(ex))
+            attendee = Attendee().apply(attendee, restricted=False)
+
+            for id, dept in assigned_depts.items():
+                attendee.dept_memberships.append(DeptMembership(
+                    department=dept,
+                    attendee=attendee,
+                    is_checklist_admin=bool(id in checklist_admin_depts),
+                    is_dept_head=bool(id in dept_head_depts),
+                    is_poc=bool(id in poc_depts),
+                ))
+
+            requested_anywhere = requested_depts.pop('All', False)
+            requested_depts = {d[0]: d[1] for d in map(guess_dept, requested_depts.items()) if d}
+
+            if requested_anywhere:
+                attendee.dept_membership_requests.append(DeptMembershipRequest(attendee=attendee))
+            for id, dept in requested_depts.items():
+                attendee.dept_membership_requests.append(DeptMembershipRequest(
+                    department=dept,
+                    attendee=attendee,
+                ))
+
+        errors = []
+        for id in account_ids:
+            try:
+                attendee.managers.append(get_account(id))
+            except Exception as ex:
+                errors.append(str(ex))
+        return attendee, errors
 
-                account = session.query(AttendeeAccount).filter(AttendeeAccount.normalized_email == normalize_email_legacy(account_to_import['email'])).first()
-                if not account:
-                    del account_to_import['id']
-                    account = AttendeeAccount().apply(account_to_import, restricted=False)
-                    account.email = normalize_email(account.email)
-                    account.imported = True
-                    session.add(account)
-                attendee.managers.append(account)
+    @staticmethod
+    def _save_imported_attendee(session, import_job, attendee, guess_dept, get_account):
+        from sqlalchemy.exc import IntegrityError
+        from psycopg2.errors import UniqueViolation
 
-            from sqlalchemy.exc import IntegrityError
-            from psycopg2.errors import UniqueViolation
+        new_attendee, errors = TaskUtils._imported_attendee(import_job, attendee, guess_dept, get_account)
+        TaskUtils._add_import_errors(import_job, errors)
+        session.add(new_attendee)
 
+        try:
+            session.commit()
+        except IntegrityError as e:
+            session.rollback()
+            if not isinstance(e.orig, UniqueViolation):
+                TaskUtils._add_import_errors(import_job, [str(e)])
+                return False
+
+            new_attendee.badge_num = None
+            session.add(new_attendee)
             try:
                 session.commit()
-            except IntegrityError as e:
+            except Exception as e:
                 session.rollback()
-                if(isinstance(e.orig, UniqueViolation)):
-                    attendee.badge_num = None
-                    session.add(attendee)
-                    try:
-                        session.commit()
-                    except Exception as e:
-                        session.rollback()
-                        import_job.errors += "; {}".format(str(ex)) if import_job.errors else str(e)
+                TaskUtils._add_import_errors(import_job, [str(e)])
+                return False
+        except Exception as e:
+            session.rollback()
+            TaskUtils._add_import_errors(import_job, [str(e)])
+            return False
+
+        import_job.completed = datetime.now()
+        return True
+
+    @staticmethod
+    def attendee_import(import_job):
+        TaskUtils.attendee_import_batch([import_job])
+
+    @staticmethod
+    def attendee_import_batch(import_jobs):
+        """
+        Imports a batch of attendee_import jobs which share a target server
+        and API token.  The attendees are fetched with a single attendee.export
+        call and their accounts with a single attendee_account.export call, and
+        they're all saved in one transaction.  If that fails, each attendee is
+        retried in its own transaction so that one bad record only fails its
+        own job.  Errors are recorded on each job, and the number of completed
+        jobs is returned.
+        """
+        with uber.models.Session() as session:
+            service, message, target_url = get_api_service_from_server(import_jobs[0].target_server,
+                                                                       import_jobs[0].api_token)
+
+            jobs = []
+            for import_job in import_jobs:
+                import_job.queued = datetime.now()
+                badge_type = int(import_job.json_data.get('badge_type', c.ATTENDEE_BADGE))
+                if badge_type not in c.BADGES:
+                    TaskUtils._add_import_errors(
+                        import_job, ["ERROR: Attendee badge type not recognized: " + str(badge_type)])
                 else:
-                    session.rollback()
-                    import_job.errors += "; {}".format(str(ex)) if import_job.errors else str(e)
-            except Exception as e:
+                    jobs.append(import_job)
+
+            if not jobs:
+                return 0
+
+            try:
+                results = service.attendee.export(','.join(job.query for job in jobs), True)
+            except Exception as ex:
+                for job in jobs:
+                    TaskUtils._add_import_errors(job, [str(ex)])
+                return 0
+
+            exported = {attendee['id']: attendee for attendee in results.get('attendees', [])}
+            found = []
+            for job in jobs:
+                if job.query.strip() in exported:
+                    found.append((job, exported[job.query.strip()]))
+                else:
+                    TaskUtils._add_import_errors(
+                        job, ["ERROR: We expected one attendee for this query, but got 0 instead."])
+
+            remote_accounts, account_error = TaskUtils._export_import_accounts(
+                service, [attendee for job, attendee in found])
+            guess_dept, get_account = TaskUtils._attendee_import_lookups(session, remote_accounts, account_error)
+            account_errors = []
+            for job, attendee in found:
+                new_attendee, errors = TaskUtils._imported_attendee(job, attendee, guess_dept, get_account)
+                session.add(new_attendee)
+                account_errors.append(errors)
+
+            try:
+                session.commit()
+            except Exception as ex:
                 session.rollback()
-                import_job.errors += "; {}".format(str(ex)) if import_job.errors else str(e)
-            else:
-                import_job.completed = datetime.now()
-            session.commit()
-    
+                log.warning('Unable to import {} attendees from {} at once, importing them one at a time: {}',
+                            len(found), target_url, ex)
+                return sum(TaskUtils._save_imported_attendee(session, job, attendee, guess_dept, get_account)
+                           for job, attendee in found)
+
+            for (job, attendee), errors in zip(found, account_errors):
+                TaskUtils._add_import_errors(job, errors)
+                job.completed = datetime.now()
+            return len(found)
+
     @staticmethod
     def get_attendee_account_by_id(account_id, service):
         from uber.models import AttendeeAccount
@@ -1630,97 +1781,160 @@ class TaskUtils:
                 session.commit()
 
     @staticmethod
-    def group_import(import_job):
-        # Import groups, then their attendees, then those attendee's accounts
-
-        from uber.models import Attendee, AttendeeAccount, Group
-
-        with uber.models.Session() as session:
-            service, message, target_url = get_api_service_from_server(import_job.target_server,
-                                                                       import_job.api_token)
+    def _imported_group(group_to_import):
+        """
+        Builds a new Group for a group_import job from the exported group data.
+        """
+        from uber.models import Group
 
-            import_job.queued = datetime.now()
-            session.commit()
+        # Remove categories that don't exist this year
+        current_categories = group_to_import.get('categories', '')
+        if current_categories:
+            group_to_import['categories'] = ','.join(
+                category for category in current_categories.split(',') if int(category) in c.DEALER_WARES.keys())
 
-            errors = []
+        group_to_import['status'] = c.IMPORTED
+        return Group().apply(group_to_import, restricted=False)
 
+    @staticmethod
+    def _imported_group_member(new_group, attendee, group_leader_id, get_account):
+        """
+        Builds a new Attendee in a newly imported group from the exported
+        attendee data, and returns it with a list of errors for any of its
+        accounts which couldn't be imported.
+        """
+        is_leader = attendee['id'] == group_leader_id
+        account_ids = attendee.get('attendee_account_ids', [])
+        new_attendee = TaskUtils.basic_attendee_import(dict(attendee))
+        if not new_attendee.paid == c.PAID_BY_GROUP:
+            new_attendee.paid = c.NOT_PAID
+        new_attendee.group = new_group
+        if is_leader:
+            new_group.leader = new_attendee
+
+        errors = []
+        for id in account_ids:
             try:
-                results = service.group.export(import_job.query, import_job.json_data.get('all', True))
+                new_attendee.managers.append(get_account(id))
             except Exception as ex:
                 errors.append(str(ex))
-            else:
-                num_groups = len(results.get('groups', []))
-                if num_groups != 1:
-                    errors.append("ERROR: We expected one group for this query, but got " + str(num_groups) + " instead.")
-            
-            if errors:
-                import_job.errors += "; {}".format("; ".join(errors)) if import_job.errors else "; ".join(errors)
-                session.commit()
-                return
-            
-            group_to_import = results.get('groups', [])[0]
-            group_attendees = {}
+        return new_attendee, errors
 
-            try:
-                group_results = service.group.export_attendees(group_to_import['id'], True)
-                group_attendees = group_results['attendees']
-            except Exception as ex:
-                attendee_warning = "Could not import attendees: {}".format(str(ex))
-                import_job.errors += "; {}".format(attendee_warning) if import_job.errors else attendee_warning
-
-            # Remove categories that don't exist this year
-            current_categories = group_to_import.get('categories', '')
-            if current_categories:
-                current_categories = current_categories.split(',')
-                for category in current_categories:
-                    if int(category) not in c.DEALER_WARES.keys():
-                        current_categories.remove(category)
-                group_to_import['categories'] = ','.join(current_categories)
-
-            group_to_import['status'] = c.IMPORTED
-
-            new_group = Group().apply(group_to_import, restricted=False)
-            session.add(new_group)
+    @staticmethod
+    def _save_imported_group(session, import_job, group_to_import, members, get_account):
+        """
+        Saves one imported group, then each of its attendees, in their own
+        transactions, so that an attendee who can't be saved doesn't stop the
+        rest of the group from being imported.
+        """
+        new_group = TaskUtils._imported_group(dict(group_to_import))
+        session.add(new_group)
+        try:
+            session.commit()
+        except Exception as ex:
+            session.rollback()
+            TaskUtils._add_import_errors(import_job, [str(ex)])
+            return False
+
+        import_job.completed = datetime.now()
+        for attendee in members['attendees']:
+            new_attendee, errors = TaskUtils._imported_group_member(
+                new_group, attendee, members['group_leader_id'], get_account)
+            TaskUtils._add_import_errors(import_job, errors)
+            session.add(new_attendee)
             try:
                 session.commit()
             except Exception as ex:
                 session.rollback()
-                import_job.errors += "; {}".format(str(ex)) if import_job.errors else str(ex)
-                return
-            else:
-                import_job.completed = datetime.now()
+                TaskUtils._add_import_errors(import_job, [str(ex)])
 
-            for attendee in group_attendees:
-                is_leader = attendee['id'] == group_results['group_leader_id']
-                new_attendee = TaskUtils.basic_attendee_import(attendee)
-                if not new_attendee.paid == c.PAID_BY_GROUP:
-                    new_attendee.paid = c.NOT_PAID
-                new_attendee.group = new_group
-                if is_leader:
-                    new_group.leader = new_attendee
-                
-                for id in attendee.get('attendee_account_ids', ''):
-                    try:
-                        account_to_import = TaskUtils.get_attendee_account_by_id(id, service)
-                    except Exception as ex:
-                        import_job.errors += "; {}".format("; ".join(str(ex))) if import_job.errors else "; ".join(str(ex))
-
-                    account = session.query(AttendeeAccount).filter(AttendeeAccount.normalized_email == normalize_email_legacy(account_to_import['email'])).first()
-                    if not account:
-                        del account_to_import['id']
-                        account = AttendeeAccount().apply(account_to_import, restricted=False)
-                        account.email = normalize_email(account.email)
-                        account.imported = True
-                        session.add(account)
-                    new_attendee.managers.append(account)
+        session.assign_badges(new_group, group_to_import['badges'], members['unassigned_badge_type'],
+                              members['unassigned_ribbon'])
+        session.commit()
+        return True
 
-                session.add(new_attendee)
+    @staticmethod
+    def group_import(import_job):
+        TaskUtils.group_import_batch([import_job])
 
+    @staticmethod
+    def group_import_batch(import_jobs):
+        """
+        Imports a batch of group_import jobs which share a target server and
+        API token.  The groups are fetched with a single group.export call and
+        all of their attendees' accounts with a single attendee_account.export
+        call; group.export_attendees only takes one group, so it's still called
+        once per group.  Everything is saved in one transaction, and if that
+        fails, each group is retried on its own.  Errors are recorded on each
+        job, and the number of completed jobs is returned.
+        """
+        with uber.models.Session() as session:
+            service, message, target_url = get_api_service_from_server(import_jobs[0].target_server,
+                                                                       import_jobs[0].api_token)
+
+            jobs_by_full = defaultdict(list)
+            for import_job in import_jobs:
+                import_job.queued = datetime.now()
+                jobs_by_full[bool(import_job.json_data.get('all', True))].append(import_job)
+
+            found = []
+            for full, jobs in jobs_by_full.items():
                 try:
-                    session.commit()
+                    results = service.group.export(','.join(job.query for job in jobs), full)
                 except Exception as ex:
-                    import_job.errors += "; {}".format(str(ex)) if import_job.errors else str(ex)
-                    session.rollback()
+                    for job in jobs:
+                        TaskUtils._add_import_errors(job, [str(ex)])
+                    continue
+
+                exported = {group['id']: group for group in results.get('groups', [])}
+                for job in jobs:
+                    if job.query.strip() in exported:
+                        found.append((job, exported[job.query.strip()]))
+                    else:
+                        TaskUtils._add_import_errors(
+                            job, ["ERROR: We expected one group for this query, but got 0 instead."])
+
+            if not found:
+                return 0
+
+            imports = []
+            for job, group_to_import in found:
+                try:
+                    members = service.group.export_attendees(group_to_import['id'], True)
+                except Exception as ex:
+                    TaskUtils._add_import_errors(job, ["Could not import attendees: {}".format(str(ex))])
+                    members = {'attendees': [], 'group_leader_id': None,
+                               'unassigned_badge_type': c.ATTENDEE_BADGE, 'unassigned_ribbon': None}
+                imports.append((job, group_to_import, members))
+
+            remote_accounts, account_error = TaskUtils._export_import_accounts(
+                service, [attendee for _, _, members in imports for attendee in members['attendees']])
+            _, get_account = TaskUtils._attendee_import_lookups(session, remote_accounts, account_error)
+
+            account_errors = []
+            for job, group_to_import, members in imports:
+                new_group = TaskUtils._imported_group(dict(group_to_import))
+                session.add(new_group)
+                errors = []
+                for attendee in members['attendees']:
+                    new_attendee, attendee_errors = TaskUtils._imported_group_member(
+                        new_group, attendee, members['group_leader_id'], get_account)
+                    session.add(new_attendee)
+                    errors.extend(attendee_errors)
+                session.assign_badges(new_group, group_to_import['badges'], members['unassigned_badge_type'],
+                                      members['unassigned_ribbon'])
+                account_errors.append(errors)
 
-            session.assign_badges(new_group, group_to_import['badges'], group_results['unassigned_badge_type'], group_results['unassigned_ribbon'])
-            session.commit()
+            try:
+                session.commit()
+            except Exception as ex:
+                session.rollback()
+                log.warning('Unable to import {} groups from {} at once, importing them one at a time: {}',
+                            len(imports), target_url, ex)
+                return sum(TaskUtils._save_imported_group(session, job, group_to_import, members, get_account)
+                           for job, group_to_import, members in imports)
+
+            for (job, _, _), errors in zip(imports, account_errors):
+                TaskUtils._add_import_errors(job, errors)
+                job.completed = datetime.now()
+            return len(imports)
@@ -0,0 +1,189 @@
+"""
+An in-memory index of watchlist entries, keyed by normalized first name, last
+name, email, and date of birth, so that checking an attendee against the
+watchlist is a few dict lookups instead of a new session and a query.
+
+Each process builds its index from the watch_list table on first use.  A
+session which changes a WatchList throws away this process's index when it
+commits, and bumps a version number in Redis so that other processes rebuild
+theirs the next time they check it.
+"""
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime
+
+import redis
+import six
+from dateutil import parser as dateparser
+from pockets.autolog import log
+
+from uber.config import c
+
+__all__ = ['WatchlistIndex', 'watchlist_index', 'invalidate_watchlist_index', 'normalized_birthdate']
+
+
+def _normalized(value):
+    return (value or '').strip().lower()
+
+
+def normalized_birthdate(birthdate):
+    """
+    Returns a birthdate as a date, or None if there isn't one.  Because this
+    could be run while in the middle of creating an attendee, the birthdate
+    might still be a string or a datetime.
+    """
+    if not birthdate:
+        return None
+    if isinstance(birthdate, six.string_types):
+        try:
+            return dateparser.parse(birthdate).date()
+        except Exception:
+            log.debug('Error parsing attendee birthdate: {}'.format(birthdate))
+            return None
+    if isinstance(birthdate, datetime):
+        return birthdate.date()
+    if isinstance(birthdate, date):
+        return birthdate
+    return None
+
+
+class WatchlistIndex:
+    """
+    Maps each normalized first name, last name, email, and birthdate to the
+    ids of the watchlist entries which have it.  An entry matches an attendee
+    if both of the following are true:
+        a) one of the entry's first names or its last name matches the attendee's
+        b) the entry's email address or date of birth matches the attendee's
+    """
+    def __init__(self, entries):
+        self.entries = {}
+        self.active = {}
+        self._by_first_name = defaultdict(set)
+        self._by_last_name = defaultdict(set)
+        self._by_email = defaultdict(set)
+        self._by_birthdate = defaultdict(set)
+
+        for entry in entries:
+            self.entries[entry.id] = entry.to_dict()
+            self.active[entry.id] = entry.active
+            for first_name in filter(None, map(_normalized, (entry.first_names or '').split(','))):
+                self._by_first_name[first_name].add(entry.id)
+            for key, index in [(_normalized(entry.last_name), self._by_last_name),
+                               (_normalized(entry.email), self._by_email),
+                               (normalized_birthdate(entry.birthdate), self._by_birthdate)]:
+                if key:
+                    index[key].add(entry.id)
+
+    @classmethod
+    def load(cls):
+        from uber.models import Session, WatchList
+        with Session() as session:
+            return cls(session.query(WatchList).all())
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def first_names(self):
+        return set(self._by_first_name)
+
+    @property
+    def last_names(self):
+        return set(self._by_last_name)
+
+    def match(self, first_name, last_name, email, birthdate, active=True):
+        """
+        Returns the ids of the entries which match the given attendee details,
+        considering only active (or only inactive) entries.
+        """
+        empty = frozenset()
+        names = self._by_first_name.get(_normalized(first_name), empty) \
+            | self._by_last_name.get(_normalized(last_name), empty)
+        if not names:
+            return []
+
+        contacts = self._by_email.get(_normalized(email), empty) \
+            | self._by_birthdate.get(normalized_birthdate(birthdate), empty)
+        return sorted(entry_id for entry_id in names & contacts if self.active[entry_id] == active)
+
+    def match_attendee(self, attendee, active=True):
+        return self.match(attendee.first_name, attendee.last_name, attendee.email, attendee.birthdate, active)
+
+    def match_all(self, rows, active=True):
+        """
+        Takes (id, first_name, last_name, email, birthdate) rows for any
+        number of attendees and returns a dict mapping each watchlist entry id
+        to the ids of the attendees who match it.
+        """
+        matches = defaultdict(list)
+        for attendee_id, first_name, last_name, email, birthdate in rows:
+            for entry_id in self.match(first_name, last_name, email, birthdate, active):
+                matches[entry_id].append(attendee_id)
+        return matches
+
+
+# How often, in seconds, a process checks Redis for watchlist changes made by other processes.
+VERSION_CHECK_INTERVAL = 5
+
+_watchlist_index = None
+_watchlist_index_version = None
+_watchlist_index_checked = 0
+_watchlist_index_generation = 0
+_watchlist_index_lock = threading.Lock()
+
+
+def _version_key():
+    return c.REDIS_PREFIX + 'watchlist_version'
+
+
+def _shared_version():
+    try:
+        return c.REDIS_STORE.get(_version_key())
+    except redis.exceptions.RedisError as e:
+        log.warning('Unable to read the watchlist index version: {}', e)
+        return None
+
+
+def watchlist_index():
+    """
+    Returns this process's WatchlistIndex, building it on first use and
+    rebuilding it if another process has changed the watchlist since.  If
+    Redis is unavailable, we rebuild every VERSION_CHECK_INTERVAL seconds.
+    """
+    global _watchlist_index, _watchlist_index_version, _watchlist_index_checked
+    if _watchlist_index is not None and time.time() - _watchlist_index_checked < VERSION_CHECK_INTERVAL:
+        return _watchlist_index
+
+    with _watchlist_index_lock:
+        if _watchlist_index is not None and time.time() - _watchlist_index_checked < VERSION_CHECK_INTERVAL:
+            return _watchlist_index
+
+        version = _shared_version()
+        if _watchlist_index is None or version is None or version != _watchlist_index_version:
+            generation = _watchlist_index_generation
+            index = WatchlistIndex.load()
+            if generation != _watchlist_index_generation:
+                # The watchlist changed while we were reading it, so use what we
+                # read for this call but check again on the next one.
+                return index
+            _watchlist_index, _watchlist_index_version = index, version
+        _watchlist_index_checked = time.time()
+        return _watchlist_index
+
+
+def invalidate_watchlist_index(model_names=None):
+    """
+    Throws away every process's watchlist index if any of the given model
+    names is WatchList, or unconditionally if no model names are given.
+    """
+    global _watchlist_index, _watchlist_index_generation
+    if model_names is not None and 'WatchList' not in model_names:
+        return
+
+    _watchlist_index_generation += 1
+    _watchlist_index = None
+    try:
+        c.REDIS_STORE.incr(_version_key())
+    except redis.exceptions.RedisError as e:
+        log.warning('Unable to invalidate the watchlist index in other processes: {}', e)
@@ -0,0 +1,116 @@
+"""
+A compact, in-memory index of US zip codes for the attendee map and the
+reports which need a city or state for a zip code.
+
+This is built once per process from the SQLite database which uszipcode
+downloads into c.MAPS_DIR, so lookups are a dict hit instead of a new
+uszipcode.SearchEngine (and a new SQLite connection) per zip code.
+"""
+import math
+import os
+import sqlite3
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+from pockets.autolog import log
+
+from uber.config import c
+
+__all__ = ['ZipcodeIndex', 'ZipcodeInfo', 'zipcode_index']
+
+
+ZipcodeInfo = namedtuple('ZipcodeInfo', ['zipcode', 'lat', 'lng', 'city', 'state'])
+
+
+class ZipcodeIndex:
+    """
+    Zip codes sorted by latitude, with their coordinates in parallel arrays of
+    doubles and their cities and states in parallel lists.  Radius searches
+    bisect the latitude array down to a band around the center, then check the
+    longitude window and great-circle distance of only the zips in that band.
+    """
+    DB_FILENAME = 'simple_db.sqlite'
+    EARTH_RADIUS_MILES = 3958.8
+
+    def __init__(self, rows):
+        rows = sorted((row for row in rows if row[1] is not None and row[2] is not None), key=lambda row: row[1])
+        self.zipcodes = [str(row[0]) for row in rows]
+        self.lats = array('d', (row[1] for row in rows))
+        self.lngs = array('d', (row[2] for row in rows))
+        self.cities = [row[3] or '' for row in rows]
+        self.states = [row[4] or '' for row in rows]
+        self._positions = {zipcode: i for i, zipcode in enumerate(self.zipcodes)}
+
+    @classmethod
+    def from_sqlite(cls, path):
+        conn = sqlite3.connect('file:{}?mode=ro'.format(path), uri=True)
+        try:
+            return cls(conn.execute('SELECT zipcode, lat, lng, major_city, state FROM simple_zipcode'))
+        finally:
+            conn.close()
+
+    def __len__(self):
+        return len(self.zipcodes)
+
+    def _info(self, i):
+        return ZipcodeInfo(self.zipcodes[i], self.lats[i], self.lngs[i], self.cities[i], self.states[i])
+
+    def get(self, zipcode):
+        """
+        Returns the ZipcodeInfo for a zip code (or a ZIP+4 code), or None if
+        we don't know it.
+        """
+        i = self._positions.get(str(zipcode or '').strip()[:5])
+        return None if i is None else self._info(i)
+
+    def states_by_zipcode(self):
+        return dict(zip(self.zipcodes, self.states))
+
+    def within(self, lat, lng, radius):
+        """
+        Returns (ZipcodeInfo, miles) for every zip code within `radius` miles
+        of the given coordinates, nearest first.
+        """
+        lat_delta = math.degrees(radius / self.EARTH_RADIUS_MILES)
+        cos_lat = math.cos(math.radians(lat))
+        lng_delta = 180 if cos_lat < 1e-6 else min(180, lat_delta / cos_lat)
+
+        lat1, lng1 = math.radians(lat), math.radians(lng)
+        lngs, lats = self.lngs, self.lats
+        results = []
+        for i in range(bisect_left(lats, lat - lat_delta), bisect_right(lats, lat + lat_delta)):
+            if abs((lngs[i] - lng + 180) % 360 - 180) > lng_delta:
+                continue
+            lat2, lng2 = math.radians(lats[i]), math.radians(lngs[i])
+            a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+            miles = 2 * self.EARTH_RADIUS_MILES * math.asin(min(1, math.sqrt(a)))
+            if miles <= radius:
+                results.append((miles, i))
+        return [(self._info(i), miles) for miles, i in sorted(results)]
+
+
+_zipcode_index = None
+_zipcode_index_lock = threading.Lock()
+
+
+def zipcode_index():
+    """
+    Returns this process's ZipcodeIndex, building it on first use, or None if
+    the zip code database in c.MAPS_DIR can't be read.
+    """
+    global _zipcode_index
+    if _zipcode_index is None:
+        with _zipcode_index_lock:
+            if _zipcode_index is None:
+                path = os.path.join(c.MAPS_DIR, ZipcodeIndex.DB_FILENAME)
+                try:
+                    if not os.path.exists(path):
+                        from uszipcode import SearchEngine
+                        SearchEngine(db_file_dir=c.MAPS_DIR)  # downloads the database on first use
+                    _zipcode_index = ZipcodeIndex.from_sqlite(path)
+                except Exception:
+                    log.error('Unable to load the zip code database from {}', path, exc_info=True)
+                    return None
+    return _zipcode_index